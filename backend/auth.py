@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import anyio
+
+# --- CONFIGURATION ---
+# Verified tokens kept in memory per worker
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+# Longest a cached user row is trusted before it is re-read, even if the
+# token lives longer (role or profile changes show up within this window)
+AUTH_USER_TTL = int(os.getenv("AUTH_USER_TTL", "300"))
+# "memory" keeps revocations in this process; a redis:// URL shares them
+# between workers. Defaults to the response cache's server.
+REVOCATION_URL = os.getenv("REVOCATION_URL", os.getenv("CACHE_URL", "memory"))
+# Seconds between pulls of revocations made by other workers
+REVOCATION_SYNC_INTERVAL = float(os.getenv("REVOCATION_SYNC_INTERVAL", "2"))
+REVOCATION_KEY = os.getenv("CACHE_PREFIX", "hs:") + "revoked"
+
+
+def token_id(claims: dict, token: str) -> str:
+    """The token's `jti`, or a digest of the token for ones issued without one."""
+    return claims.get("jti") or hashlib.sha256(token.encode()).hexdigest()
+
+
+class CachedToken:
+    __slots__ = ("jti", "claims", "user", "expires_at")
+
+    def __init__(self, jti: str, claims: dict, user: dict, expires_at: float):
+        self.jti = jti
+        self.claims = claims
+        self.user = user
+        self.expires_at = expires_at
+
+
+class TokenCache:
+    """Bounded LRU of verified tokens: decoded claims plus the user row.
+
+    An entry expires with its token (or after AUTH_USER_TTL), so a hit skips
+    both the signature check and the user lookup.
+    """
+
+    def __init__(self, max_entries: int = AUTH_CACHE_SIZE, user_ttl: int = AUTH_USER_TTL):
+        self.max_entries = max_entries
+        self.user_ttl = user_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[CachedToken]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry.expires_at <= time.time():
+                if entry is not None:
+                    del self._entries[token]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return entry
+
+    def put(self, token: str, claims: dict, user: dict) -> CachedToken:
+        expires_at = min(float(claims.get("exp", 0)), time.time() + self.user_ttl)
+        entry = CachedToken(token_id(claims, token), claims, user, expires_at)
+        with self._lock:
+            self._entries[token] = entry
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def discard(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# --- REVOCATION ---
+class RevocationList:
+    """Revoked token ids, each kept until its token would have expired anyway.
+
+    Checks only touch the local dict. With a Redis URL, revocations are also
+    written to a sorted set (score = expiry) and every worker pulls it from a
+    background task (`monitor`) each REVOCATION_SYNC_INTERVAL, so a logout
+    reaches other workers within that interval and no request waits on Redis.
+    """
+
+    def __init__(self, url: str = REVOCATION_URL, sync_interval: float = REVOCATION_SYNC_INTERVAL):
+        self._revoked = {}
+        self._lock = threading.Lock()
+        self._client = None
+        self._sync_interval = sync_interval
+        self.sync_failures = 0
+        if url.startswith(("redis://", "rediss://", "unix://")):
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("REVOCATION_URL points at Redis but the 'redis' package is not installed")
+            self._client = redis.Redis.from_url(url)
+
+    def revoke(self, jti: str, expires_at: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._revoked = {j: exp for j, exp in self._revoked.items() if exp > now}
+            self._revoked[jti] = expires_at
+        if self._client is not None:
+            pipe = self._client.pipeline(transaction=False)
+            pipe.zadd(REVOCATION_KEY, {jti: expires_at})
+            pipe.zremrangebyscore(REVOCATION_KEY, "-inf", time.time())
+            pipe.execute()
+
+    @property
+    def shared(self) -> bool:
+        return self._client is not None
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    def sync(self) -> None:
+        """Merge in revocations from other workers and drop expired ids. Blocks on Redis."""
+        if self._client is None:
+            return
+        now = time.time()
+        shared = self._client.zrangebyscore(REVOCATION_KEY, now, "+inf", withscores=True)
+        with self._lock:
+            revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+            revoked.update((jti.decode(), score) for jti, score in shared)
+            self._revoked = revoked
+
+    async def monitor(self) -> None:
+        """Sync every REVOCATION_SYNC_INTERVAL, off the event loop, until cancelled."""
+        while True:
+            try:
+                await anyio.to_thread.run_sync(self.sync)
+            except Exception:
+                # Keep the ids we have and try again next interval
+                self.sync_failures += 1
+            await asyncio.sleep(self._sync_interval)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._revoked), "sync_failures": self.sync_failures}
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+
+token_cache = TokenCache()
+revocations = RevocationList()
@@ -0,0 +1,876 @@
+"""Performance benchmarks.
+
+Usage: python -m backend.bench [--json FILE] <benchmark> [options]
+
+    handlers   p50/p99 of each API handler, in process, on a seeded dataset
+    scenario   HTTP load test: a weighted mix of browsing, booking and dashboard traffic
+    compare    diff two --json result files (p50/p99/throughput per case)
+    load    requests/sec of the HTTP API with DB_ASYNC off vs on
+    hash    logins/sec (bcrypt verify) as the hashing pool grows
+    plans   query plans and latency of the hot queries before/after the 0003 indexes
+    serialize  cost of turning services into a JSON body, per-field ORM dicts vs SQL rows
+    listing    peak memory and CPU of a large service listing, ORM entities vs projected columns
+    onboard    time to add a provider's listings: one POST /services each vs /services/import
+    auth       per-request cost of get_current_user on a token cache hit vs miss
+    near       latency of `near=` radius lookups (geohash or GiST index) on a large catalog
+
+`handlers` and `scenario` seed a fresh SQLite file with `--rows` services
+(10k, 100k, 1m or a number) unless `--database-url` names a database that
+already has data (see `python -m backend.manage seed`). With `--json`, the
+results are written with the commit and settings they were measured at.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+try:
+    from .seed import CATEGORIES, LOCATIONS, STATUSES, parse_scale, seed_catalog, seed_dataset
+except ImportError:
+    from seed import CATEGORIES, LOCATIONS, STATUSES, parse_scale, seed_catalog, seed_dataset
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# New bookings made by the benchmarks start after every seeded one
+FUTURE = datetime(2030, 1, 1, tzinfo=timezone.utc)
+
+
+def _models():
+    try:
+        from . import models
+    except ImportError:
+        import models
+    return models
+
+
+def _migrate(revision: str = "head") -> None:
+    try:
+        from .migrate import upgrade_database
+    except ImportError:
+        from migrate import upgrade_database
+    upgrade_database(revision)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(env: dict, workdir: str):
+    port = _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir,
+        env={**os.environ, **env, "PYTHONPATH": REPO_ROOT},
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def _wait_ready(client, base_url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(f"{base_url}/health/ready")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become ready")
+
+
+def _wait_warm(client, timeout: float = 30.0) -> None:
+    """Block until a TestClient's app has finished its startup prewarm."""
+    deadline = time.monotonic() + timeout
+    while client.get("/health/ready").status_code != 200:
+        if time.monotonic() > deadline:
+            raise RuntimeError("App did not become ready")
+        time.sleep(0.05)
+
+
+def _summary(latencies, errors: int = 0, duration: float = None) -> dict:
+    """Request count, errors, latency percentiles (ms) and, given the duration, throughput."""
+    latencies = sorted(latencies)
+    result = {"requests": len(latencies), "errors": errors}
+    if duration:
+        result["rps"] = len(latencies) / duration
+    if latencies:
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+        result.update({
+            "mean_ms": statistics.fmean(latencies) * 1000,
+            "p50_ms": percentiles[49] * 1000,
+            "p99_ms": percentiles[98] * 1000,
+        })
+    return result
+
+
+def _print_summaries(results: dict) -> None:
+    width = max(len(name) for name in results)
+    for name, r in results.items():
+        rate = f"{r['rps']:>9.1f} req/s   " if "rps" in r else ""
+        print(f"  {name:<{width}}  {rate}p50 {r.get('p50_ms', 0):>8.2f} ms   p99 {r.get('p99_ms', 0):>8.2f} ms   "
+              f"n={r['requests']}  errors {r['errors']}")
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def _write_results(args, results: dict) -> None:
+    """Save `results` to the --json file, with what is needed to compare runs."""
+    if not args.json:
+        return
+    from sqlalchemy.engine import make_url
+
+    settings = {
+        key: value for key, value in vars(args).items()
+        if key not in ("func", "workdir", "json", "database_url") and isinstance(value, (str, int, float, bool))
+    }
+    payload = {
+        "benchmark": args.benchmark,
+        "commit": _git_commit(),
+        "recorded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        # Only the backend name: the URL may carry credentials
+        "database": make_url(os.environ["DATABASE_URL"]).get_backend_name() if "DATABASE_URL" in os.environ else None,
+        "settings": settings,
+        "results": results,
+    }
+    with open(args.json, "w") as f:
+        json.dump(payload, f, indent=2)
+    print(f"Results written to {args.json}")
+
+
+async def _drive(base_url: str, mix, concurrency: int, duration: float, seed: int = 1) -> dict:
+    """Send requests from `mix` for `duration` seconds on `concurrency` connections.
+
+    `mix` is a list of `(name, weight, make)`; `make(rng)` returns the
+    `(method, path, request kwargs)` of the next request. Results are keyed by
+    name, plus "total".
+    """
+    import httpx
+
+    names = [name for name, _, _ in mix]
+    weights = [weight for _, weight, _ in mix]
+    makers = {name: make for name, _, make in mix}
+    latencies = {name: [] for name in names}
+    errors = dict.fromkeys(names, 0)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        await _wait_ready(client, base_url)
+        deadline = time.monotonic() + duration
+
+        async def worker(rng):
+            while time.monotonic() < deadline:
+                name = rng.choices(names, weights)[0]
+                method, path, kwargs = makers[name](rng)
+                started = time.perf_counter()
+                try:
+                    response = await client.request(method, path, **kwargs)
+                    ok = response.is_success
+                except Exception:
+                    ok = False
+                if ok:
+                    latencies[name].append(time.perf_counter() - started)
+                else:
+                    errors[name] += 1
+
+        await asyncio.gather(*(worker(random.Random(seed * 1000 + i)) for i in range(concurrency)))
+
+    results = {"total": _summary([t for name in names for t in latencies[name]], sum(errors.values()), duration)}
+    if len(names) > 1:
+        results.update((name, _summary(latencies[name], errors[name], duration)) for name in names)
+    return results
+
+
+def _prepare_database(args) -> None:
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(args.workdir, 'bench.db')}"
+        _migrate()
+        seed_catalog(args.rows or 2000)
+
+
+def load(args) -> int:
+    _prepare_database(args)
+    results = {}
+    for mode in args.modes.split(","):
+        process, base_url = _start_server({"DB_ASYNC": "1" if mode == "async" else "0"}, args.workdir)
+        try:
+            mix = [(args.path, 1, lambda rng: ("GET", args.path, {}))]
+            results[mode] = asyncio.run(_drive(base_url, mix, args.concurrency, args.duration))["total"]
+        finally:
+            process.terminate()
+            process.wait()
+
+    print(f"GET {args.path}  concurrency={args.concurrency}  duration={args.duration}s")
+    _print_summaries(results)
+    _write_results(args, results)
+    return 0
+
+
+def hash_throughput(args) -> int:
+    try:
+        from . import hashing
+    except ImportError:
+        import hashing
+
+    cores = os.cpu_count() or 1
+    if args.workers:
+        sizes = [int(w) for w in args.workers.split(",")]
+    else:
+        sizes = sorted({min(2 ** i, cores) for i in range(cores.bit_length() + 1)})
+    stored = hashing.get_password_hash("bench-password")
+
+    async def run():
+        # Distinct emails so request coalescing does not collapse the work
+        await asyncio.gather(*(
+            hashing.verify_and_update_password(f"user{i}@bench.test", "bench-password", stored)
+            for i in range(args.logins)
+        ))
+
+    print(f"bcrypt rounds={hashing.BCRYPT_ROUNDS}  logins per run={args.logins}")
+    for size in sizes:
+        hashing.HASH_WORKERS = size
+        hashing.HASH_MAX_PENDING = max(hashing.HASH_MAX_PENDING, args.logins)
+        hashing.shutdown()
+        asyncio.run(run())  # warm the pool
+        started = time.perf_counter()
+        asyncio.run(run())
+        elapsed = time.perf_counter() - started
+        print(f"  workers={size:<3} {args.logins / elapsed:>8.1f} logins/s")
+    hashing.shutdown()
+    return 0
+
+
+# --- QUERY PLANS ---
+# Revision before migration 0003 added the foreign key and filter indexes
+UNINDEXED_REVISION = "0002"
+HOT_QUERIES = [
+    ("services by category, top rated",
+     "SELECT id, title, price, rating FROM services WHERE category = :category "
+     "ORDER BY rating DESC, id DESC LIMIT 20"),
+    ("services by category, cheapest",
+     "SELECT id, title, price, rating FROM services WHERE category = :category "
+     "ORDER BY price ASC, id ASC LIMIT 20"),
+    ("provider's services",
+     "SELECT id, title FROM services WHERE provider_id = :provider_id ORDER BY id DESC LIMIT 50"),
+    ("user's bookings",
+     "SELECT b.id, b.status, s.title FROM bookings b JOIN services s ON s.id = b.service_id "
+     "WHERE b.user_id = :user_id ORDER BY b.id DESC LIMIT 50"),
+    ("provider's incoming bookings",
+     "SELECT b.id, b.status FROM bookings b JOIN services s ON s.id = b.service_id "
+     "WHERE s.provider_id = :provider_id ORDER BY b.id DESC LIMIT 50"),
+    ("service reviews, newest",
+     "SELECT id, rating, comment FROM reviews WHERE service_id = :service_id "
+     "ORDER BY created_at DESC, id DESC LIMIT 50"),
+]
+
+
+def _explain(conn, sql: str, params: dict):
+    from sqlalchemy import text
+
+    if conn.dialect.name == "sqlite":
+        return [row[-1] for row in conn.execute(text("EXPLAIN QUERY PLAN " + sql), params)]
+    return [row[0] for row in conn.execute(text("EXPLAIN " + sql), params)]
+
+
+def _measure(bind, params: dict, repeat: int) -> dict:
+    from sqlalchemy import text
+
+    results = {}
+    with bind.connect() as conn:
+        for name, sql in HOT_QUERIES:
+            conn.execute(text(sql), params).all()  # warm the page cache
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                conn.execute(text(sql), params).all()
+                timings.append(time.perf_counter() - started)
+            results[name] = {"plan": _explain(conn, sql, params), "ms": statistics.median(timings) * 1000}
+    return results
+
+
+def plans(args) -> int:
+    rows = args.rows or 1_000_000
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(args.workdir, 'plans.db')}"
+    models = _models()
+    from sqlalchemy import inspect
+
+    if inspect(models.engine).has_table("users"):
+        print("plans needs an empty database: it builds the schema at revision "
+              f"{UNINDEXED_REVISION}, seeds it, then migrates to head")
+        return 1
+
+    _migrate(UNINDEXED_REVISION)
+    started = time.perf_counter()
+    params = seed_dataset(models.engine, rows)
+    print(f"Seeded {rows} services, bookings and reviews in {time.perf_counter() - started:.1f}s "
+          f"({models.engine.dialect.name})")
+    if models.engine.dialect.name == "postgresql":
+        with models.engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+    before = _measure(models.engine, params, args.repeat)
+
+    started = time.perf_counter()
+    _migrate()
+    print(f"Migrated to head in {time.perf_counter() - started:.1f}s")
+    with models.engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+    after = _measure(models.engine, params, args.repeat)
+
+    for name, _ in HOT_QUERIES:
+        b, a = before[name], after[name]
+        print(f"\n{name}: {b['ms']:.2f} ms -> {a['ms']:.2f} ms ({b['ms'] / max(a['ms'], 1e-6):.0f}x)")
+        for label, result in (("before", b), ("after", a)):
+            print(f"  {label}:")
+            for line in result["plan"]:
+                print(f"    {line}")
+    return 0
+
+
+# --- SERIALIZATION ---
+def _orm_service_dict(s):
+    # How the handlers built service dicts before serializers.py
+    try:
+        provider_name = s.provider.name if s.provider else "Unknown"
+    except Exception:
+        provider_name = "Unknown"
+    return {
+        "id": s.id,
+        "provider_id": s.provider_id,
+        "provider_name": provider_name,
+        "title": s.title or "",
+        "description": s.description or "",
+        "category": s.category or "",
+        "location": s.location or "",
+        "price": float(s.price) if s.price else 0.0,
+        "image_url": s.thumbnail_url or s.image_url or "",
+        "rating": float(s.rating) if s.rating else 0.0,
+        "review_count": int(s.review_count) if s.review_count else 0,
+    }
+
+
+def _best_of(repeat: int, fn) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def serialize(args) -> int:
+    import json
+
+    from fastapi.encoders import jsonable_encoder
+    from sqlalchemy.orm import joinedload
+
+    _prepare_database(args)
+    models = _models()
+    try:
+        from . import serializers
+    except ImportError:
+        import serializers
+
+    def stdlib_render(content):
+        # fastapi.responses.JSONResponse.render
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+    with models.SessionLocal() as db:
+        def orm_query():
+            return db.query(models.Service).options(joinedload(models.Service.provider)).limit(args.services).all()
+
+        def rows_query():
+            return serializers.service_rows(db, listing=True).limit(args.services).all()
+
+        services, rows = orm_query(), rows_query()
+        count = len(rows)
+        results = {
+            "encode": (
+                _best_of(args.repeat, lambda: stdlib_render(jsonable_encoder([_orm_service_dict(s) for s in services]))),
+                _best_of(args.repeat, lambda: serializers.dumps(serializers.serialize_services(rows))),
+            ),
+            "query+encode": (
+                _best_of(args.repeat, lambda: stdlib_render(jsonable_encoder([_orm_service_dict(s) for s in orm_query()]))),
+                _best_of(args.repeat, lambda: serializers.dumps(serializers.serialize_services(rows_query()))),
+            ),
+        }
+
+    scale = 10000 / count
+    print(f"{count} services, best of {args.repeat}; times per 10k services  (encoder: {serializers.JSON_ENCODER})")
+    for name, (before, after) in results.items():
+        print(f"  {name:<13} ORM+jsonable_encoder {before * scale * 1000:>8.1f} ms   "
+              f"rows+dumps {after * scale * 1000:>8.1f} ms   {before / after:>5.1f}x")
+    return 0
+
+
+def listing(args) -> int:
+    import tracemalloc
+
+    from sqlalchemy.orm import joinedload
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(args.workdir, 'listing.db')}"
+        _migrate()
+        seed_catalog(args.rows or args.services, description="x" * args.description_chars)
+    models = _models()
+    try:
+        from . import serializers
+    except ImportError:
+        import serializers
+
+    def measure(fn):
+        fn()  # warm up statement caches
+        tracemalloc.start()
+        started = time.process_time()
+        body = fn()
+        cpu = time.process_time() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return cpu, peak, len(body)
+
+    with models.SessionLocal() as db:
+        def entities():
+            services = (
+                db.query(models.Service)
+                .options(joinedload(models.Service.provider))
+                .order_by(models.Service.id.desc())
+                .limit(args.services)
+                .all()
+            )
+            body = serializers.dumps([_orm_service_dict(s) for s in services])
+            db.expunge_all()
+            return body
+
+        def projected():
+            rows = serializers.service_rows(db, listing=True).order_by(models.Service.id.desc()).limit(args.services)
+            return serializers.dumps(serializers.serialize_services(rows.all()))
+
+        results = [("ORM entities", measure(entities)), ("projected rows", measure(projected))]
+
+    print(f"{args.services} services per request, {args.description_chars}-char descriptions, "
+          f"snippet {serializers.LISTING_DESCRIPTION_CHARS} chars")
+    for name, (cpu, peak, size) in results:
+        print(f"  {name:<15} cpu {cpu * 1000:>8.1f} ms   peak {peak / 2 ** 20:>7.1f} MiB   body {size / 2 ** 20:>6.1f} MiB")
+    return 0
+
+
+def onboard(args) -> int:
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(args.workdir, 'onboard.db')}"
+    os.chdir(args.workdir)
+    try:
+        from . import main as app_module
+    except ImportError:
+        import main as app_module
+    from fastapi.testclient import TestClient
+
+    rows = args.rows or 2000
+    listing = [
+        {"title": f"Listing {i}", "description": "Imported listing", "category": CATEGORIES[i % len(CATEGORIES)],
+         "location": "New York, NY", "price": str(20 + i % 300)}
+        for i in range(rows)
+    ]
+    with TestClient(app_module.app) as client:
+        _wait_warm(client)
+        provider_id = client.post("/register", json={
+            "name": "Bench Provider", "email": f"onboard-{time.time_ns()}@bench.test",
+            "password": "bench-password", "role": "provider",
+        }).json()["user"]["id"]
+
+        started = time.perf_counter()
+        for row in listing[:args.single_rows]:
+            client.post("/services", data={**row, "provider_id": str(provider_id)}).raise_for_status()
+        single = (time.perf_counter() - started) / args.single_rows
+
+        body = "title,description,category,location,price\n" + "".join(
+            f"{r['title']},{r['description']},{r['category']},\"{r['location']}\",{r['price']}\n" for r in listing
+        )
+        started = time.perf_counter()
+        response = client.post(f"/services/import?provider_id={provider_id}", content=body,
+                               headers={"content-type": "text/csv"})
+        response.raise_for_status()
+        bulk = time.perf_counter() - started
+
+    print(f"{rows} listings")
+    print(f"  one POST /services each  {single * rows:>8.2f} s  (extrapolated from {args.single_rows} requests)")
+    print(f"  POST /services/import    {bulk:>8.2f} s  ({response.json()['imported']} imported)")
+    return 0
+
+
+def auth_overhead(args) -> int:
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(args.workdir, 'auth.db')}"
+        _migrate()
+    os.chdir(args.workdir)
+    try:
+        from . import main as app_module
+    except ImportError:
+        import main as app_module
+
+    with app_module.SessionLocal() as db:
+        user = app_module.User(name="Bench User", email=f"auth-{time.time_ns()}@bench.test",
+                               hashed_password="x", role="USER")
+        db.add(user)
+        db.commit()
+        token = app_module.create_access_token({"sub": user.email, "id": user.id})
+
+    async def per_call(calls: int, cold: bool) -> float:
+        started = time.perf_counter()
+        for _ in range(calls):
+            if cold:
+                app_module.token_cache.discard(token)
+            await app_module._verified_token(token)
+        return (time.perf_counter() - started) / calls
+
+    async def run():
+        await per_call(10, cold=False)  # warm up
+        return await per_call(args.calls, cold=False), await per_call(max(args.calls // 100, 10), cold=True)
+
+    hit, miss = asyncio.run(run())
+    print(f"get_current_user, {args.calls} calls")
+    print(f"  cache hit   {hit * 1e6:>9.1f} us/request")
+    print(f"  cache miss  {miss * 1e6:>9.1f} us/request  (JWT decode + user lookup)")
+    return 0
+
+
+def near(args) -> int:
+    args.rows = args.rows or 1_000_000
+    ids = _prepare_dataset(args)
+    models = _models()
+    try:
+        from . import search, serializers
+        from .geo import geocode
+    except ImportError:
+        import search
+        import serializers
+        from geo import geocode
+
+    rng = random.Random(3)
+    cities = sorted({geocode(location) for location in ("New York, NY", "Boston, MA", "Chicago, IL", "Austin, TX")})
+    results = {}
+    with models.SessionLocal() as db:
+        query = serializers.service_rows(db, listing=True)
+        for radius in (float(r) for r in args.radii.split(",")):
+            latencies, found = [], 0
+            for i in range(args.warmup + args.repeat):
+                lat, lon = rng.choice(cities)
+                lat, lon = lat + rng.uniform(-0.2, 0.2), lon + rng.uniform(-0.2, 0.2)
+                started = time.perf_counter()
+                page = search.nearest_services(db, query, lat, lon, radius, args.limit)
+                if i >= args.warmup:
+                    latencies.append(time.perf_counter() - started)
+                    found += len(page)
+            results[f"radius {radius:g} km"] = {**_summary(latencies), "rows_per_page": found / args.repeat}
+
+    print(f"{ids['services']} services ({models.engine.dialect.name}), {args.limit} nearest per lookup, "
+          f"{args.repeat} lookups per radius")
+    _print_summaries(results)
+    _write_results(args, results)
+    return 0
+
+
+# --- HANDLERS AND LOAD SCENARIO ---
+def _sample_ids(bind) -> dict:
+    """Id ranges of the seeded rows, to build request parameters from."""
+    with bind.connect() as conn:
+        return {
+            "services": conn.exec_driver_sql("SELECT MAX(id) FROM services").scalar() or 0,
+            "users": conn.exec_driver_sql("SELECT MAX(id) FROM users").scalar() or 0,
+            "bookings": conn.exec_driver_sql("SELECT MAX(id) FROM bookings").scalar() or 0,
+            "providers": [row[0] for row in conn.exec_driver_sql(
+                "SELECT id FROM users WHERE role = 'PROVIDER' ORDER BY id LIMIT 1000")],
+        }
+
+
+def _prepare_dataset(args) -> dict:
+    """Migrate the target database and seed it unless it already has services."""
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(args.workdir, 'dataset.db')}"
+    _migrate()
+    models = _models()
+    ids = _sample_ids(models.engine)
+    if not ids["services"] or not ids["bookings"] or not ids["providers"]:
+        rows = args.rows or 10_000
+        started = time.perf_counter()
+        seed_dataset(models.engine, rows)
+        print(f"Seeded {rows} services, bookings and reviews in {time.perf_counter() - started:.1f}s "
+              f"({models.engine.dialect.name})")
+        ids = _sample_ids(models.engine)
+    return ids
+
+
+def _handler_cases(ids: dict, token: str = None):
+    """`(name, make)` per API handler; `make(rng)` returns `(method, path, request kwargs)`.
+
+    /login and /register are left to the `hash` benchmark and the import
+    endpoint to `onboard`: their cost is bcrypt and payload size respectively.
+    """
+    def service(rng):
+        return rng.randint(1, ids["services"])
+
+    def user(rng):
+        return rng.randint(1, ids["users"])
+
+    def provider(rng):
+        return rng.choice(ids["providers"])
+
+    def booking(rng):
+        return rng.randint(1, ids["bookings"])
+
+    def new_booking(rng):
+        # A random future slot inside the default opening hours, so conflicts are rare
+        start = FUTURE + timedelta(days=rng.randint(0, 3650), hours=rng.randint(9, 16))
+        return {"service_id": str(service(rng)), "user_id": str(user(rng)), "start_at": start.isoformat()}
+
+    def service_form(rng):
+        return {"title": "Bench service", "description": "Created by the benchmark", "location": "New York, NY",
+                "category": rng.choice(CATEGORIES), "price": str(rng.randint(20, 500))}
+
+    return [
+        ("GET /services", lambda rng: ("GET", "/services?limit=20", {})),
+        ("GET /services?category&sort", lambda rng: (
+            "GET", f"/services?category={rng.choice(CATEGORIES)}&sort=rating&limit=20", {})),
+        ("GET /services?q", lambda rng: ("GET", f"/services?q={rng.choice(CATEGORIES)}&limit=20", {})),
+        ("GET /services?facets", lambda rng: (
+            "GET", f"/services?category={rng.choice(CATEGORIES)}&facets=true&limit=20", {})),
+        ("GET /services?near", lambda rng: (
+            "GET", f"/services?near={rng.choice(LOCATIONS)}&radius=10&limit=20", {})),
+        ("GET /services/{id}", lambda rng: ("GET", f"/services/{service(rng)}", {})),
+        ("GET /services/{id}/availability", lambda rng: (
+            "GET", f"/services/{service(rng)}/availability?start=2027-06-07&end=2027-06-14", {})),
+        ("GET /services/provider/{id}", lambda rng: ("GET", f"/services/provider/{provider(rng)}?limit=20", {})),
+        ("GET /bookings/user/{id}", lambda rng: ("GET", f"/bookings/user/{user(rng)}?limit=20", {})),
+        ("GET /bookings/provider/{id}", lambda rng: ("GET", f"/bookings/provider/{provider(rng)}?limit=20", {})),
+        ("GET /providers/{id}/dashboard", lambda rng: ("GET", f"/providers/{provider(rng)}/dashboard", {})),
+        ("GET /reviews/service/{id}", lambda rng: ("GET", f"/reviews/service/{service(rng)}?limit=20", {})),
+        ("GET /me", lambda rng: ("GET", "/me", {"headers": {"Authorization": f"Bearer {token}"}})),
+        ("POST /services", lambda rng: (
+            "POST", "/services", {"data": {**service_form(rng), "provider_id": str(provider(rng))}})),
+        ("PUT /services/{id}", lambda rng: ("PUT", f"/services/{service(rng)}", {"data": service_form(rng)})),
+        ("POST /bookings", lambda rng: ("POST", "/bookings", {"json": new_booking(rng)})),
+        ("POST /bookings/bulk", lambda rng: (
+            "POST", "/bookings/bulk", {"json": {"bookings": [new_booking(rng) for _ in range(20)]}})),
+        ("PUT /bookings/{id}/status", lambda rng: (
+            "PUT", f"/bookings/{booking(rng)}/status", {"json": {"status": rng.choice(STATUSES)}})),
+        ("PUT /bookings/status", lambda rng: ("PUT", "/bookings/status", {"json": {
+            "booking_ids": [booking(rng) for _ in range(20)], "status": rng.choice(STATUSES)}})),
+        ("POST /reviews", lambda rng: ("POST", "/reviews", {"json": {
+            "service_id": str(service(rng)), "user_id": str(user(rng)), "rating": rng.randint(1, 5),
+            "comment": "Benchmark review"}})),
+    ]
+
+
+# Share of each request in `scenario`: mostly browsing, some booking traffic
+SCENARIO_WEIGHTS = {
+    "GET /services": 20,
+    "GET /services?category&sort": 20,
+    "GET /services?q": 8,
+    "GET /services?near": 8,
+    "GET /services/{id}": 17,
+    "GET /reviews/service/{id}": 10,
+    "GET /bookings/user/{id}": 5,
+    "GET /bookings/provider/{id}": 3,
+    "GET /providers/{id}/dashboard": 2,
+    "POST /bookings": 5,
+    "PUT /bookings/{id}/status": 2,
+}
+
+
+def handlers(args) -> int:
+    ids = _prepare_dataset(args)
+    os.chdir(args.workdir)
+    try:
+        from . import main as app_module
+    except ImportError:
+        import main as app_module
+    from fastapi.testclient import TestClient
+
+    with app_module.SessionLocal() as db:
+        user = db.get(app_module.User, ids["users"])
+        token = app_module.create_access_token({"sub": user.email, "id": user.id})
+
+    cases = _handler_cases(ids, token)
+    if args.only:
+        cases = [(name, make) for name, make in cases if args.only in name]
+    rng = random.Random(7)
+    sent = 0
+    results = {}
+    with TestClient(app_module.app) as client:
+        _wait_warm(client)
+        for name, make in cases:
+            latencies, errors = [], 0
+            for i in range(args.warmup + args.iterations):
+                method, path, kwargs = make(rng)
+                if method == "GET" and not args.cached:
+                    # A parameter the handler ignores, so each call misses the response cache
+                    sent += 1
+                    path += f"{'&' if '?' in path else '?'}_bench={sent}"
+                started = time.perf_counter()
+                response = client.request(method, path, **kwargs)
+                elapsed = time.perf_counter() - started
+                if i < args.warmup:
+                    continue
+                if response.is_success:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+            results[name] = _summary(latencies, errors)
+            results[name]["ops_per_sec"] = len(latencies) / sum(latencies) if latencies else 0.0
+
+    print(f"{args.iterations} calls per handler after {args.warmup} warm-up calls, "
+          f"{ids['services']} services, response cache {'on' if args.cached else 'bypassed'}")
+    _print_summaries(results)
+    _write_results(args, results)
+    return 0
+
+
+def scenario(args) -> int:
+    ids = _prepare_dataset(args)
+    cases = dict(_handler_cases(ids))
+    mix = [(name, weight, cases[name]) for name, weight in SCENARIO_WEIGHTS.items()]
+    process, base_url = _start_server({"DB_ASYNC": "1" if args.mode == "async" else "0"}, args.workdir)
+    try:
+        results = asyncio.run(_drive(base_url, mix, args.concurrency, args.duration, args.seed))
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(f"Mixed traffic against {ids['services']} services  mode={args.mode}  "
+          f"concurrency={args.concurrency}  duration={args.duration}s")
+    _print_summaries(results)
+    _write_results(args, results)
+    return 0
+
+
+def compare(args) -> int:
+    """Print the change of each metric between two result files.
+
+    Exits 1 when any case's p99 got slower by more than --threshold percent.
+    """
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    print(f"{baseline['benchmark']}: {baseline.get('commit') or '?'} -> {candidate.get('commit') or '?'}")
+    regressed = []
+    for name, after in candidate["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        changes = []
+        for metric in ("p50_ms", "p99_ms", "rps", "ops_per_sec"):
+            if before.get(metric) and after.get(metric) is not None:
+                change = (after[metric] - before[metric]) / before[metric] * 100
+                changes.append(f"{metric} {before[metric]:.2f} -> {after[metric]:.2f} ({change:+.0f}%)")
+                if metric == "p99_ms" and args.threshold is not None and change > args.threshold:
+                    regressed.append(name)
+        print(f"  {name}: " + "   ".join(changes))
+    if regressed:
+        print(f"p99 regressed by more than {args.threshold}%: {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m backend.bench")
+    parser.add_argument("--database-url", help="Benchmark against this database instead of a fresh SQLite file")
+    parser.add_argument("--rows", type=parse_scale, default=None,
+                        help="Rows to seed or import: a number, 10k, 100k or 1m "
+                             "(default 2000; 10k for handlers and scenario; 1m for plans)")
+    parser.add_argument("--json", help="Also write the results to this file (handlers, scenario, load)")
+    benchmarks = parser.add_subparsers(dest="benchmark", required=True)
+
+    p = benchmarks.add_parser("handlers", help="Latency of each API handler in process")
+    p.add_argument("--iterations", type=int, default=200, help="Timed calls per handler")
+    p.add_argument("--warmup", type=int, default=10)
+    p.add_argument("--only", help="Only handlers whose name contains this text")
+    p.add_argument("--cached", action="store_true", help="Let GETs hit the response cache")
+    p.set_defaults(func=handlers)
+
+    p = benchmarks.add_parser("scenario", help="Mixed HTTP load against a uvicorn server")
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--duration", type=float, default=30.0)
+    p.add_argument("--mode", choices=("sync", "async"), default="sync", help="DB_ASYNC setting of the server")
+    p.add_argument("--seed", type=int, default=1, help="Seed for the request sequence")
+    p.set_defaults(func=scenario)
+
+    p = benchmarks.add_parser("near", help="Proximity lookup latency on a large seeded catalog")
+    p.add_argument("--radii", default="1,5,10,25,50", help="Comma-separated radii in km")
+    p.add_argument("--limit", type=int, default=21, help="Rows per lookup (page size + 1)")
+    p.add_argument("--repeat", type=int, default=200)
+    p.add_argument("--warmup", type=int, default=20)
+    p.set_defaults(func=near)
+
+    p = benchmarks.add_parser("compare", help="Diff two --json result files")
+    p.add_argument("baseline")
+    p.add_argument("candidate")
+    p.add_argument("--threshold", type=float, default=None, help="Fail if a p99 grows by more than this percent")
+    p.set_defaults(func=compare)
+
+    p = benchmarks.add_parser("load", help="HTTP throughput, sync vs async database layer")
+    p.add_argument("--path", default="/services?limit=20")
+    p.add_argument("--concurrency", type=int, default=64)
+    p.add_argument("--duration", type=float, default=10.0)
+    p.add_argument("--modes", default="sync,async")
+    p.set_defaults(func=load)
+
+    p = benchmarks.add_parser("hash", help="Password verifies/sec per hashing pool size")
+    p.add_argument("--logins", type=int, default=64, help="Distinct concurrent logins per run")
+    p.add_argument("--workers", default=None, help="Comma-separated pool sizes (default 1,2,4,... up to the core count)")
+    p.set_defaults(func=hash_throughput)
+
+    p = benchmarks.add_parser("plans", help="EXPLAIN and latency of hot queries before vs after the indexes")
+    p.add_argument("--repeat", type=int, default=20, help="Timed runs per query")
+    p.set_defaults(func=plans)
+
+    p = benchmarks.add_parser("serialize", help="Service list serialization cost, old vs shared serializer")
+    p.add_argument("--services", type=int, default=10000, help="Services per response")
+    p.add_argument("--repeat", type=int, default=10)
+    p.set_defaults(func=serialize)
+
+    p = benchmarks.add_parser("listing", help="Memory/CPU of a service listing, ORM entities vs projected rows")
+    p.add_argument("--services", type=int, default=10000, help="Services per response")
+    p.add_argument("--description-chars", type=int, default=2000, help="Length of each seeded description")
+    p.set_defaults(func=listing)
+
+    p = benchmarks.add_parser("onboard", help="Per-request service creation vs the bulk import endpoint")
+    p.add_argument("--single-rows", type=int, default=200, help="Per-request creates to time before extrapolating")
+    p.set_defaults(func=onboard)
+
+    p = benchmarks.add_parser("auth", help="Token verification cost with and without the claims cache")
+    p.add_argument("--calls", type=int, default=100000)
+    p.set_defaults(func=auth_overhead)
+
+    args = parser.parse_args(argv)
+    args.workdir = tempfile.mkdtemp(prefix="bench-")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
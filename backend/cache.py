@@ -0,0 +1,295 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable, Iterable, List, Optional
+
+from fastapi import Request, Response
+
+try:
+    from .replicas import REPLICA_CHECK_SECONDS, REPLICA_MAX_LAG_SECONDS
+    from .serializers import dumps
+except ImportError:
+    from replicas import REPLICA_CHECK_SECONDS, REPLICA_MAX_LAG_SECONDS
+    from serializers import dumps
+
+# --- CONFIGURATION ---
+# "memory" for the in-process LRU, or a redis:// URL for a shared cache. The
+# LRU is one process's own: invalidations never reach other workers, so
+# serve.py only runs more than one worker with a shared cache.
+CACHE_URL = os.getenv("CACHE_URL", "memory")
+CACHE_TTL = int(os.getenv("CACHE_TTL", "60"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_PREFIX = os.getenv("CACHE_PREFIX", "hs:")
+
+REDIS_SCHEMES = ("redis://", "rediss://", "unix://")
+# How far behind the primary a replica read may be: the lag a replica is
+# allowed, plus the time until a check notices it fell further behind
+REPLICA_STALE_SECONDS = REPLICA_MAX_LAG_SECONDS + REPLICA_CHECK_SECONDS
+
+
+# --- BACKENDS ---
+class CacheBackend(ABC):
+    """Byte-value store plus a set of monotonically increasing tag versions.
+
+    Entries are never deleted on invalidation. Instead, every key embeds the
+    current version of each tag it depends on, and invalidating a tag bumps
+    its version so older keys are never looked up again.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        ...
+
+    @abstractmethod
+    def versions(self, tags: List[str]) -> List[int]:
+        ...
+
+    @abstractmethod
+    def bump(self, tags: Iterable[str]) -> None:
+        """Raise the version of each tag and record when it happened."""
+
+    @abstractmethod
+    def last_bumped(self, tags: List[str]) -> float:
+        """Unix time of the latest bump of any of `tags`, 0 if never."""
+
+    def __len__(self):
+        return 0
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU with per-entry TTL."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        # Tag versions live outside the LRU: evicting one would reset it to 0
+        # and make entries written under the old 0 reachable again.
+        self._versions = {}
+        self._bumped = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def versions(self, tags):
+        with self._lock:
+            return [self._versions.get(tag, 0) for tag in tags]
+
+    def bump(self, tags):
+        now = time.time()
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+                self._bumped[tag] = now
+
+    def last_bumped(self, tags):
+        with self._lock:
+            return max((self._bumped.get(tag, 0.0) for tag in tags), default=0.0)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache(CacheBackend):
+    """Shared cache on any server speaking the Redis protocol."""
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = CACHE_PREFIX, client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("CACHE_URL points at Redis but the 'redis' package is not installed")
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self._prefix = prefix
+
+    def get(self, key):
+        return self._client.get(self._prefix + key)
+
+    def set(self, key, value, ttl):
+        self._client.set(self._prefix + key, value, ex=ttl)
+
+    def versions(self, tags):
+        if not tags:
+            return []
+        values = self._client.mget([f"{self._prefix}tag:{tag}" for tag in tags])
+        return [int(v) if v is not None else 0 for v in values]
+
+    def bump(self, tags):
+        now = time.time()
+        pipe = self._client.pipeline(transaction=False)
+        for tag in tags:
+            pipe.incr(f"{self._prefix}tag:{tag}")
+            pipe.set(f"{self._prefix}bumped:{tag}", now)
+        pipe.execute()
+
+    def last_bumped(self, tags):
+        if not tags:
+            return 0.0
+        values = self._client.mget([f"{self._prefix}bumped:{tag}" for tag in tags])
+        return max(float(v) if v is not None else 0.0 for v in values)
+
+    def __len__(self):
+        return self._client.dbsize()
+
+
+def is_shared(url: str) -> bool:
+    """Whether `url` names a store that every worker process sees."""
+    return url.startswith(REDIS_SCHEMES)
+
+
+def create_backend(url: str = CACHE_URL) -> CacheBackend:
+    if is_shared(url):
+        return RedisCache(url)
+    return MemoryCache()
+
+
+# --- HTTP RESPONSE CACHE ---
+class ResponseCache:
+    """Read-through cache of JSON GET responses with ETag/Last-Modified.
+
+    A page read from a replica (replicas.py) soon after one of its tags was
+    invalidated may predate the write, so it is served but not stored:
+    otherwise it would sit under the new tag versions, and even a client
+    reading its own writes from the primary would be handed it.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: int = CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.unstored = 0
+
+    def _key(self, request: Request, tags: List[str]) -> str:
+        params = sorted(request.query_params.multi_items())
+        versions = self.backend.versions(tags)
+        raw = json.dumps([request.url.path, params, tags, versions], separators=(",", ":"))
+        return "resp:" + hashlib.sha1(raw.encode()).hexdigest()
+
+    @staticmethod
+    def _encode(body: bytes, headers: dict) -> bytes:
+        return json.dumps(headers, separators=(",", ":")).encode() + b"\n" + body
+
+    @staticmethod
+    def _decode(value: bytes):
+        meta, body = value.split(b"\n", 1)
+        return body, json.loads(meta)
+
+    def _may_be_stale(self, request: Request, tags: List[str]) -> bool:
+        if getattr(request.state, "read_replica", None) is None:
+            return False
+        return time.time() - self.backend.last_bumped(tags) < REPLICA_STALE_SECONDS
+
+    def respond(self, request: Request, tags: List[str], build: Callable) -> Response:
+        """Serve from cache, or call `build()` -> `(payload, headers)` and store it."""
+        key = self._key(request, tags)
+        cached = self.backend.get(key)
+        if cached is not None:
+            self.hits += 1
+            body, headers = self._decode(cached)
+            cache_status = "HIT"
+        else:
+            self.misses += 1
+            payload, extra_headers = build()
+            body = dumps(payload)
+            headers = {
+                **extra_headers,
+                "ETag": '"' + hashlib.sha1(body).hexdigest() + '"',
+                "Last-Modified": formatdate(time.time(), usegmt=True),
+            }
+            if self._may_be_stale(request, tags):
+                self.unstored += 1
+            else:
+                self.backend.set(key, self._encode(body, headers), self.ttl)
+            cache_status = "MISS"
+
+        headers = {**headers, "X-Cache": cache_status}
+        if _not_modified(request, headers):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def invalidate(self, *tags: str) -> None:
+        tags = [t for t in dict.fromkeys(tags) if t]
+        if tags:
+            self.backend.bump(tags)
+            self.invalidations += len(tags)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "unstored_replica_reads": self.unstored,
+        }
+
+
+def _not_modified(request: Request, headers: dict) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etag = headers["ETag"]
+        return any(tag.strip() in (etag, "*", "W/" + etag) for tag in if_none_match.split(","))
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(headers["Last-Modified"]) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+# --- INVALIDATION TAGS ---
+def service_listing_tags(category: Optional[str] = None, provider_id: Optional[int] = None) -> List[str]:
+    """Tags a catalog listing depends on, given the filters it was built with."""
+    if provider_id is not None:
+        return [f"services:provider:{provider_id}"]
+    if category and category != "All":
+        return [f"services:category:{category}"]
+    return ["services:all"]
+
+
+def service_change_tags(service_id: int, provider_id, *categories) -> List[str]:
+    """Tags to invalidate when a service row changes (or is created).
+
+    `service_id` may be None for bulk inserts, where no detail page exists yet.
+    """
+    tags = [f"service:{service_id}"] if service_id is not None else []
+    tags += ["services:all", f"services:provider:{provider_id}"]
+    tags += [f"services:category:{c}" for c in categories if c]
+    return tags
+
+
+response_cache = ResponseCache(create_backend())
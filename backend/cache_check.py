@@ -0,0 +1,106 @@
+"""Check a response cache backend the way several workers use it.
+
+Run with: python -m backend.cache_check [redis://host:port/db]
+
+Without a URL the Redis backend runs against fakeredis, an in-process
+stand-in speaking the same commands. Two ResponseCache instances share the
+backend, as two uvicorn workers do: a page cached by one must be a hit for
+the other, and an invalidation by either must reach both. Keys are written
+under a throwaway prefix and removed afterwards, so a live server can be
+checked too. Exits non-zero on the first failed check.
+"""
+import os
+import sys
+import time
+import uuid
+
+from starlette.requests import Request
+
+
+def _request(path: str, replica: str = None) -> Request:
+    request = Request({"type": "http", "method": "GET", "path": path, "query_string": b"", "headers": []})
+    if replica:
+        request.state.read_replica = replica
+    return request
+
+
+def _redis_client(url: str = None):
+    if url:
+        import redis
+
+        return redis.Redis.from_url(url)
+    try:
+        import fakeredis
+    except ImportError:
+        raise SystemExit("Pass a redis:// URL, or install fakeredis to check without a server")
+    return fakeredis.FakeRedis()
+
+
+def run_cache_check(client) -> int:
+    try:
+        from .cache import CACHE_PREFIX, RedisCache, ResponseCache
+    except ImportError:
+        from cache import CACHE_PREFIX, RedisCache, ResponseCache
+
+    prefix = f"{CACHE_PREFIX}check:{uuid.uuid4().hex[:8]}:"
+    backend = RedisCache("", prefix=prefix, client=client)
+    first, second = ResponseCache(backend, ttl=60), ResponseCache(backend, ttl=60)
+    failures = []
+
+    def check(name: str, ok: bool) -> None:
+        print(f"  {name:<52} {'ok' if ok else 'FAILED'}")
+        if not ok:
+            failures.append(name)
+
+    builds = []
+
+    def build():
+        builds.append(1)
+        return {"page": len(builds)}, {"X-Next-Cursor": "abc"}
+
+    tags = ["services:all", "services:category:Plumbing"]
+    try:
+        backend.set("plain", b"value", 60)
+        check("get returns what set stored", backend.get("plain") == b"value")
+        check("missing key is None", backend.get("absent") is None)
+        backend.set("short", b"value", 1)
+        time.sleep(1.2)
+        check("entry expires after its ttl", backend.get("short") is None)
+
+        check("unknown tags start at version 0", backend.versions(tags) == [0, 0])
+        backend.bump(tags[:1])
+        check("bump raises only the given tag", backend.versions(tags) == [1, 0])
+
+        response = first.respond(_request("/services"), tags, build)
+        check("first worker builds the page", response.headers["X-Cache"] == "MISS" and len(builds) == 1)
+        response = second.respond(_request("/services"), tags, build)
+        check("second worker is served the first worker's page",
+              response.headers["X-Cache"] == "HIT" and len(builds) == 1)
+        check("cached headers survive the round trip", response.headers.get("X-Next-Cursor") == "abc")
+
+        second.invalidate(tags[1])
+        response = first.respond(_request("/services"), tags, build)
+        check("invalidation by one worker reaches the other",
+              response.headers["X-Cache"] == "MISS" and len(builds) == 2)
+        response = second.respond(_request("/services"), tags, build)
+        check("rebuilt page is shared again", response.headers["X-Cache"] == "HIT" and len(builds) == 2)
+
+        first.invalidate(tags[1])
+        response = second.respond(_request("/services", replica="replica1"), tags, build)
+        check("replica read right after invalidation is served", response.headers["X-Cache"] == "MISS")
+        response = first.respond(_request("/services"), tags, build)
+        check("... but not stored", response.headers["X-Cache"] == "MISS" and len(builds) == 4)
+    finally:
+        keys = list(client.scan_iter(match=prefix + "*"))
+        if keys:
+            client.delete(*keys)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    # cache.py loads the models, which need a database URL; none is opened
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    url = sys.argv[1] if len(sys.argv) > 1 else None
+    print(f"Checking the Redis cache backend against {url or 'fakeredis'}")
+    sys.exit(run_cache_check(_redis_client(url)))
@@ -0,0 +1,213 @@
+"""Booking events pushed to clients over Server-Sent Events.
+
+Handlers publish an event on the session that makes the change, and it is
+delivered only if that transaction commits. Each stream subscribes to the
+audiences of its user ("user", id) and ("provider", id), so nobody receives
+events about other people's bookings.
+
+The "memory" backend fans out inside this process. With EVENTS_BACKEND=postgres
+events travel through NOTIFY on the committing transaction and every
+worker LISTENs on one connection of its own, so streams on any worker see
+every booking change.
+
+An idle stream costs one queue and one suspended task. Keep-alives come from
+a single timer for the whole process rather than one per connection, so a
+worker can hold tens of thousands of open streams.
+"""
+import asyncio
+import json
+import os
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from sqlalchemy import event as sa_event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+# --- CONFIGURATION ---
+# "memory" for this process only, "postgres" for LISTEN/NOTIFY across workers
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "memory")
+EVENTS_CHANNEL = os.getenv("EVENTS_CHANNEL", "booking_events")
+# Events buffered for a stream that is not reading; past this it is closed
+# and the client reconnects (EventSource does so by itself)
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "256"))
+# Comment line sent to idle streams so proxies keep them open
+KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+# Reconnect delay suggested to clients, in milliseconds
+RETRY_MS = 5000
+
+PENDING_KEY = "pending_events"
+KEEPALIVE = object()
+CLOSE = object()
+
+
+def audiences(event: dict):
+    """Subscription keys that should receive `event`."""
+    if event.get("user_id") is not None:
+        yield ("user", event["user_id"])
+    if event.get("provider_id") is not None:
+        yield ("provider", event["provider_id"])
+
+
+class Stream(asyncio.Queue):
+    """Pending items of one connected client."""
+
+    def __init__(self, keys):
+        super().__init__(maxsize=STREAM_QUEUE_SIZE)
+        self.keys = tuple(keys)
+
+
+class Broker:
+    def __init__(self, backend: str = EVENTS_BACKEND, channel: str = EVENTS_CHANNEL):
+        self.backend = backend
+        self.channel = channel
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers = defaultdict(set)
+        self._streams = set()
+        self._keepalive = None
+        self._listener = None
+        self.delivered = 0
+        self.overflowed = 0
+
+    # --- LIFECYCLE ---
+    async def start(self, database_url: str = None) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._keepalive = asyncio.create_task(self._send_keepalives())
+        if self.backend == "postgres":
+            import asyncpg
+
+            url = make_url(database_url).set(drivername="postgresql")
+            self._listener = await asyncpg.connect(url.render_as_string(hide_password=False))
+            await self._listener.add_listener(self.channel, self._on_notify)
+
+    async def stop(self) -> None:
+        if self._keepalive is not None:
+            self._keepalive.cancel()
+            self._keepalive = None
+        if self._listener is not None:
+            await self._listener.close()
+            self._listener = None
+        for queue in list(self._streams):
+            self._close(queue)
+        self._loop = None
+
+    async def _send_keepalives(self) -> None:
+        while True:
+            await asyncio.sleep(KEEPALIVE_SECONDS)
+            for queue in list(self._streams):
+                if queue.empty():
+                    queue.put_nowait(KEEPALIVE)
+
+    # --- PUBLISHING ---
+    def publish(self, db: Session, events: Iterable[dict]) -> None:
+        """Send `events` when `db` commits; they are dropped if it rolls back."""
+        events = list(events)
+        if not events:
+            return
+        if self.backend == "postgres":
+            # NOTIFY is transactional: listeners get it on commit, or never
+            db.execute(
+                text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"),
+                {"channel": self.channel, "payloads": [json.dumps(e, separators=(",", ":")) for e in events]},
+            )
+        else:
+            db.info.setdefault(PENDING_KEY, []).extend(events)
+
+    def deliver(self, events: Iterable[dict]) -> None:
+        """Hand `events` to this process's streams; callable from any thread."""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._fan_out, list(events))
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        self._fan_out([json.loads(payload)])
+
+    def _fan_out(self, events) -> None:
+        for event in events:
+            for key in audiences(event):
+                for queue in list(self._subscribers.get(key, ())):
+                    try:
+                        queue.put_nowait(event)
+                        self.delivered += 1
+                    except asyncio.QueueFull:
+                        self.overflowed += 1
+                        self._close(queue)
+
+    # --- SUBSCRIBING ---
+    def subscribe(self, keys) -> Stream:
+        queue = Stream(keys)
+        for key in queue.keys:
+            self._subscribers[key].add(queue)
+        self._streams.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: Stream) -> None:
+        self._streams.discard(queue)
+        for key in queue.keys:
+            subscribers = self._subscribers.get(key)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[key]
+
+    def _close(self, queue: Stream) -> None:
+        # The stream ends at the next read; anything still buffered is
+        # dropped, the client refetches after reconnecting
+        self.unsubscribe(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(CLOSE)
+
+    async def stream(self, keys):
+        """SSE body for one client: its events, keep-alives, and nothing else."""
+        queue = self.subscribe(keys)
+        try:
+            yield f"retry: {RETRY_MS}\n: connected\n\n"
+            while True:
+                item = await queue.get()
+                if item is CLOSE:
+                    return
+                if item is KEEPALIVE:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {item['type']}\ndata: {json.dumps(item, separators=(',', ':'))}\n\n"
+        finally:
+            self.unsubscribe(queue)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "streams": len(self._streams),
+            "audiences": len(self._subscribers),
+            "delivered": self.delivered,
+            "overflowed": self.overflowed,
+        }
+
+
+broker = Broker()
+
+
+@sa_event.listens_for(Session, "after_commit")
+def _deliver_committed(session):
+    events = session.info.pop(PENDING_KEY, None)
+    if events:
+        broker.deliver(events)
+
+
+@sa_event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(PENDING_KEY, None)
+
+
+def booking_event(kind: str, booking_id: int, service_id: int, user_id: int, provider_id: int,
+                  status: str, **extra) -> dict:
+    return {
+        "type": f"booking.{kind}",
+        "booking_id": booking_id,
+        "service_id": service_id,
+        "user_id": user_id,
+        "provider_id": provider_id,
+        "status": status,
+        **extra,
+    }
@@ -0,0 +1,98 @@
+"""Facet counts and histograms for a filtered catalog listing.
+
+All facets come from one aggregate statement over the matching services.
+Postgres groups them once with GROUPING SETS; SQLite, which has no grouping
+sets, runs the same groupings as a UNION ALL over one materialized CTE.
+
+The category facet ignores the category filter, so a listing narrowed to
+one category still shows how many matches the others have. Every other
+facet counts only the rows in the selected category.
+"""
+import os
+from typing import Optional
+
+from sqlalchemy import case, func, literal, null, select, union_all
+from sqlalchemy.orm import Session
+
+try:
+    from .models import Service
+except ImportError:
+    from models import Service
+
+# --- CONFIGURATION ---
+# Lower bounds of the histogram buckets; the last bucket is open-ended
+PRICE_EDGES = (0, 25, 50, 100, 200, 500, 1000)
+RATING_EDGES = (0, 1, 2, 3, 4)
+# Most frequent locations returned
+FACET_LIMIT = int(os.getenv("FACET_LIMIT", "20"))
+
+FACETS = ("category", "location", "price", "rating")
+
+
+def _bucket(column, edges):
+    """Index of the histogram bucket `column` falls in; NULL stays NULL."""
+    return case(
+        (column.is_(None), null()),
+        *[(column < edge, index) for index, edge in enumerate(edges[1:])],
+        else_=len(edges) - 1,
+    )
+
+
+def _histogram(counts: dict, edges) -> list:
+    return [
+        {"min": low, "max": edges[index + 1] if index + 1 < len(edges) else None, "count": counts.get(index, 0)}
+        for index, low in enumerate(edges)
+    ]
+
+
+def _ranked(counts: dict, limit: Optional[int] = None) -> list:
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    return [{"value": value, "count": count} for value, count in ranked[:limit]]
+
+
+def service_facets(db: Session, query, category: Optional[str] = None) -> dict:
+    """Facets of the services matched by `query`, a Service query with every filter but the category."""
+    selected = case((Service.category == category, 1), else_=0) if category else literal(1)
+    matched = query.with_entities(
+        Service.category.label("category"),
+        Service.location.label("location"),
+        _bucket(Service.price, PRICE_EDGES).label("price"),
+        _bucket(Service.rating, RATING_EDGES).label("rating"),
+        selected.label("selected"),
+    ).cte("matched")
+    columns = [matched.c[name] for name in FACETS]
+    totals = [func.count().label("total"), func.coalesce(func.sum(matched.c.selected), 0).label("selected")]
+
+    if db.get_bind().dialect.name == "postgresql":
+        statement = select(
+            *columns, *[func.grouping(c).label(f"grouping_{c.name}") for c in columns], *totals
+        ).group_by(func.grouping_sets(*columns))
+        rows = [
+            # GROUPING() is 0 for the one column this row is grouped by
+            (facet, row[facet], row["total"], row["selected"])
+            for row in db.execute(statement).mappings()
+            for facet in FACETS if row[f"grouping_{facet}"] == 0
+        ]
+    else:
+        statement = union_all(*[
+            select(literal(facet).label("facet"), column.label("value"), *totals).group_by(column)
+            for facet, column in zip(FACETS, columns)
+        ])
+        rows = db.execute(statement).all()
+
+    counts = {facet: {} for facet in FACETS}
+    total = 0
+    for facet, value, all_rows, in_category in rows:
+        if facet == "category":
+            total += in_category
+            if value is not None:
+                counts[facet][value] = all_rows
+        elif value is not None and in_category:
+            counts[facet][value] = in_category
+    return {
+        "total": total,
+        "categories": _ranked(counts["category"]),
+        "locations": _ranked(counts["location"], FACET_LIMIT),
+        "price": _histogram(counts["price"], PRICE_EDGES),
+        "rating": _histogram(counts["rating"], RATING_EDGES),
+    }
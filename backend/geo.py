@@ -0,0 +1,156 @@
+"""Geocoding, geohashes and distances for proximity search.
+
+Kept free of model imports so migrations can use it too.
+"""
+import csv
+import math
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+# --- CONFIGURATION ---
+# CSV of `name,region,latitude,longitude` places that locations are resolved
+# against. The bundled file covers the main US metro areas; point this at a
+# larger export (e.g. GeoNames cities) for wider coverage. No network calls.
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "gazetteer.csv"))
+# Stored geohash length: 9 characters is a ~5 m cell
+GEOHASH_PRECISION = 9
+# Most geohash prefixes a bounding-box lookup expands into
+MAX_CELLS = 16
+EARTH_RADIUS_KM = 6371.0088
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+COORDINATES_RE = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$")
+ZIP_RE = re.compile(r"\s+\d{5}(?:-\d{4})?$")
+
+
+# --- GAZETTEER ---
+def _normalize(value: str) -> str:
+    return " ".join(value.lower().replace(".", "").split())
+
+
+def load_gazetteer(path: str = GAZETTEER_PATH) -> Dict[str, Tuple[float, float]]:
+    """Map "city, region" and bare "city" (first entry wins) to coordinates."""
+    places = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            point = (float(row["latitude"]), float(row["longitude"]))
+            name = _normalize(row["name"])
+            places.setdefault(f"{name}, {_normalize(row['region'])}", point)
+            places.setdefault(name, point)
+    return places
+
+
+_gazetteer = None
+
+
+def parse_point(value: str) -> Optional[Tuple[float, float]]:
+    """`"lat,lon"` as floats, or None when `value` is not a valid coordinate pair."""
+    match = COORDINATES_RE.match(value or "")
+    if not match:
+        return None
+    lat, lon = float(match.group(1)), float(match.group(2))
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def geocode(location: str) -> Optional[Tuple[float, float]]:
+    """Resolve a free-text location ("Brooklyn, NY", "40.7,-73.9") to `(lat, lon)`."""
+    global _gazetteer
+    point = parse_point(location)
+    if point or not location:
+        return point
+    if _gazetteer is None:
+        _gazetteer = load_gazetteer()
+    text = ZIP_RE.sub("", _normalize(location))
+    parts = [p.strip() for p in text.split(",") if p.strip()]
+    if not parts:
+        return None
+    if len(parts) > 1 and f"{parts[0]}, {parts[1]}" in _gazetteer:
+        return _gazetteer[f"{parts[0]}, {parts[1]}"]
+    return _gazetteer.get(parts[0])
+
+
+def service_location(location: str) -> dict:
+    """Columns to store with a service at `location`; all None when it cannot be resolved."""
+    point = geocode(location)
+    if point is None:
+        return {"latitude": None, "longitude": None, "geohash": None}
+    return {"latitude": point[0], "longitude": point[1], "geohash": encode_geohash(*point)}
+
+
+# --- GEOHASH ---
+def encode_geohash(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        target, span = (lon, lon_range) if even else (lat, lat_range)
+        middle = (span[0] + span[1]) / 2
+        value <<= 1
+        if target >= middle:
+            value |= 1
+            span[0] = middle
+        else:
+            span[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def _cell_size(precision: int) -> Tuple[float, float]:
+    """(latitude, longitude) extent in degrees of a geohash cell of this length."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def covering_cells(box: Tuple[float, float, float, float], max_cells: int = MAX_CELLS):
+    """Geohash prefixes whose cells together cover `box` (min_lat, max_lat, min_lon, max_lon).
+
+    Uses the longest prefix that needs at most `max_cells` cells, so each
+    prefix is one short range scan on the geohash index.
+    """
+    min_lat, max_lat, min_lon, max_lon = box
+    precision = 1
+    for candidate in range(1, GEOHASH_PRECISION + 1):
+        lat_step, lon_step = _cell_size(candidate)
+        rows = math.floor(max_lat / lat_step) - math.floor(min_lat / lat_step) + 1
+        columns = math.floor(max_lon / lon_step) - math.floor(min_lon / lon_step) + 1
+        if rows * columns > max_cells:
+            break
+        precision = candidate
+    lat_step, lon_step = _cell_size(precision)
+    cells = set()
+    lat = min_lat
+    while True:
+        lon = min_lon
+        while True:
+            cells.add(encode_geohash(lat, lon, precision))
+            if lon >= max_lon:
+                break
+            lon = min(lon + lon_step, max_lon)
+        if lat >= max_lat:
+            break
+        lat = min(lat + lat_step, max_lat)
+    return sorted(cells)
+
+
+# --- DISTANCE ---
+def bounding_box(lat: float, lon: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """(min_lat, max_lat, min_lon, max_lon) containing every point within `radius_km`.
+
+    Near the poles, or where the circle crosses the antimeridian, the box
+    spans every longitude instead of wrapping.
+    """
+    d_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = lat - d_lat, lat + d_lat
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0
+    d_lon = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat)))))
+    min_lon, max_lon = lon - d_lon, lon + d_lon
+    if min_lon < -180 or max_lon > 180:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, min_lon, max_lon
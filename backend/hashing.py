@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+# --- CONFIGURATION ---
+# Processes dedicated to password hashing; 0 hashes on the threadpool instead
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+# Hash jobs allowed to wait for a worker before new logins get a 503
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "256"))
+# bcrypt cost factor. Raising it upgrades existing hashes on their next login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+try:
+    import bcrypt  # noqa: F401
+
+    hash_schemes = ["bcrypt", "pbkdf2_sha256"]
+    default_scheme = "bcrypt"
+except ImportError:
+    hash_schemes = ["pbkdf2_sha256"]
+    default_scheme = "pbkdf2_sha256"
+    print(
+        "Warning: 'bcrypt' package not available. Falling back to PBKDF2 hashes. "
+        "Install 'bcrypt' for stronger security."
+    )
+
+pwd_context = CryptContext(
+    schemes=hash_schemes,
+    default=default_scheme,
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+)
+
+
+class HashPoolBusy(Exception):
+    """Raised when more than HASH_MAX_PENDING hash jobs are already queued."""
+
+
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def get_password_hash(password):
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    # Returns a fresh hash when the stored one uses an outdated scheme or cost
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+_executor = None
+_pending = 0
+_inflight = {}
+
+
+def _get_executor():
+    global _executor
+    if _executor is None and HASH_WORKERS > 0:
+        _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+    return _executor
+
+
+def stats() -> dict:
+    return {"pending": _pending, "workers": HASH_WORKERS, "max_pending": HASH_MAX_PENDING}
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _submit(fn, *args):
+    global _pending
+    if _pending >= HASH_MAX_PENDING:
+        raise HashPoolBusy()
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    return await _submit(get_password_hash, password)
+
+
+async def verify_and_update_password(email: str, password: str, hashed_password: str):
+    """Verify off the event loop, returning `(ok, new_hash_or_None)`.
+
+    Concurrent logins with the same email and password share one verify
+    instead of each paying the full bcrypt cost.
+    """
+    key = (email, hashlib.sha256(password.encode()).digest(), hashed_password)
+    future = _inflight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_submit(_verify_and_update, password, hashed_password))
+        _inflight[key] = future
+        future.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(future)
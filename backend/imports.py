@@ -0,0 +1,143 @@
+import codecs
+import csv
+import json
+import math
+import os
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException
+
+# --- CONFIGURATION ---
+MAX_IMPORT_ROWS = int(os.getenv("MAX_IMPORT_ROWS", "50000"))
+# Rows handed to the database per executemany
+IMPORT_BATCH_ROWS = int(os.getenv("IMPORT_BATCH_ROWS", "1000"))
+DEFAULT_IMAGE_URL = "https://via.placeholder.com/400"
+
+IMPORT_FORMATS = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+def import_format(content_type: str) -> Optional[str]:
+    return IMPORT_FORMATS.get(content_type.split(";")[0].strip().lower())
+
+
+async def _lines(chunks: AsyncIterator[bytes]):
+    """Yield `(line_number, text)` from a byte stream, decoding UTF-8 incrementally."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    number = 0
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *complete, pending = pending.split("\n")
+        for line in complete:
+            number += 1
+            yield number, line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield number + 1, pending.rstrip("\r")
+
+
+async def _ndjson_records(chunks):
+    async for number, line in _lines(chunks):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None, "Invalid JSON"
+            continue
+        if not isinstance(record, dict):
+            yield number, None, "Each line must be a JSON object"
+            continue
+        yield number, record, None
+
+
+async def _csv_records(chunks):
+    header = None
+    buffered, start = [], 0
+    async for number, line in _lines(chunks):
+        if not buffered:
+            start = number
+        buffered.append(line)
+        text = "\n".join(buffered)
+        if text.count('"') % 2:
+            # Quoted field continues on the next line
+            continue
+        buffered = []
+        if not text.strip():
+            continue
+        try:
+            values = next(csv.reader([text]))
+        except csv.Error as e:
+            yield start, None, f"Invalid CSV: {e}"
+            continue
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            continue
+        if len(values) != len(header):
+            yield start, None, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        yield start, dict(zip(header, values)), None
+    if buffered:
+        yield start, None, "Unterminated quoted field"
+
+
+def _text(record: dict, name: str, required: bool = False) -> str:
+    value = record.get(name)
+    if value is None:
+        value = ""
+    if not isinstance(value, str):
+        raise ValueError(f"'{name}' must be a string")
+    value = value.strip()
+    if required and not value:
+        raise ValueError(f"'{name}' is required")
+    return value
+
+
+def validate_service_row(record: dict) -> dict:
+    """Columns for one imported service; raises ValueError with a message for the caller."""
+    try:
+        price = float(record.get("price"))
+    except (TypeError, ValueError):
+        raise ValueError("'price' must be a number")
+    if not math.isfinite(price) or price < 0:
+        raise ValueError("'price' must be zero or more")
+    return {
+        "title": _text(record, "title", required=True),
+        "description": _text(record, "description"),
+        "category": _text(record, "category", required=True),
+        "location": _text(record, "location"),
+        "price": price,
+        "image_url": _text(record, "image_url") or DEFAULT_IMAGE_URL,
+    }
+
+
+async def read_import_batches(chunks: AsyncIterator[bytes], fmt: str, batch_rows: int = IMPORT_BATCH_ROWS):
+    """Parse a CSV (with header row) or NDJSON body as it streams in.
+
+    Yields `(rows, errors)` every `batch_rows` valid rows; `errors` holds
+    `{"line": n, "error": message}` for the rows that were skipped.
+    """
+    records = _csv_records(chunks) if fmt == "csv" else _ndjson_records(chunks)
+    rows, errors, seen = [], [], 0
+    async for number, record, error in records:
+        seen += 1
+        if seen > MAX_IMPORT_ROWS:
+            raise HTTPException(status_code=413, detail=f"Imports are limited to {MAX_IMPORT_ROWS} rows")
+        if error is None:
+            try:
+                rows.append(validate_service_row(record))
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            errors.append({"line": number, "error": error})
+        if len(rows) >= batch_rows:
+            yield rows, errors
+            rows, errors = [], []
+    if rows or errors:
+        yield rows, errors
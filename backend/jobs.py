@@ -0,0 +1,365 @@
+"""Durable background jobs for the work that follows a write.
+
+A handler enqueues a job on the session of its write, so the job exists
+exactly when the write commits and the request can return right away.
+Workers claim due jobs in batches and run each one in a transaction of its
+own that also marks it done: a job's database changes and its completion
+commit together, so a crash or a retry never applies them twice. Failures
+are retried with exponential backoff up to JOB_MAX_ATTEMPTS, then kept as
+"failed" for `python -m backend.manage retry-jobs`.
+
+Claiming is one UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED)
+RETURNING, so on Postgres any number of workers share the table; SQLite
+runs the same statement under its write lock. A claim is a lease: the job
+of a worker that died is claimed again once locked_until has passed.
+
+Every API process runs a worker in its lifespan (JOBS_IN_PROCESS), woken as
+soon as the process commits a job. More run on their own with
+`python -m backend.manage worker`. Cache invalidations made by a job reach
+other processes only when CACHE_URL points at Redis.
+"""
+import asyncio
+import json
+import os
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional
+
+import anyio
+from sqlalchemy import and_, delete, event as sa_event, func, or_, select, update
+from sqlalchemy.orm import Session
+
+try:
+    from .cache import response_cache, service_change_tags
+    from .metrics import Counter, Histogram, registry, stats_gauge
+    from .models import Job, SessionLocal, Service, rating_increment
+    from .scheduling import utc
+    from .uploads import create_variants, storage
+except ImportError:
+    from cache import response_cache, service_change_tags
+    from metrics import Counter, Histogram, registry, stats_gauge
+    from models import Job, SessionLocal, Service, rating_increment
+    from scheduling import utc
+    from uploads import create_variants, storage
+
+# --- CONFIGURATION ---
+# Run a worker inside each API process
+JOBS_IN_PROCESS = os.getenv("JOBS_IN_PROCESS", "1").lower() in ("1", "true", "yes")
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "20"))
+# Idle workers look for due jobs this often
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+# How long a claimed job is left to its worker before others may take it
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "8"))
+# Delay before the first retry; it doubles with each attempt up to the max
+JOB_BACKOFF_SECONDS = float(os.getenv("JOB_BACKOFF_SECONDS", "2"))
+JOB_BACKOFF_MAX_SECONDS = float(os.getenv("JOB_BACKOFF_MAX_SECONDS", "600"))
+# Finished jobs, and with them their idempotency keys, are kept this long
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+ENQUEUED_KEY = "jobs_enqueued"
+ON_COMMIT_KEY = "on_commit"
+PRUNE_INTERVAL_SECONDS = 60
+
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+JOBS_PROCESSED = registry.register(Counter(
+    "jobs_processed_total", "Background jobs run by this process, by kind and outcome", ("kind", "outcome")))
+JOB_WAIT = registry.register(Histogram(
+    "job_wait_seconds", "Time from a job falling due to a worker starting it", ("kind",), WAIT_BUCKETS))
+JOB_DURATION = registry.register(Histogram(
+    "job_duration_seconds", "Run time of background jobs", ("kind",)))
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# --- PRODUCING ---
+_handlers: Dict[str, Callable] = {}
+
+
+def handler(kind: str):
+    """Register `fn(db, payload)` as the handler of jobs of `kind`."""
+    def register(fn):
+        _handlers[kind] = fn
+        return fn
+
+    return register
+
+
+def enqueue(db: Session, kind: str, payload: dict, key: Optional[str] = None, delay: float = 0) -> None:
+    """Add a job to `db`'s transaction; workers see it once that commits.
+
+    A job whose `key` is already in the table is dropped.
+    """
+    now = utcnow()
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    db.execute(
+        upsert(Job)
+        .values(
+            kind=kind,
+            payload=json.dumps(payload, separators=(",", ":")),
+            idempotency_key=key,
+            status=QUEUED,
+            attempts=0,
+            run_at=now + timedelta(seconds=delay),
+            created_at=now,
+        )
+        .on_conflict_do_nothing(index_elements=[Job.idempotency_key])
+    )
+    db.info[ENQUEUED_KEY] = True
+
+
+def on_commit(db: Session, fn: Callable[[], None]) -> None:
+    """Call `fn` once `db` commits; forget it if the transaction rolls back."""
+    db.info.setdefault(ON_COMMIT_KEY, []).append(fn)
+
+
+# Wakes this process's worker; set while one is serving
+_wakeup: Optional[Callable[[], None]] = None
+
+
+@sa_event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    for fn in session.info.pop(ON_COMMIT_KEY, None) or ():
+        try:
+            fn()
+        except Exception as e:
+            print(f"After-commit callback failed: {e}")
+    if session.info.pop(ENQUEUED_KEY, False) and _wakeup is not None:
+        _wakeup()
+
+
+@sa_event.listens_for(Session, "after_soft_rollback")
+def _after_rollback(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop(ON_COMMIT_KEY, None)
+        session.info.pop(ENQUEUED_KEY, None)
+
+
+# --- WORKER ---
+def backoff(attempts: int) -> timedelta:
+    """Delay before retrying a job that failed its `attempts`-th run, with jitter."""
+    delay = min(JOB_BACKOFF_MAX_SECONDS, JOB_BACKOFF_SECONDS * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+class Worker:
+    def __init__(self, name: Optional[str] = None, batch_size: int = JOB_BATCH_SIZE):
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.batch_size = batch_size
+        self._pruned_at = 0.0
+
+    def claim(self) -> list:
+        """Lease up to batch_size due jobs, oldest first."""
+        now = utcnow()
+        due = (
+            select(Job.id)
+            .where(or_(
+                and_(Job.status == QUEUED, Job.run_at <= now),
+                and_(Job.status == RUNNING, Job.locked_until < now),
+            ))
+            .order_by(Job.run_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        with SessionLocal() as db:
+            jobs = db.execute(
+                update(Job)
+                .where(Job.id.in_(due))
+                .values(
+                    status=RUNNING,
+                    attempts=Job.attempts + 1,
+                    locked_until=now + timedelta(seconds=JOB_LEASE_SECONDS),
+                )
+                .returning(Job.id, Job.kind, Job.payload, Job.attempts, Job.run_at),
+                execution_options={"synchronize_session": False},
+            ).all()
+            db.commit()
+        return jobs
+
+    def run(self, job) -> str:
+        """Run one claimed job and record its outcome: done, retry, failed or lost."""
+        job_id, kind, payload, attempts, run_at = job
+        started = time.perf_counter()
+        JOB_WAIT.observe(max(0.0, (utcnow() - utc(run_at)).total_seconds()), kind)
+        # Only the holder of the latest claim may settle the job
+        ours = and_(Job.id == job_id, Job.status == RUNNING, Job.attempts == attempts)
+        with SessionLocal() as db:
+            try:
+                fn = _handlers.get(kind)
+                if fn is None:
+                    raise LookupError(f"No handler for job kind '{kind}'")
+                fn(db, json.loads(payload))
+                settled = db.execute(
+                    update(Job).where(ours).values(status=DONE, locked_until=None, finished_at=utcnow()),
+                    execution_options={"synchronize_session": False},
+                ).rowcount
+                if settled:
+                    db.commit()
+                    outcome = DONE
+                else:
+                    # The lease ran out and another worker has the job now
+                    db.rollback()
+                    outcome = "lost"
+            except Exception as e:
+                db.rollback()
+                retry = attempts < JOB_MAX_ATTEMPTS
+                now = utcnow()
+                settled = db.execute(
+                    update(Job)
+                    .where(ours)
+                    .values(
+                        status=QUEUED if retry else FAILED,
+                        run_at=now + backoff(attempts) if retry else Job.run_at,
+                        locked_until=None,
+                        last_error=f"{type(e).__name__}: {e}"[:2000],
+                        finished_at=None if retry else now,
+                    ),
+                    execution_options={"synchronize_session": False},
+                ).rowcount
+                db.commit()
+                outcome = ("retry" if retry else FAILED) if settled else "lost"
+                print(f"Job {job_id} ({kind}) attempt {attempts} failed: {e}")
+        JOB_DURATION.observe(time.perf_counter() - started, kind)
+        JOBS_PROCESSED.inc(kind, outcome)
+        return outcome
+
+    def run_batch(self) -> int:
+        """Claim and run one batch; the number of jobs it had."""
+        jobs = self.claim()
+        for job in jobs:
+            self.run(job)
+        if time.monotonic() - self._pruned_at > PRUNE_INTERVAL_SECONDS:
+            self._pruned_at = time.monotonic()
+            prune()
+        return len(jobs)
+
+    def run_forever(self, stop: threading.Event) -> None:
+        """Blocking loop for a standalone worker process, until `stop` is set."""
+        while not stop.is_set():
+            try:
+                count = self.run_batch()
+            except Exception as e:
+                print(f"Job worker {self.name}: {e}")
+                count = 0
+            if count < self.batch_size:
+                stop.wait(JOB_POLL_SECONDS)
+
+    async def serve(self) -> None:
+        """Run jobs until cancelled, waking early when this process commits one."""
+        global _wakeup
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+
+        def wakeup():
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(wake.set)
+
+        _wakeup = wakeup
+        try:
+            while True:
+                wake.clear()
+                try:
+                    count = await anyio.to_thread.run_sync(self.run_batch)
+                except Exception as e:
+                    print(f"Job worker {self.name}: {e}")
+                    count = 0
+                if count < self.batch_size:
+                    try:
+                        await asyncio.wait_for(wake.wait(), JOB_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            _wakeup = None
+
+
+def prune() -> int:
+    """Delete finished jobs past JOB_RETENTION_HOURS; failed ones are kept."""
+    cutoff = utcnow() - timedelta(hours=JOB_RETENTION_HOURS)
+    with SessionLocal() as db:
+        count = db.execute(
+            delete(Job).where(Job.status == DONE, Job.finished_at < cutoff),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+        db.commit()
+    return count
+
+
+def retry_failed(db: Session) -> int:
+    """Queue every failed job again with a fresh set of attempts. The caller commits."""
+    return db.execute(
+        update(Job)
+        .where(Job.status == FAILED)
+        .values(status=QUEUED, attempts=0, run_at=utcnow(), finished_at=None),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+
+
+def queue_stats() -> dict:
+    """Jobs waiting, running and failed, and how long the oldest due job has waited."""
+    now = utcnow()
+    with SessionLocal() as db:
+        counts = dict(
+            db.query(Job.status, func.count(Job.id))
+            .filter(Job.status.in_([QUEUED, RUNNING, FAILED]))
+            .group_by(Job.status)
+            .all()
+        )
+        oldest = db.query(func.min(Job.run_at)).filter(Job.status == QUEUED, Job.run_at <= now).scalar()
+    return {
+        QUEUED: counts.get(QUEUED, 0),
+        RUNNING: counts.get(RUNNING, 0),
+        FAILED: counts.get(FAILED, 0),
+        "oldest_due_seconds": (now - utc(oldest)).total_seconds() if oldest else 0.0,
+    }
+
+
+stats_gauge("job_queue", "Background jobs by state, and the wait of the oldest due job", queue_stats)
+
+
+# --- HANDLERS ---
+def _invalidate_service(db: Session, service_id: int, service) -> None:
+    if service is not None:
+        tags = service_change_tags(service_id, service.provider_id, service.category)
+        on_commit(db, lambda: response_cache.invalidate(*tags))
+
+
+@handler("review.rating")
+def fold_review_rating(db: Session, payload: dict) -> None:
+    """Add one review to its service's rating aggregate."""
+    service_id = payload["service_id"]
+    service = db.execute(
+        update(Service)
+        .where(Service.id == service_id)
+        .values(**rating_increment(payload["rating"]))
+        .returning(Service.provider_id, Service.category),
+        execution_options={"synchronize_session": False},
+    ).first()
+    _invalidate_service(db, service_id, service)
+
+
+@handler("image.variants")
+def attach_image_variants(db: Session, payload: dict) -> None:
+    """Make the thumbnail and WebP copy of a service image and list the service with the thumbnail."""
+    thumbnail = create_variants(payload["file_name"])
+    if thumbnail is None:
+        return
+    service_id = payload["service_id"]
+    service = db.execute(
+        update(Service)
+        # Unless the image has been replaced since
+        .where(Service.id == service_id, Service.image_url == payload["image_url"])
+        .values(thumbnail_url=storage.url(thumbnail))
+        .returning(Service.provider_id, Service.category),
+        execution_options={"synchronize_session": False},
+    ).first()
+    _invalidate_service(db, service_id, service)
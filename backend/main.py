@@ -1,44 +1,197 @@
+import asyncio
+import functools
+import inspect
 import os
-import shutil
 import uuid
-from datetime import datetime, timedelta, timezone
-from typing import Optional
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional
+from urllib.parse import urlencode
 
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form, Request
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, status, File, UploadFile, Form, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 # IMPORTANT: Make sure you have python-jose installed, NOT jose
 # If you get syntax errors, run: pip uninstall jose && pip install python-jose[cryptography]
 try:
-    from jose import jwt
+    from jose import JWTError, jwt
 except SyntaxError:
     # If you get here, you have the wrong 'jose' package installed
     # Run: pip uninstall jose && pip install python-jose[cryptography]
     raise ImportError(
         "Wrong 'jose' package detected. Please run: pip uninstall jose && pip install python-jose[cryptography]"
     )
-
-# JWTError is not used in this code, but if needed:
-JWTError = Exception  # Simple fallback
+import httpx
 from pydantic import BaseModel
+from sqlalchemy import func, insert, text, update
 from sqlalchemy.orm import Session
 
 try:
-    from .models import SessionLocal, User, Service, Booking, Review
+    from .auth import revocations, token_cache
+    from .events import booking_event, broker
+    from .facets import service_facets
+    from .geo import geocode, service_location
+    from .imports import import_format, read_import_batches
+    from .jobs import JOBS_IN_PROCESS, Worker, enqueue
+    from .hashing import HashPoolBusy, hash_password, verify_and_update_password, shutdown as shutdown_hashing
+    from .hashing import stats as hashing_stats
+    from .media import router as media_router
+    from .storage import UPLOAD_DIR
+    from .uploads import UploadLimitMiddleware, save_upload, shutdown as shutdown_uploads
+    from .cache import response_cache, service_change_tags, service_listing_tags
+    from .metrics import MetricsMiddleware, PROMETHEUS_CONTENT_TYPE, instrument_engine, render, stats_gauge
+    from .migrate import upgrade_database
+    from .models import (
+        AsyncSessionLocal,
+        DB_ASYNC,
+        async_engine,
+        DB_AUTO_MIGRATE,
+        SessionLocal,
+        engine,
+        bump_provider_stats,
+        bump_provider_stats_many,
+        User,
+        Service,
+        Booking,
+        BookingView,
+        ProviderStats,
+        Review,
+        ServiceHours,
+    )
+    from .replicas import ReadYourWritesMiddleware, replicas
+    from .pagination import (
+        KeysetOrder,
+        NEXT_CURSOR_HEADER,
+        clamp_limit,
+        decode_cursor,
+        encode_cursor,
+        paginate,
+        paginate_ranked,
+        set_next_cursor,
+    )
+    from .scheduling import (
+        DEFAULT_SLOT_MINUTES,
+        MAX_AVAILABILITY_DAYS,
+        busy_intervals,
+        format_clock,
+        free_slots,
+        load_calendars,
+        opening_windows,
+        parse_clock,
+        reserve,
+        service_zone,
+        slots,
+        utc,
+        within_hours,
+    )
+    from .search import Matches, apply_text_search, distance_km, index_service, nearest_services, within_radius
+    from .serializers import (
+        FastJSONResponse,
+        booking_rows,
+        booking_view_rows,
+        review_rows,
+        serialize_booking,
+        serialize_bookings,
+        serialize_reviews,
+        serialize_service,
+        serialize_services,
+        service_rows,
+    )
 except ImportError:
-    from models import SessionLocal, User, Service, Booking, Review
+    from auth import revocations, token_cache
+    from events import booking_event, broker
+    from facets import service_facets
+    from geo import geocode, service_location
+    from imports import import_format, read_import_batches
+    from jobs import JOBS_IN_PROCESS, Worker, enqueue
+    from hashing import HashPoolBusy, hash_password, verify_and_update_password, shutdown as shutdown_hashing
+    from hashing import stats as hashing_stats
+    from media import router as media_router
+    from storage import UPLOAD_DIR
+    from uploads import UploadLimitMiddleware, save_upload, shutdown as shutdown_uploads
+    from cache import response_cache, service_change_tags, service_listing_tags
+    from metrics import MetricsMiddleware, PROMETHEUS_CONTENT_TYPE, instrument_engine, render, stats_gauge
+    from migrate import upgrade_database
+    from models import (
+        AsyncSessionLocal,
+        DB_ASYNC,
+        async_engine,
+        DB_AUTO_MIGRATE,
+        SessionLocal,
+        engine,
+        bump_provider_stats,
+        bump_provider_stats_many,
+        User,
+        Service,
+        Booking,
+        BookingView,
+        ProviderStats,
+        Review,
+        ServiceHours,
+    )
+    from replicas import ReadYourWritesMiddleware, replicas
+    from pagination import (
+        KeysetOrder,
+        NEXT_CURSOR_HEADER,
+        clamp_limit,
+        decode_cursor,
+        encode_cursor,
+        paginate,
+        paginate_ranked,
+        set_next_cursor,
+    )
+    from scheduling import (
+        DEFAULT_SLOT_MINUTES,
+        MAX_AVAILABILITY_DAYS,
+        busy_intervals,
+        format_clock,
+        free_slots,
+        load_calendars,
+        opening_windows,
+        parse_clock,
+        reserve,
+        service_zone,
+        slots,
+        utc,
+        within_hours,
+    )
+    from search import Matches, apply_text_search, distance_km, index_service, nearest_services, within_radius
+    from serializers import (
+        FastJSONResponse,
+        booking_rows,
+        booking_view_rows,
+        review_rows,
+        serialize_booking,
+        serialize_bookings,
+        serialize_reviews,
+        serialize_service,
+        serialize_services,
+        service_rows,
+    )
 
 # --- CONFIGURATION ---
 SECRET_KEY = "super-secret-key-change-this-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
-UPLOAD_DIR = "uploads"
-
-# Ensure upload directory exists
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Rows accepted by one bulk booking or batch status request
+MAX_BATCH_ROWS = int(os.getenv("MAX_BATCH_ROWS", "1000"))
+# Proximity search (`near=`): radius used when none is given, and the largest accepted
+DEFAULT_RADIUS_KM = float(os.getenv("DEFAULT_RADIUS_KM", "25"))
+MAX_RADIUS_KM = float(os.getenv("MAX_RADIUS_KM", "500"))
+# Fetch the hot listing pages at startup so the response cache, pools and
+# search index are warm before /health/ready admits traffic
+PREWARM = os.getenv("PREWARM", "1").lower() in ("1", "true", "yes")
+# Category pages warmed, busiest first
+PREWARM_CATEGORIES = int(os.getenv("PREWARM_CATEGORIES", "20"))
+# Longest a readiness probe waits for the database
+READY_DB_TIMEOUT = float(os.getenv("READY_DB_TIMEOUT", "2"))
+# Frontend origins allowed to call the API with cookies (comma separated).
+# Credentialed requests need them spelled out: browsers reject a "*" answer.
+CORS_ORIGINS = [o.strip() for o in os.getenv(
+    "CORS_ORIGINS", "http://localhost:3000,http://127.0.0.1:3000"
+).split(",") if o.strip()]
 
 # --- PYDANTIC SCHEMAS (Request/Response) ---
 class UserResponse(BaseModel):
@@ -65,11 +218,30 @@ class RegisterRequest(BaseModel):
 class BookingCreate(BaseModel):
     service_id: str
     user_id: str
-    booking_date: str
+    # A day (YYYY-MM-DD), which books its first free slot, or the exact start of a slot
+    booking_date: Optional[str] = None
+    start_at: Optional[datetime] = None
 
 class BookingStatusUpdate(BaseModel):
     status: str
 
+class BulkBookingCreate(BaseModel):
+    bookings: List[BookingCreate]
+
+class BookingStatusBatch(BaseModel):
+    booking_ids: List[int]
+    status: str
+
+class OpeningHours(BaseModel):
+    weekday: int
+    opens: str
+    closes: str
+
+class ServiceHoursUpdate(BaseModel):
+    timezone: str = "UTC"
+    slot_minutes: int = DEFAULT_SLOT_MINUTES
+    hours: List[OpeningHours]
+
 class ReviewCreate(BaseModel):
     service_id: str
     user_id: str
@@ -77,46 +249,116 @@ class ReviewCreate(BaseModel):
     comment: str
 
 # --- AUTH UTILS ---
-try:
-    import bcrypt  # noqa: F401
-
-    hash_schemes = ["bcrypt", "pbkdf2_sha256"]
-    default_scheme = "bcrypt"
-except ImportError:
-    hash_schemes = ["pbkdf2_sha256"]
-    default_scheme = "pbkdf2_sha256"
-    print(
-        "Warning: 'bcrypt' package not available. Falling back to PBKDF2 hashes. "
-        "Install 'bcrypt' for stronger security."
-    )
-
-pwd_context = CryptContext(schemes=hash_schemes, default=default_scheme, deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    # jti identifies the token in the revocation list
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def _session_options(request: Request) -> dict:
+    """Reads go to a replica when one is configured and healthy (see replicas.py)."""
+    replica = replicas.for_request(request)
+    if replica is None:
+        return {}
+    return {"bind": replica.async_engine if DB_ASYNC else replica.engine}
+
+if DB_ASYNC:
+    async def get_db(request: Request):
+        async with AsyncSessionLocal(**_session_options(request)) as db:
+            yield db
+else:
+    def get_db(request: Request):
+        db = SessionLocal(**_session_options(request))
+        try:
+            yield db
+        finally:
+            db.close()
+
+async def run_db(db, fn, *args, **kwargs):
+    """Run `fn(session, *args, **kwargs)` without blocking the event loop.
+
+    In async mode the sync code runs through `AsyncSession.run_sync` on the
+    async driver; otherwise it is handed to the threadpool.
+    """
+    if DB_ASYNC:
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+def db_handler(fn):
+    """Serve a sync `db` handler as a coroutine when DB_ASYNC is enabled.
+
+    The handler body is unchanged: it receives the sync Session that backs
+    the request's AsyncSession. In sync mode the handler is returned as-is and
+    FastAPI runs it in the threadpool.
+    """
+    if not DB_ASYNC:
+        return fn
+
+    @functools.wraps(fn)
+    async def wrapper(**kwargs):
+        db = kwargs.pop("db")
+        return await db.run_sync(lambda session: fn(db=session, **kwargs))
+
+    wrapper.__signature__ = inspect.signature(fn)
+    return wrapper
+
+def _user_by_id(db: Session, user_id: int):
+    user = db.get(User, user_id)
+    return _user_payload(user) if user else None
+
+async def _run_session(fn, *args):
+    """Run `fn(session, *args)` on a short-lived session of its own, outside a request's."""
+    if DB_ASYNC:
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(fn, *args)
+
+    def call():
+        with SessionLocal() as db:
+            return fn(db, *args)
+
+    return await run_in_threadpool(call)
+
+async def _load_user(user_id: int):
+    return await _run_session(_user_by_id, user_id)
+
+async def _verified_token(token: str = Depends(oauth2_scheme)):
+    """Decode and check a bearer token, memoized in `token_cache`.
+
+    A cache hit costs a dict lookup and a revocation check; only a miss pays
+    for the signature check and the user query.
+    """
+    unauthorized = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    entry = token_cache.get(token)
+    if entry is None:
+        try:
+            claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            user_id = int(claims["id"])
+        except (JWTError, KeyError, TypeError, ValueError):
+            raise unauthorized
+        user = await _load_user(user_id)
+        if user is None:
+            raise unauthorized
+        entry = token_cache.put(token, claims, user)
+    if revocations.is_revoked(entry.jti):
+        raise unauthorized
+    return token, entry
+
+async def get_current_user(verified=Depends(_verified_token)) -> dict:
+    return verified[1].user
 
 # --- API ---
-app = FastAPI()
+# Routes are collected on `router`; create_app() at the bottom of this module
+# mounts them together with the middleware and the lifespan hooks.
+router = APIRouter()
 
 # Global exception handler
-@app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     import traceback
     print(f"Unhandled exception: {exc}")
@@ -126,191 +368,392 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"detail": f"Internal server error: {str(exc)}"}
     )
 
-# CORS: Allow frontend to communicate
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"], # In production, replace with ["http://localhost:3000"]
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Latency, response size and SQL/pool usage per route, served on /metrics.
+# Process-wide, so set up once however many apps are built.
+instrument_engine(engine)
+if async_engine is not None:
+    instrument_engine(async_engine, "async")
+stats_gauge("response_cache", "Response cache counters", response_cache.stats)
+stats_gauge("auth_token_cache", "Verified-token cache counters", token_cache.stats)
+stats_gauge("password_hashing", "Password hashing pool usage", hashing_stats)
+stats_gauge("auth_revocations", "Revoked token ids held in memory", revocations.stats)
+stats_gauge("event_streams", "Open booking event streams and deliveries", broker.stats)
+
+# --- LIFECYCLE ---
+
+def _prewarm_paths(db: Session) -> List[str]:
+    categories = (
+        db.query(Service.category)
+        .filter(Service.category.isnot(None))
+        .group_by(Service.category)
+        .order_by(func.count(Service.id).desc())
+        .limit(PREWARM_CATEGORIES)
+    )
+    # The home page listing, top rated, and the busiest category tabs
+    paths = ["/services", "/services?sort=rating"]
+    paths += [f"/services?{urlencode({'category': category})}" for (category,) in categories]
+    if db.get_bind().dialect.name != "postgresql":
+        # Loads the in-process search index
+        paths.append("/services?q=prewarm")
+    return paths
+
+async def _prewarm(app: FastAPI) -> None:
+    """Fetch the hot pages once through the app, then mark this worker ready."""
+    try:
+        if PREWARM:
+            paths = await _run_session(_prewarm_paths)
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://prewarm") as client:
+                for path in paths:
+                    await client.get(path)
+    except Exception as e:
+        # Cold caches make the first requests slower, not wrong: serve anyway
+        print(f"Prewarm failed: {e}")
+    app.state.ready = True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Every worker opens its own connections. Pools inherited from a parent
+    # that imported the app before forking (gunicorn --preload) are dropped
+    # without closing the parent's sockets.
+    engine.dispose(close=False)
+    if async_engine is not None:
+        await async_engine.dispose(close=False)
+    await replicas.dispose(close=False)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    if DB_AUTO_MIGRATE:
+        await run_in_threadpool(upgrade_database)
 
-# Serve uploaded images statically
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+    await broker.start(engine.url)
+    job_worker = asyncio.create_task(Worker().serve()) if JOBS_IN_PROCESS else None
+    replica_monitor = asyncio.create_task(replicas.monitor()) if replicas.replicas else None
+    revocation_sync = asyncio.create_task(revocations.monitor()) if revocations.shared else None
 
-# --- HEALTH CHECK ENDPOINT ---
-@app.get("/health")
-def health_check():
+    # /health/ready answers 503 until the caches are warm; liveness does not wait
+    app.state.ready = False
+    warmup = asyncio.create_task(_prewarm(app))
+    try:
+        yield
+    finally:
+        # The server has stopped accepting connections and let the in-flight
+        # requests finish; stop reporting ready and close the pools cleanly
+        app.state.ready = False
+        warmup.cancel()
+        if job_worker is not None:
+            # Lets the running batch finish; whatever is left waits in the table
+            job_worker.cancel()
+            await asyncio.gather(job_worker, return_exceptions=True)
+        if replica_monitor is not None:
+            replica_monitor.cancel()
+        if revocation_sync is not None:
+            revocation_sync.cancel()
+        await broker.stop()
+        shutdown_hashing()
+        shutdown_uploads()
+        engine.dispose()
+        if async_engine is not None:
+            await async_engine.dispose()
+        await replicas.dispose()
+
+# --- HEALTH CHECK ENDPOINTS ---
+@router.get("/health")
+def health_check(request: Request):
     """Health check endpoint for frontend to verify backend is running"""
-    return {"status": "ok", "message": "Backend is running"}
+    return {"status": "ok", "message": "Backend is running", "ready": request.app.state.ready}
+
+@router.get("/health/live")
+def liveness():
+    """The worker is up and answering; restart it when this fails"""
+    return {"status": "ok"}
+
+def _ping(db: Session) -> None:
+    db.execute(text("SELECT 1"))
+
+@router.get("/health/ready")
+async def readiness(request: Request):
+    """Whether to route traffic here: caches warm, not shutting down, database reachable"""
+    checks = {"warm": request.app.state.ready, "database": True}
+    try:
+        await asyncio.wait_for(_run_session(_ping), READY_DB_TIMEOUT)
+    except Exception:
+        checks["database"] = False
+    ready = all(checks.values())
+    return JSONResponse(
+        {"status": "ready" if ready else "unavailable", "checks": checks},
+        status_code=200 if ready else 503,
+    )
+
+@router.get("/cache/stats")
+def cache_stats():
+    return response_cache.stats()
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus text exposition for this worker process"""
+    return Response(render(), media_type=PROMETHEUS_CONTENT_TYPE)
 
 # --- AUTH ENDPOINTS ---
 
-@app.post("/register")
-def register(req: RegisterRequest, db: Session = Depends(get_db)):
+def _user_payload(user: User):
+    return {
+        "id": user.id,
+        "name": user.name,
+        "email": user.email,
+        "role": user.role,
+        "avatar_url": user.avatar_url
+    }
+
+def _email_registered(db: Session, email: str) -> bool:
+    return db.query(User.id).filter(User.email == email).first() is not None
+
+def _insert_user(db: Session, fields: dict):
+    new_user = User(**fields)
+    db.add(new_user)
+    db.commit()
+    db.refresh(new_user)
+    return _user_payload(new_user)
+
+def _find_user(db: Session, email: str):
+    user = db.query(User).filter(User.email == email).first()
+    return (_user_payload(user), user.hashed_password) if user else (None, None)
+
+def _store_password_hash(db: Session, user_id: int, hashed_password: str) -> None:
+    db.execute(
+        update(User).where(User.id == user_id).values(hashed_password=hashed_password),
+        execution_options={"synchronize_session": False},
+    )
+    db.commit()
+
+@router.post("/register")
+async def register(req: RegisterRequest, db: Session = Depends(get_db)):
     try:
         # Check if user exists
-        if db.query(User).filter(User.email == req.email).first():
+        if await run_db(db, _email_registered, req.email):
             raise HTTPException(status_code=400, detail="Email already registered")
         
-        # Create User
-        new_user = User(
-            name=req.name,
-            email=req.email,
-            hashed_password=get_password_hash(req.password),
-            role=req.role.upper(),
-            avatar_url=f"https://ui-avatars.com/api/?name={req.name.replace(' ', '+')}"
-        )
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        # Create User (bcrypt runs in the hashing process pool)
+        user = await run_db(db, _insert_user, {
+            "name": req.name,
+            "email": req.email,
+            "hashed_password": await hash_password(req.password),
+            "role": req.role.upper(),
+            "avatar_url": f"https://ui-avatars.com/api/?name={req.name.replace(' ', '+')}"
+        })
         
-        token = create_access_token({"sub": new_user.email, "id": new_user.id})
-        return {
-            "token": token,
-            "user": {
-                "id": new_user.id,
-                "name": new_user.name,
-                "email": new_user.email,
-                "role": new_user.role,
-                "avatar_url": new_user.avatar_url
-            }
-        }
+        token = create_access_token({"sub": user["email"], "id": user["id"]})
+        return {"token": token, "user": user}
     except HTTPException:
         raise
+    except HashPoolBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
     except Exception as e:
-        db.rollback()
+        await run_db(db, Session.rollback)
         raise HTTPException(status_code=500, detail=f"Registration failed: {str(e)}")
 
-@app.post("/login")
-def login(req: LoginRequest, db: Session = Depends(get_db)):
+@router.post("/login")
+async def login(req: LoginRequest, db: Session = Depends(get_db)):
     try:
-        user = db.query(User).filter(User.email == req.email).first()
-        if not user or not verify_password(req.password, user.hashed_password):
+        user, hashed_password = await run_db(db, _find_user, req.email)
+        if not user:
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+        valid, new_hash = await verify_and_update_password(req.email, req.password, hashed_password)
+        if not valid:
             raise HTTPException(status_code=401, detail="Invalid credentials")
+        if new_hash:
+            # Stored hash predates the configured scheme/cost: upgrade it now
+            await run_db(db, _store_password_hash, user["id"], new_hash)
         
-        token = create_access_token({"sub": user.email, "id": user.id})
-        return {
-            "token": token,
-            "user": {
-                "id": user.id,
-                "name": user.name,
-                "email": user.email,
-                "role": user.role,
-                "avatar_url": user.avatar_url
-            }
-        }
+        token = create_access_token({"sub": user["email"], "id": user["id"]})
+        return {"token": token, "user": user}
     except HTTPException:
         raise
+    except HashPoolBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Login failed: {str(e)}")
 
+@router.get("/me")
+async def read_current_user(user: dict = Depends(get_current_user)):
+    return user
+
+@router.post("/logout")
+async def logout(verified=Depends(_verified_token)):
+    token, entry = verified
+    # Writes through to Redis when revocations are shared
+    await run_in_threadpool(revocations.revoke, entry.jti, float(entry.claims.get("exp", 0)))
+    token_cache.discard(token)
+    return {"message": "Logged out"}
+
 # --- SERVICE ENDPOINTS ---
 
-@app.get("/services")
+SERVICE_SORTS = {
+    "newest": KeysetOrder("newest", [Service.id]),
+    "price_asc": KeysetOrder("price_asc", [Service.price, Service.id], descending=False),
+    "price_desc": KeysetOrder("price_desc", [Service.price, Service.id]),
+    "rating": KeysetOrder("rating", [Service.rating, Service.id]),
+}
+
+@router.get("/services")
+@db_handler
 def get_services(
+    request: Request,
     q: Optional[str] = None, 
     category: Optional[str] = None, 
     location: Optional[str] = None, 
+    sort: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    near: Optional[str] = None,
+    radius: Optional[float] = None,
+    facets: bool = False,
     db: Session = Depends(get_db)
 ):
+    """List services. `near=lat,lon` (or a known place) with `radius=` km
+    returns only services within the radius, nearest first, each with its
+    `distance_km`. With `facets=true` the body is `{"services": [...],
+    "facets": {...}}`, adding category and location counts and price and
+    rating histograms for the whole result (see facets.py)."""
     try:
-        query = db.query(Service)
-        
-        if category and category != "All":
-            query = query.filter(Service.category == category)
-        if location:
-            query = query.filter(Service.location.ilike(f"%{location}%"))
-        if q:
-            search = f"%{q}%"
-            query = query.filter((Service.title.ilike(search)) | (Service.description.ilike(search)))
-            
-        services = query.all()
-        
-        # Transform to match frontend expectations
-        results = []
-        for s in services:
-            try:
-                provider_name = s.provider.name if s.provider else "Unknown"
-            except:
-                provider_name = "Unknown"
-            
-            results.append({
-                "id": s.id,
-                "provider_id": s.provider_id,
-                "provider_name": provider_name,
-                "title": s.title or "",
-                "description": s.description or "",
-                "category": s.category or "",
-                "location": s.location or "",
-                "price": float(s.price) if s.price else 0.0,
-                "image_url": s.image_url or "",
-                "rating": float(s.rating) if s.rating else 0.0,
-                "review_count": int(s.review_count) if s.review_count else 0
-            })
-        return results
+        if near:
+            point = geocode(near)
+            if point is None:
+                raise HTTPException(status_code=400, detail="near must be 'lat,lon' or a known place")
+            radius = DEFAULT_RADIUS_KM if radius is None else radius
+            if not 0 < radius <= MAX_RADIUS_KM:
+                raise HTTPException(status_code=400, detail=f"radius must be between 0 and {MAX_RADIUS_KM:g} km")
+            if sort not in (None, "distance"):
+                raise HTTPException(status_code=400, detail="Results near a point are sorted by distance")
+            sort = "distance"
+        sort = sort or ("relevance" if q else "newest")
+        if sort not in SERVICE_SORTS and not (sort == "relevance" and q) and not (sort == "distance" and near):
+            raise HTTPException(status_code=400, detail=f"Invalid sort order: {sort}")
+
+        selected_category = category if category and category != "All" else None
+
+        def build():
+            # Every filter but the category, which the facets count across.
+            # The text search runs once; the page narrows its candidates. The
+            # location match is served by the pg_trgm GIN index on Postgres.
+            filters = [Service.location.ilike(f"%{location}%")] if location else []
+            matching = service_rows(db, listing=True).filter(*filters)
+            rank = None
+            if q:
+                matching, rank = apply_text_search(db, matching, q)
+            body, headers = build_page(matching, rank, filters)
+            if not facets:
+                return body, headers
+            if near:
+                matching = within_radius(db, matching, point[0], point[1], radius)
+            return {"services": body, "facets": service_facets(db, matching, selected_category)}, headers
+
+        def build_page(query, rank, filters):
+            if selected_category:
+                filters = [*filters, Service.category == selected_category]
+                query = query.filter(filters[-1])
+
+            if sort == "distance":
+                page_size = clamp_limit(limit)
+                after = tuple(decode_cursor("distance", cursor, [float, int])) if cursor else None
+                nearest = nearest_services(db, query, point[0], point[1], radius, page_size + 1, after)
+                next_cursor = encode_cursor("distance", nearest[page_size - 1]) if len(nearest) > page_size else None
+                nearest = nearest[:page_size]
+                by_id = {
+                    row.id: row
+                    for row in service_rows(db, listing=True).filter(Service.id.in_([i for _, i in nearest]))
+                }
+                services = []
+                for sort_key, service_id in nearest:
+                    service = serialize_service(by_id[service_id])
+                    service["distance_km"] = round(distance_km(sort_key), 3)
+                    services.append(service)
+                return services, ({NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {})
+            elif sort == "relevance" and isinstance(rank, Matches):
+                # In-process index: walk the matches best first, checking the
+                # other filters a batch at a time, until one page passes
+                keep = None
+                if filters:
+                    def keep(ids):
+                        return {i for (i,) in db.query(Service.id).filter(Service.id.in_(ids), *filters)}
+                page, next_cursor = paginate_ranked(rank, cursor, limit, keep)
+                by_id = {
+                    row.id: row
+                    for row in service_rows(db, listing=True).filter(Service.id.in_([i for _, i in page]))
+                }
+                rows = [by_id[i] for _, i in page]
+            elif sort == "relevance":
+                order = KeysetOrder("relevance", [rank, Service.id])
+                rows, next_cursor = paginate(query, order, cursor, limit)
+            else:
+                rows, next_cursor = paginate(query, SERVICE_SORTS[sort], cursor, limit)
+
+            return serialize_services(rows), ({NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {})
+
+        # Category counts change with a write to any category
+        tags = service_listing_tags(None if facets else category)
+        return response_cache.respond(request, tags, build)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch services: {str(e)}")
 
-@app.get("/services/{service_id}")
-def get_service_by_id(service_id: int, db: Session = Depends(get_db)):
+@router.get("/services/{service_id}")
+@db_handler
+def get_service_by_id(service_id: int, request: Request, db: Session = Depends(get_db)):
     try:
-        s = db.query(Service).filter(Service.id == service_id).first()
-        if not s:
-            raise HTTPException(status_code=404, detail="Service not found")
-        
-        try:
-            provider_name = s.provider.name if s.provider else "Unknown"
-        except:
-            provider_name = "Unknown"
-        
-        return {
-            "id": s.id,
-            "provider_id": s.provider_id,
-            "provider_name": provider_name,
-            "title": s.title or "",
-            "description": s.description or "",
-            "category": s.category or "",
-            "location": s.location or "",
-            "price": float(s.price) if s.price else 0.0,
-            "image_url": s.image_url or "",
-            "rating": float(s.rating) if s.rating else 0.0,
-            "review_count": int(s.review_count) if s.review_count else 0
-        }
+        def build():
+            row = service_rows(db).filter(Service.id == service_id).first()
+            if not row:
+                raise HTTPException(status_code=404, detail="Service not found")
+            return serialize_service(row), {}
+
+        return response_cache.respond(request, [f"service:{service_id}"], build)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch service: {str(e)}")
 
-@app.get("/services/provider/{provider_id}")
-def get_provider_services(provider_id: int, db: Session = Depends(get_db)):
+@router.get("/services/provider/{provider_id}")
+@db_handler
+def get_provider_services(
+    provider_id: int,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
     try:
-        services = db.query(Service).filter(Service.provider_id == provider_id).all()
-        results = []
-        for s in services:
-            try:
-                provider_name = s.provider.name if s.provider else "Unknown"
-            except:
-                provider_name = "Unknown"
-            
-            results.append({
-                "id": s.id,
-                "provider_id": s.provider_id,
-                "provider_name": provider_name,
-                "title": s.title or "",
-                "description": s.description or "",
-                "category": s.category or "",
-                "location": s.location or "",
-                "price": float(s.price) if s.price else 0.0,
-                "image_url": s.image_url or "",
-                "rating": float(s.rating) if s.rating else 0.0,
-                "review_count": int(s.review_count) if s.review_count else 0
-            })
-        return results
+        query = service_rows(db, listing=True).filter(Service.provider_id == provider_id)
+        rows, next_cursor = paginate(query, SERVICE_SORTS["newest"], cursor, limit)
+        # Returned directly so the rows skip jsonable_encoder
+        response = FastJSONResponse(serialize_services(rows))
+        set_next_cursor(response, next_cursor)
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch provider services: {str(e)}")
 
-@app.post("/services")
+def _enqueue_variants(db: Session, service_id: int, stored) -> None:
+    if stored is not None and stored.variants_pending:
+        enqueue(
+            db, "image.variants",
+            {"service_id": service_id, "file_name": stored.file_name, "image_url": stored.url},
+            key=f"variants:{service_id}:{stored.file_name}",
+        )
+
+def _insert_service(db: Session, fields: dict, stored=None):
+    new_service = Service(**fields, **service_location(fields.get("location")))
+    db.add(new_service)
+    db.flush()
+    _enqueue_variants(db, new_service.id, stored)
+    db.commit()
+    db.refresh(new_service)
+    index_service(new_service)
+    response_cache.invalidate(
+        *service_change_tags(new_service.id, new_service.provider_id, new_service.category)
+    )
+    return serialize_service(service_rows(db).filter(Service.id == new_service.id).one())
+
+@router.post("/services")
 async def create_service(
     provider_id: str = Form(...),
     title: str = Form(...),
@@ -324,56 +767,49 @@ async def create_service(
     try:
         # Handle Image Upload
         image_url = "https://via.placeholder.com/400"
+        thumbnail_url = None
+        stored = None
         if image and image.filename:
-            try:
-                file_extension = image.filename.split(".")[-1] if "." in image.filename else "jpg"
-                file_name = f"{uuid.uuid4()}.{file_extension}"
-                file_path = os.path.join(UPLOAD_DIR, file_name)
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(image.file, buffer)
-                # Assuming server runs on localhost:8000
-                image_url = f"http://localhost:8000/uploads/{file_name}"
-            except Exception as e:
-                # If image upload fails, use placeholder
-                pass
-
-        new_service = Service(
-            provider_id=int(provider_id),
-            title=title,
-            description=description,
-            category=category,
-            location=location,
-            price=float(price),
-            image_url=image_url
-        )
-        db.add(new_service)
-        db.commit()
-        db.refresh(new_service)
-        
-        try:
-            provider_name = new_service.provider.name if new_service.provider else "Unknown"
-        except:
-            provider_name = "Unknown"
-        
-        # Return matched format
-        return {
-            "id": new_service.id,
-            "provider_id": new_service.provider_id,
-            "provider_name": provider_name,
-            "title": new_service.title or "",
-            "description": new_service.description or "",
-            "category": new_service.category or "",
-            "location": new_service.location or "",
-            "price": float(new_service.price) if new_service.price else 0.0,
-            "image_url": new_service.image_url or "",
-            "rating": float(new_service.rating) if new_service.rating else 0.0,
-            "review_count": int(new_service.review_count) if new_service.review_count else 0
-        }
+            # The original only; its variants are made by a job
+            stored = await save_upload(image)
+            image_url, thumbnail_url = stored.url, stored.thumbnail_url
+
+        return await run_db(db, _insert_service, {
+            "provider_id": int(provider_id),
+            "title": title,
+            "description": description,
+            "category": category,
+            "location": location,
+            "price": float(price),
+            "image_url": image_url,
+            "thumbnail_url": thumbnail_url
+        }, stored)
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await run_db(db, Session.rollback)
         raise HTTPException(status_code=500, detail=f"Failed to create service: {str(e)}")
 
-@app.put("/services/{service_id}")
+def _update_service(db: Session, service_id: int, fields: dict, stored=None):
+    service = db.query(Service).filter(Service.id == service_id).first()
+    if not service:
+        raise HTTPException(status_code=404, detail="Service not found")
+
+    old_category = service.category
+    if "location" in fields:
+        fields = {**fields, **service_location(fields["location"])}
+    for name, value in fields.items():
+        setattr(service, name, value)
+    _enqueue_variants(db, service_id, stored)
+    db.commit()
+    db.refresh(service)
+    index_service(service)
+    response_cache.invalidate(
+        *service_change_tags(service.id, service.provider_id, old_category, service.category)
+    )
+    return serialize_service(service_rows(db).filter(Service.id == service_id).one())
+
+@router.put("/services/{service_id}")
 async def update_service(
     service_id: int,
     title: str = Form(...),
@@ -385,155 +821,540 @@ async def update_service(
     db: Session = Depends(get_db)
 ):
     try:
-        service = db.query(Service).filter(Service.id == service_id).first()
-        if not service:
+        if not await run_db(db, Session.get, Service, service_id):
             raise HTTPException(status_code=404, detail="Service not found")
 
         # Update Text Fields
-        service.title = title
-        service.description = description
-        service.category = category
-        service.location = location
-        service.price = float(price)
+        fields = {
+            "title": title,
+            "description": description,
+            "category": category,
+            "location": location,
+            "price": float(price),
+        }
 
         # Handle Image Update only if provided
+        stored = None
         if image and image.filename:
-            try:
-                file_extension = image.filename.split(".")[-1] if "." in image.filename else "jpg"
-                file_name = f"{uuid.uuid4()}.{file_extension}"
-                file_path = os.path.join(UPLOAD_DIR, file_name)
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(image.file, buffer)
-                service.image_url = f"http://localhost:8000/uploads/{file_name}"
-            except Exception as e:
-                # If image upload fails, continue without updating image
-                pass
+            stored = await save_upload(image)
+            fields["image_url"] = stored.url
+            fields["thumbnail_url"] = stored.thumbnail_url
         
+        return await run_db(db, _update_service, service_id, fields, stored)
+    except HTTPException:
+        raise
+    except Exception as e:
+        await run_db(db, Session.rollback)
+        raise HTTPException(status_code=500, detail=f"Failed to update service: {str(e)}")
+
+def _insert_service_batch(db: Session, provider_id: int, rows: list) -> None:
+    db.execute(
+        insert(Service),
+        [
+            {**row, **service_location(row["location"]), "provider_id": provider_id,
+             "rating": 0.0, "review_count": 0, "rating_sum": 0}
+            for row in rows
+        ],
+    )
+
+@router.post("/services/import")
+async def import_services(
+    request: Request,
+    provider_id: int,
+    format: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Bulk-create services from a CSV (header row) or NDJSON body.
+
+    The body is parsed as it streams in and inserted in batches inside one
+    transaction. Invalid rows are skipped and reported by line number.
+    """
+    fmt = format or import_format(request.headers.get("content-type", ""))
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(status_code=415, detail="Send text/csv or application/x-ndjson")
+    try:
+        if not await run_db(db, Session.get, User, provider_id):
+            raise HTTPException(status_code=404, detail="Provider not found")
+
+        imported, errors, categories = 0, [], set()
+        async for rows, row_errors in read_import_batches(request.stream(), fmt):
+            errors.extend(row_errors)
+            if rows:
+                await run_db(db, _insert_service_batch, provider_id, rows)
+                imported += len(rows)
+                categories.update(row["category"] for row in rows)
+        await run_db(db, Session.commit)
+        response_cache.invalidate(*service_change_tags(None, provider_id, *categories))
+        return {"imported": imported, "failed": len(errors), "errors": errors}
+    except HTTPException:
+        await run_db(db, Session.rollback)
+        raise
+    except Exception as e:
+        await run_db(db, Session.rollback)
+        raise HTTPException(status_code=500, detail=f"Failed to import services: {str(e)}")
+
+# --- AVAILABILITY ENDPOINTS ---
+
+def _calendar_or_404(db: Session, service_id: int):
+    calendar = load_calendars(db, [service_id]).get(service_id)
+    if not calendar:
+        raise HTTPException(status_code=404, detail="Service not found")
+    return calendar
+
+def _serialize_hours(calendar) -> dict:
+    return {
+        "service_id": calendar.service_id,
+        "timezone": calendar.zone.key,
+        "slot_minutes": calendar.slot_minutes,
+        "hours": [
+            {"weekday": weekday, "opens": format_clock(opens), "closes": format_clock(closes)}
+            for weekday, opens, closes in sorted(calendar.hours)
+        ],
+    }
+
+def _parse_hours(req: ServiceHoursUpdate) -> list:
+    try:
+        service_zone(req.timezone)
+        if not 5 <= req.slot_minutes <= 24 * 60:
+            raise ValueError("slot_minutes must be between 5 and 1440")
+        windows = []
+        for window in req.hours:
+            opens, closes = parse_clock(window.opens), parse_clock(window.closes)
+            if not 0 <= window.weekday <= 6:
+                raise ValueError("weekday must be 0 (Monday) to 6 (Sunday)")
+            if opens >= closes:
+                raise ValueError(f"Opening hours {window.opens}-{window.closes} are empty")
+            windows.append((window.weekday, opens, closes))
+        return windows
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/services/{service_id}/hours")
+@db_handler
+def get_service_hours(service_id: int, db: Session = Depends(get_db)):
+    try:
+        return _serialize_hours(_calendar_or_404(db, service_id))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch opening hours: {str(e)}")
+
+@router.put("/services/{service_id}/hours")
+@db_handler
+def update_service_hours(service_id: int, req: ServiceHoursUpdate, db: Session = Depends(get_db)):
+    """Replace the weekly opening hours. Existing bookings are kept as they are."""
+    windows = _parse_hours(req)
+    try:
+        service = db.query(Service).filter(Service.id == service_id).with_for_update().first()
+        if not service:
+            raise HTTPException(status_code=404, detail="Service not found")
+
+        service.timezone = req.timezone
+        service.slot_minutes = req.slot_minutes
+        db.query(ServiceHours).filter(ServiceHours.service_id == service_id).delete(synchronize_session=False)
+        if windows:
+            db.execute(
+                insert(ServiceHours),
+                [
+                    {"service_id": service_id, "weekday": weekday, "opens": opens, "closes": closes}
+                    for weekday, opens, closes in windows
+                ],
+            )
         db.commit()
-        db.refresh(service)
+        return _serialize_hours(_calendar_or_404(db, service_id))
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to update opening hours: {str(e)}")
+
+@router.get("/services/{service_id}/availability")
+@db_handler
+def get_service_availability(
+    service_id: int,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """Free slots from the local day `start` (default today) up to `end` (default a week later).
 
+    Slots come from the opening hours; the bookings they are checked against
+    are read with one range scan on the (service_id, start_at) index.
+    """
+    try:
+        calendar = _calendar_or_404(db, service_id)
         try:
-            provider_name = service.provider.name if service.provider else "Unknown"
-        except:
-            provider_name = "Unknown"
-
-        return {
-            "id": service.id,
-            "provider_id": service.provider_id,
-            "provider_name": provider_name,
-            "title": service.title or "",
-            "description": service.description or "",
-            "category": service.category or "",
-            "location": service.location or "",
-            "price": float(service.price) if service.price else 0.0,
-            "image_url": service.image_url or "",
-            "rating": float(service.rating) if service.rating else 0.0,
-            "review_count": int(service.review_count) if service.review_count else 0
-        }
+            first_day = date.fromisoformat(start) if start else datetime.now(calendar.zone).date()
+            last_day = date.fromisoformat(end) if end else first_day + timedelta(days=7)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="start and end must be YYYY-MM-DD dates")
+        if not 0 < (last_day - first_day).days <= MAX_AVAILABILITY_DAYS:
+            raise HTTPException(
+                status_code=400, detail=f"end must be after start and at most {MAX_AVAILABILITY_DAYS} days later"
+            )
+
+        now = datetime.now(timezone.utc)
+        candidates = [
+            slot for slot in slots(opening_windows(calendar.hours, calendar.zone, first_day, last_day),
+                                   calendar.slot_minutes)
+            if slot[0] >= now
+        ]
+        if candidates:
+            candidates = free_slots(candidates, busy_intervals(db, service_id, candidates[0][0], candidates[-1][1]))
+        return FastJSONResponse({
+            **_serialize_hours(calendar),
+            "slots": [{"start": slot_start.isoformat(), "end": slot_end.isoformat()} for slot_start, slot_end in candidates],
+        })
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to update service: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch availability: {str(e)}")
 
 # --- BOOKING ENDPOINTS ---
 
-@app.post("/bookings")
+def _book_slot(db: Session, calendar, user_id: int, item: BookingCreate):
+    """Reserve the slot `item` asks for; returns `(booking_id, start, end)`.
+
+    `start_at` books exactly that slot. A bare `booking_date` takes the first
+    free slot of that day, and moves on to the next one when a concurrent
+    request gets there first.
+    """
+    length = timedelta(minutes=calendar.slot_minutes)
+    now = datetime.now(timezone.utc)
+    if item.start_at is not None:
+        start = utc(item.start_at)
+        if start < now:
+            raise HTTPException(status_code=400, detail="Cannot book a slot in the past")
+        if not within_hours(calendar, start, start + length):
+            raise HTTPException(status_code=400, detail="Slot is outside the service's opening hours")
+        candidates = [(start, start + length)]
+    else:
+        try:
+            day = date.fromisoformat(item.booking_date or "")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="booking_date must be a YYYY-MM-DD date")
+        windows = opening_windows(calendar.hours, calendar.zone, day, day + timedelta(days=1))
+        candidates = [slot for slot in slots(windows, calendar.slot_minutes) if slot[0] >= now]
+        if candidates:
+            candidates = free_slots(
+                candidates, busy_intervals(db, calendar.service_id, candidates[0][0], candidates[-1][1])
+            )
+
+    for start, end in candidates:
+        booking_id = reserve(db, {
+            "service_id": calendar.service_id,
+            "user_id": user_id,
+            "booking_date": start.astimezone(calendar.zone).date().isoformat(),
+            "start_at": start,
+            "end_at": end,
+            "status": "Pending",
+            "price": calendar.price,
+        })
+        if booking_id is not None:
+            return booking_id, start, end
+    if item.start_at is not None:
+        raise HTTPException(status_code=409, detail="Slot is already booked")
+    raise HTTPException(status_code=409, detail=f"No free slots on {item.booking_date}")
+
+@router.post("/bookings")
+@db_handler
 def create_booking(req: BookingCreate, db: Session = Depends(get_db)):
     try:
-        new_booking = Booking(
-            service_id=int(req.service_id),
-            user_id=int(req.user_id),
-            booking_date=req.booking_date,
-            status="Pending"
-        )
-        db.add(new_booking)
+        calendar = _calendar_or_404(db, int(req.service_id))
+        booking_id, start, end = _book_slot(db, calendar, int(req.user_id), req)
+        bump_provider_stats(db, calendar.provider_id, "Pending", 1, calendar.price)
+        broker.publish(db, [booking_event(
+            "created", booking_id, calendar.service_id, int(req.user_id), calendar.provider_id, "Pending",
+            start_at=start.isoformat(), end_at=end.isoformat(),
+        )])
         db.commit()
-        return {"message": "Booking created"}
+        return {"message": "Booking created", "id": booking_id, "start_at": start.isoformat(), "end_at": end.isoformat()}
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to create booking: {str(e)}")
 
-def serialize_booking(booking: Booking):
-    try:
-        service_title = booking.service.title if booking.service else "Unknown Service"
-        service_image = booking.service.image_url if booking.service else ""
-        price = float(booking.service.price) if booking.service and booking.service.price else 0.0
-    except Exception:
-        service_title = "Unknown Service"
-        service_image = ""
-        price = 0.0
+def _check_batch_size(count: int) -> None:
+    if count > MAX_BATCH_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_ROWS} rows per request")
 
+@router.post("/bookings/bulk")
+@db_handler
+def create_bookings_bulk(req: BulkBookingCreate, db: Session = Depends(get_db)):
+    """Create many bookings in one transaction; invalid rows are reported per index.
+
+    Every row is its own conflict-checked reservation, so rows of one request
+    cannot take the same slot either.
+    """
+    _check_batch_size(len(req.bookings))
     try:
-        user_name = booking.user.name if booking.user else "Unknown User"
-        user_email = booking.user.email if booking.user else ""
-        user_avatar = booking.user.avatar_url if booking.user else ""
-    except Exception:
-        user_name = "Unknown User"
-        user_email = ""
-        user_avatar = ""
+        results = [None] * len(req.bookings)
+        parsed = []
+        for index, item in enumerate(req.bookings):
+            try:
+                parsed.append((index, int(item.service_id), int(item.user_id), item))
+            except ValueError:
+                results[index] = {"index": index, "error": "service_id and user_id must be integers"}
 
-    return {
-        "id": booking.id,
-        "service_id": booking.service_id,
-        "user_id": booking.user_id,
-        "service_title": service_title,
-        "service_image": service_image,
-        "status": booking.status or "Pending",
-        "booking_date": booking.booking_date or "",
-        "price": price,
-        "user_name": user_name,
-        "user_email": user_email,
-        "user_avatar": user_avatar
-    }
+        # Check references up front: on Postgres one bad foreign key would
+        # abort the whole transaction
+        calendars = load_calendars(db, {service_id for _, service_id, _, _ in parsed})
+        user_ids = {user_id for _, _, user_id, _ in parsed}
+        users = {user_id for (user_id,) in db.query(User.id).filter(User.id.in_(user_ids))}
+
+        created, deltas, events = 0, {}, []
+        for index, service_id, user_id, item in parsed:
+            if service_id not in calendars:
+                results[index] = {"index": index, "error": "Service not found"}
+                continue
+            if user_id not in users:
+                results[index] = {"index": index, "error": "User not found"}
+                continue
+            calendar = calendars[service_id]
+            try:
+                booking_id, start, end = _book_slot(db, calendar, user_id, item)
+            except HTTPException as e:
+                results[index] = {"index": index, "error": e.detail}
+                continue
+            results[index] = {"index": index, "id": booking_id, "start_at": start.isoformat(), "end_at": end.isoformat()}
+            created += 1
+            events.append(booking_event(
+                "created", booking_id, service_id, user_id, calendar.provider_id, "Pending",
+                start_at=start.isoformat(), end_at=end.isoformat(),
+            ))
+            count, revenue = deltas.get((calendar.provider_id, "Pending"), (0, 0.0))
+            deltas[(calendar.provider_id, "Pending")] = (count + 1, revenue + (calendar.price or 0.0))
+
+        if created:
+            bump_provider_stats_many(db, deltas)
+            broker.publish(db, events)
+            db.commit()
+        return {"created": created, "failed": len(results) - created, "results": results}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to create bookings: {str(e)}")
+
+BOOKING_STATUSES = ("Pending", "Confirmed", "Completed")
 
-@app.get("/bookings/user/{user_id}")
-def get_user_bookings(user_id: int, db: Session = Depends(get_db)):
+# Booking lists read the booking_views read model: one range scan of its
+# (user_id, booking_id) or (provider_id, booking_id) index per page
+BOOKINGS_NEWEST = KeysetOrder("newest", [BookingView.booking_id])
+
+@router.get("/bookings/user/{user_id}")
+@db_handler
+def get_user_bookings(
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
     try:
-        bookings = db.query(Booking).filter(Booking.user_id == user_id).all()
-        return [serialize_booking(b) for b in bookings]
+        query = booking_view_rows(db).filter(BookingView.user_id == user_id)
+        rows, next_cursor = paginate(query, BOOKINGS_NEWEST, cursor, limit)
+        response = FastJSONResponse(serialize_bookings(rows))
+        set_next_cursor(response, next_cursor)
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch bookings: {str(e)}")
 
-@app.get("/bookings/provider/{provider_id}")
-def get_provider_bookings(provider_id: int, db: Session = Depends(get_db)):
+@router.get("/bookings/provider/{provider_id}")
+@db_handler
+def get_provider_bookings(
+    provider_id: int,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
     try:
-        bookings = (
-            db.query(Booking)
-            .join(Service, Booking.service_id == Service.id)
-            .filter(Service.provider_id == provider_id)
-            .all()
-        )
-        return [serialize_booking(b) for b in bookings]
+        query = booking_view_rows(db).filter(BookingView.provider_id == provider_id)
+        rows, next_cursor = paginate(query, BOOKINGS_NEWEST, cursor, limit)
+        response = FastJSONResponse(serialize_bookings(rows))
+        set_next_cursor(response, next_cursor)
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch provider bookings: {str(e)}")
 
-@app.put("/bookings/{booking_id}/status")
+@router.put("/bookings/{booking_id}/status")
+@db_handler
 def update_booking_status(
     booking_id: int, req: BookingStatusUpdate, db: Session = Depends(get_db)
 ):
     try:
-        booking = db.query(Booking).filter(Booking.id == booking_id).first()
-        if not booking:
+        # Row lock, so concurrent updates move the provider counters once
+        # each. The response is built from this row, with no read after the
+        # commit.
+        found = (
+            booking_rows(db)
+            .add_columns(Booking.price.label("booked_price"), Service.provider_id)
+            .filter(Booking.id == booking_id)
+            .with_for_update(of=Booking)
+            .first()
+        )
+        if not found:
             raise HTTPException(status_code=404, detail="Booking not found")
 
-        allowed_statuses = {"Pending", "Confirmed", "Completed"}
-        if req.status not in allowed_statuses:
+        if req.status not in BOOKING_STATUSES:
             raise HTTPException(status_code=400, detail="Invalid booking status")
 
-        booking.status = req.status
-        db.commit()
-        db.refresh(booking)
-        return serialize_booking(booking)
+        old_status, price, provider_id = found.status, found.booked_price, found.provider_id
+        if req.status != old_status:
+            db.execute(
+                update(Booking).where(Booking.id == booking_id).values(status=req.status),
+                execution_options={"synchronize_session": False},
+            )
+            bump_provider_stats(db, provider_id, old_status, -1, -(price or 0.0))
+            bump_provider_stats(db, provider_id, req.status, 1, price)
+            broker.publish(db, [booking_event(
+                "status", booking_id, found.service_id, found.user_id, provider_id, req.status,
+                previous_status=old_status,
+            )])
+            db.commit()
+        return {**serialize_booking(found), "status": req.status}
     except HTTPException:
         raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to update booking: {str(e)}")
 
+@router.put("/bookings/status")
+@db_handler
+def update_booking_status_batch(req: BookingStatusBatch, db: Session = Depends(get_db)):
+    """Move many bookings to one status in a single UPDATE."""
+    _check_batch_size(len(req.booking_ids))
+    if req.status not in BOOKING_STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid booking status")
+    try:
+        booking_ids = list(dict.fromkeys(req.booking_ids))
+        found = {
+            booking_id: (status or "Pending", price, provider_id, service_id, user_id)
+            for booking_id, status, price, provider_id, service_id, user_id in db.query(
+                Booking.id, Booking.status, Booking.price, Service.provider_id, Booking.service_id, Booking.user_id
+            )
+            .outerjoin(Service, Service.id == Booking.service_id)
+            .filter(Booking.id.in_(booking_ids))
+            .with_for_update(of=Booking)
+        }
+
+        results, changed, deltas, events = [], [], {}, []
+        for booking_id in booking_ids:
+            if booking_id not in found:
+                results.append({"id": booking_id, "error": "Booking not found"})
+                continue
+            results.append({"id": booking_id, "status": req.status})
+            old_status, price, provider_id, service_id, user_id = found[booking_id]
+            if old_status == req.status:
+                continue
+            changed.append(booking_id)
+            events.append(booking_event(
+                "status", booking_id, service_id, user_id, provider_id, req.status, previous_status=old_status,
+            ))
+            for status, sign in ((old_status, -1), (req.status, 1)):
+                count, revenue = deltas.get((provider_id, status), (0, 0.0))
+                deltas[(provider_id, status)] = (count + sign, revenue + sign * (price or 0.0))
+
+        if changed:
+            db.execute(
+                update(Booking).where(Booking.id.in_(changed)).values(status=req.status),
+                execution_options={"synchronize_session": False},
+            )
+            bump_provider_stats_many(db, deltas)
+            broker.publish(db, events)
+            db.commit()
+        return {"updated": len(changed), "failed": len(booking_ids) - len(found), "results": results}
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to update bookings: {str(e)}")
+
+# --- BOOKING EVENTS ---
+
+async def _stream_user(request: Request, access_token: Optional[str] = None) -> dict:
+    """get_current_user that also accepts `?access_token=`, as EventSource cannot send headers."""
+    token = access_token or await oauth2_scheme(request)
+    _, entry = await _verified_token(token)
+    return entry.user
+
+@router.get("/events")
+async def booking_events(user: dict = Depends(_stream_user)):
+    """Server-Sent Events stream of the caller's booking changes.
+
+    Customers get `booking.created` / `booking.status` for their own bookings,
+    providers also for bookings of their services. Nothing is replayed:
+    fetch the listings after (re)connecting and apply events from there.
+    """
+    return StreamingResponse(
+        broker.stream([("user", user["id"]), ("provider", user["id"])]),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# --- PROVIDER DASHBOARD ---
+
+DASHBOARD_MAX_RECENT = 50
+
+@router.get("/providers/{provider_id}/dashboard")
+@db_handler
+def get_provider_dashboard(provider_id: int, recent: int = 10, db: Session = Depends(get_db)):
+    """Booking counts, revenue and ratings for one provider in three queries."""
+    try:
+        counters = {status: (0, 0.0) for status in BOOKING_STATUSES}
+        for status, count, revenue in db.query(
+            ProviderStats.status, ProviderStats.booking_count, ProviderStats.revenue
+        ).filter(ProviderStats.provider_id == provider_id):
+            counters[status] = (count, revenue)
+
+        service_count, review_count, rating_sum = (
+            db.query(
+                func.count(Service.id),
+                func.coalesce(func.sum(Service.review_count), 0),
+                func.coalesce(func.sum(Service.rating_sum), 0),
+            )
+            .filter(Service.provider_id == provider_id)
+            .one()
+        )
+
+        recent_bookings = (
+            booking_view_rows(db)
+            .filter(BookingView.provider_id == provider_id)
+            .order_by(BookingView.booking_id.desc())
+            .limit(max(0, min(recent, DASHBOARD_MAX_RECENT)))
+            .all()
+        )
+
+        return FastJSONResponse({
+            "provider_id": provider_id,
+            "services": service_count,
+            "bookings": {
+                "total": sum(count for count, _ in counters.values()),
+                "by_status": {status: count for status, (count, _) in counters.items()},
+            },
+            "revenue": {
+                "total": round(sum(revenue for _, revenue in counters.values()), 2),
+                "by_status": {status: round(revenue, 2) for status, (_, revenue) in counters.items()},
+            },
+            "ratings": {
+                "average": round(rating_sum / review_count, 1) if review_count else 0.0,
+                "review_count": review_count,
+            },
+            "recent_bookings": serialize_bookings(recent_bookings),
+        })
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch provider dashboard: {str(e)}")
+
 # --- REVIEW ENDPOINTS ---
 
-@app.post("/reviews")
+@router.post("/reviews")
+@db_handler
 def create_review(req: ReviewCreate, db: Session = Depends(get_db)):
     try:
         new_review = Review(
@@ -543,57 +1364,86 @@ def create_review(req: ReviewCreate, db: Session = Depends(get_db)):
             comment=req.comment
         )
         db.add(new_review)
-        
-        # Update Service Average Rating
-        service = db.query(Service).filter(Service.id == int(req.service_id)).first()
-        if service:
-            # Get all existing reviews + this one (not committed yet, so we query carefully)
-            # Easier to commit review first
-            db.commit()
-            db.refresh(service)
-            
-            # Calculate new average
-            all_reviews = db.query(Review).filter(Review.service_id == service.id).all()
-            if all_reviews:
-                total_rating = sum([r.rating for r in all_reviews if r.rating])
-                service.rating = round(total_rating / len(all_reviews), 1)
-                service.review_count = len(all_reviews)
-                db.commit()
-        else:
-            db.commit()
+        db.flush()
+
+        # The rating aggregate and the listings showing it are updated by
+        # a job once the review is in
+        enqueue(
+            db, "review.rating",
+            {"service_id": new_review.service_id, "rating": new_review.rating},
+            key=f"review:{new_review.id}",
+        )
+        db.commit()
+        response_cache.invalidate(f"reviews:{new_review.service_id}")
 
         return {"message": "Review added"}
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to create review: {str(e)}")
 
-@app.get("/reviews/service/{service_id}")
-def get_service_reviews(service_id: int, db: Session = Depends(get_db)):
+REVIEWS_NEWEST = KeysetOrder(
+    "newest",
+    [Review.created_at, Review.id],
+    parsers=[datetime.fromisoformat, None],
+)
+
+@router.get("/reviews/service/{service_id}")
+@db_handler
+def get_service_reviews(
+    service_id: int,
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
     try:
-        reviews = db.query(Review).filter(Review.service_id == service_id).all()
-        results = []
-        for r in reviews:
-            try:
-                user_name = r.user.name if r.user else "Anonymous"
-            except:
-                user_name = "Anonymous"
-            
-            try:
-                created_at_str = r.created_at.isoformat() if r.created_at else datetime.now(timezone.utc).isoformat()
-            except:
-                created_at_str = datetime.now(timezone.utc).isoformat()
-            
-            results.append({
-                "id": r.id,
-                "service_id": r.service_id,
-                "user_id": r.user_id,
-                "user_name": user_name,
-                "rating": int(r.rating) if r.rating else 0,
-                "comment": r.comment or "",
-                "created_at": created_at_str
-            })
-        return results
+        def build():
+            query = review_rows(db).filter(Review.service_id == service_id)
+            rows, next_cursor = paginate(query, REVIEWS_NEWEST, cursor, limit)
+            return serialize_reviews(rows), ({NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {})
+
+        return response_cache.respond(request, [f"reviews:{service_id}"], build)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch reviews: {str(e)}")
 
+# --- APP ---
+def create_app() -> FastAPI:
+    """Build the ASGI application.
+
+    Nothing here touches the database or the filesystem: pools, migrations
+    and caches are set up per process in `lifespan`.
+    """
+    app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
+    app.state.ready = False
+    app.add_exception_handler(Exception, global_exception_handler)
+
+    # Reject oversized uploads before the multipart body is read
+    app.add_middleware(UploadLimitMiddleware)
+
+    # Clients that just wrote read from the primary for a moment
+    app.add_middleware(ReadYourWritesMiddleware)
+
+    # CORS: Allow frontend to communicate, cookies included (read-your-writes)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=CORS_ORIGINS,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER, "ETag", "Last-Modified", "X-Cache"],
+    )
+
+    # Added last so it wraps the other middleware and times the whole request
+    app.add_middleware(MetricsMiddleware)
+
+    # Serve uploaded images with immutable caching, ETags and byte ranges
+    app.include_router(media_router)
+    app.include_router(router)
+    return app
+
+app = create_app()
+
 # Run with: uvicorn main:app --reload
+# Production: python -m backend.serve (one worker per core, see serve.py)
@@ -0,0 +1,115 @@
+"""Maintenance commands.
+
+Usage: python -m backend.manage <command>
+"""
+import argparse
+import signal
+import sys
+import threading
+import time
+
+try:
+    from .jobs import JOB_BATCH_SIZE, JOB_POLL_SECONDS, Worker, retry_failed
+    from .metrics import start_metrics_server
+    from .migrate import current_revision, upgrade_database
+    from .models import SessionLocal, engine, repair_provider_stats, repair_rating_aggregates
+    from .seed import SEED_PASSWORD, parse_scale, seed_dataset
+except ImportError:
+    from jobs import JOB_BATCH_SIZE, JOB_POLL_SECONDS, Worker, retry_failed
+    from metrics import start_metrics_server
+    from migrate import current_revision, upgrade_database
+    from models import SessionLocal, engine, repair_provider_stats, repair_rating_aggregates
+    from seed import SEED_PASSWORD, parse_scale, seed_dataset
+
+
+def migrate(args) -> int:
+    before = current_revision()
+    upgrade_database(args.revision)
+    print(f"Database schema at revision {current_revision()} (was {before or 'unversioned'})")
+    return 0
+
+
+def repair_ratings(args) -> int:
+    with SessionLocal() as db:
+        count = repair_rating_aggregates(db)
+        db.commit()
+    print(f"Recomputed rating aggregates ({count} services with reviews)")
+    return 0
+
+
+def repair_stats(args) -> int:
+    with SessionLocal() as db:
+        count = repair_provider_stats(db)
+        db.commit()
+    print(f"Rebuilt provider booking counters ({count} provider/status rows)")
+    return 0
+
+
+def worker(args) -> int:
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    job_worker = Worker(batch_size=args.batch_size)
+    print(f"Job worker {job_worker.name} running (polling every {JOB_POLL_SECONDS}s)")
+    job_worker.run_forever(stop)
+    return 0
+
+
+def retry_jobs(args) -> int:
+    with SessionLocal() as db:
+        count = retry_failed(db)
+        db.commit()
+    print(f"Queued {count} failed jobs again")
+    return 0
+
+
+def seed(args) -> int:
+    upgrade_database()
+    with engine.connect() as conn:
+        if conn.exec_driver_sql("SELECT 1 FROM users LIMIT 1").first():
+            print("seed needs an empty database: it writes rows with fixed ids")
+            return 1
+    started = time.perf_counter()
+    seed_dataset(engine, args.scale)
+    print(f"Seeded {args.scale} services, bookings and reviews in {time.perf_counter() - started:.1f}s "
+          f"(users log in as userN@bench.test / {SEED_PASSWORD})")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m backend.manage")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("migrate", help="Apply schema migrations")
+    p.add_argument("revision", nargs="?", default="head")
+    p.set_defaults(func=migrate)
+
+    commands.add_parser(
+        "repair-ratings", help="Recompute rating, review_count and rating_sum from the reviews table"
+    ).set_defaults(func=repair_ratings)
+
+    commands.add_parser(
+        "repair-provider-stats", help="Rebuild the provider dashboard counters from the bookings table"
+    ).set_defaults(func=repair_stats)
+
+    p = commands.add_parser("worker", help="Run background jobs until interrupted")
+    p.add_argument("--batch-size", type=int, default=JOB_BATCH_SIZE)
+    p.add_argument("--metrics-port", type=int, default=0, help="Serve Prometheus metrics on this port")
+    p.set_defaults(func=worker)
+
+    commands.add_parser(
+        "retry-jobs", help="Queue the jobs that ran out of attempts again"
+    ).set_defaults(func=retry_jobs)
+
+    p = commands.add_parser("seed", help="Fill an empty database with synthetic users, services, bookings and reviews")
+    p.add_argument("scale", type=parse_scale, nargs="?", default=10_000, help="10k, 100k, 1m or a number of services")
+    p.set_defaults(func=seed)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import os
+import re
+from email.utils import formatdate
+from typing import Optional, Tuple
+
+import anyio
+from fastapi import APIRouter, HTTPException, Request
+from starlette.responses import Response
+
+try:
+    from .storage import IMMUTABLE_CACHE_CONTROL, storage
+except ImportError:
+    from storage import IMMUTABLE_CACHE_CONTROL, storage
+
+CHUNK_SIZE = 64 * 1024
+# Content-addressed names written by uploads.save_upload
+HASHED_NAME_RE = re.compile(r"^[0-9a-f]{64}(_thumb)?\.[a-z0-9]+$")
+SAFE_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CONTENT_TYPES = {
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "gif": "image/gif",
+    "webp": "image/webp",
+    "svg": "image/svg+xml",
+}
+
+router = APIRouter()
+
+
+class FileSliceResponse(Response):
+    """Send `length` bytes of a file from `offset`.
+
+    Uses the ASGI zero-copy extension (sendfile) when the server offers it and
+    falls back to chunked reads otherwise.
+    """
+
+    def __init__(self, path: str, offset: int, length: int, status_code: int, headers: dict):
+        super().__init__(status_code=status_code, headers=headers)
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.headers["content-length"] = str(length)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+        async with await anyio.open_file(self.path, "rb") as f:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f.wrapped,
+                    "offset": self.offset,
+                    "count": self.length,
+                })
+                return
+            await f.seek(self.offset)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b""})
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Return inclusive `(start, end)` for a single byte range, None to send it all.
+
+    Raises HTTP 416 for a range that lies outside the file.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        # Multiple or malformed ranges: a full 200 response is always allowed
+        return None
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+def _accepts(request: Request, header: str, token: str) -> bool:
+    return token in request.headers.get(header, "")
+
+
+def _pick_variant(request: Request, name: str):
+    """Choose the stored file to send for `name`.
+
+    Returns `(file_name, content_type, vary)`: the WebP twin of a hashed
+    JPEG/PNG when the client accepts WebP, otherwise `name` itself.
+    """
+    extension = name.rpartition(".")[2].lower()
+    content_type = CONTENT_TYPES.get(extension, "application/octet-stream")
+    if extension in ("jpg", "jpeg", "png") and HASHED_NAME_RE.match(name):
+        webp_name = name.rpartition(".")[0] + ".webp"
+        if _accepts(request, "accept", "image/webp") and os.path.exists(storage.local_path(webp_name)):
+            return webp_name, CONTENT_TYPES["webp"], ["Accept"]
+        return name, content_type, ["Accept"]
+    return name, content_type, []
+
+
+def _etag(name: str, served_name: str, stat: os.stat_result) -> str:
+    if HASHED_NAME_RE.match(name):
+        # The name is a content hash, so the served file name identifies the bytes
+        return f'"{served_name}"'
+    # Legacy uuid-named uploads: not content-addressed, so fall back to size+mtime
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+@router.api_route("/uploads/{name}", methods=["GET", "HEAD"])
+async def serve_media(name: str, request: Request):
+    # Remote storage backends serve their own URLs
+    if not SAFE_NAME_RE.match(name) or storage.local_path(name) is None:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    served_name, content_type, vary = _pick_variant(request, name)
+    path = storage.local_path(served_name)
+    try:
+        stat = await anyio.to_thread.run_sync(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    headers = {
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+        "ETag": _etag(name, served_name, stat),
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+        "Content-Type": content_type,
+    }
+    if vary:
+        headers["Vary"] = ", ".join(vary)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and any(t.strip() in (headers["ETag"], "*") for t in if_none_match.split(",")):
+        return Response(status_code=304, headers={k: v for k, v in headers.items() if k != "Content-Type"})
+
+    size = stat.st_size
+    if_range = request.headers.get("if-range")
+    byte_range = None
+    if if_range is None or if_range == headers["ETag"]:
+        byte_range = parse_range(request.headers.get("range"), size)
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return FileSliceResponse(path, start, end - start + 1, 206, headers)
+    return FileSliceResponse(path, 0, size, 200, headers)
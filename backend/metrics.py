@@ -0,0 +1,366 @@
+"""Per-request timing, SQL and pool instrumentation, rendered for Prometheus.
+
+Metrics live in this process; with several workers, scrape each one (or put
+them behind a per-worker port).
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+
+# --- CONFIGURATION ---
+# Log statements slower than this many milliseconds; 0 turns it off
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+STREAM_BUCKETS = (1, 10, 60, 300, 900, 3600, 14400)
+# Responses that stay open for as long as the client listens
+STREAMING_TYPES = (b"text/event-stream",)
+
+slow_query_log = logging.getLogger("backend.slow_query")
+
+
+# --- METRIC TYPES ---
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self):
+        lines = self.header()
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_number(value)}")
+        return lines
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = self.header()
+        for label_values, series in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge(Metric):
+    """Value read from `collect()` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, collect: Callable[[], Dict[tuple, float]], labels=()):
+        super().__init__(name, help_text, labels)
+        self.collect = collect
+
+    def render(self):
+        lines = self.header()
+        for label_values, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_number(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str, collect: Callable, labels=()) -> Gauge:
+        return self.register(Gauge(name, help_text, collect, labels))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # A broken collector must not take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status")))
+REQUEST_LATENCY = registry.register(Histogram(
+    "http_request_duration_seconds", "Time to the end of the response body", ("method", "route")))
+RESPONSE_SIZE = registry.register(Histogram(
+    "http_response_size_bytes", "Response body size", ("method", "route"), SIZE_BUCKETS))
+REQUEST_QUERIES = registry.register(Histogram(
+    "http_request_db_queries", "SQL statements executed per request", ("method", "route"), COUNT_BUCKETS))
+REQUEST_DB_TIME = registry.register(Histogram(
+    "http_request_db_seconds", "Time spent executing SQL per request", ("method", "route")))
+REQUEST_POOL_WAIT = registry.register(Histogram(
+    "http_request_db_pool_wait_seconds", "Time spent waiting for pooled connections per request",
+    ("method", "route")))
+STREAM_DURATION = registry.register(Histogram(
+    "http_stream_duration_seconds", "Time streaming responses (SSE) stayed open", ("method", "route"),
+    STREAM_BUCKETS))
+QUERY_LATENCY = registry.register(Histogram(
+    "db_query_duration_seconds", "Duration of single SQL statements"))
+POOL_WAIT = registry.register(Histogram(
+    "db_pool_checkout_seconds", "Time to check a connection out of the pool"))
+SLOW_QUERIES = registry.register(Counter(
+    "db_slow_queries_total", "Statements slower than SLOW_QUERY_MS", ("route",)))
+
+
+# --- PER-REQUEST STATS ---
+class RequestStats:
+    __slots__ = ("scope", "queries", "db_time", "pool_wait")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+
+    @property
+    def route(self) -> str:
+        # The router stores the matched route in the shared scope, so this is
+        # the path template ("/services/{service_id}") rather than the raw URL
+        route = self.scope.get("route")
+        return route.path if route is not None else "unmatched"
+
+
+# Threadpool workers and AsyncSession.run_sync inherit the request's context,
+# so SQL run on their behalf is counted against the request.
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    QUERY_LATENCY.observe(elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        route = stats.route if stats is not None else "-"
+        SLOW_QUERIES.inc(route)
+        slow_query_log.warning("%.1f ms [%s] %s", elapsed * 1000, route, " ".join(statement.split()))
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+_timed_pools = {}
+
+
+def _timed_subclass(pool_class):
+    if pool_class not in _timed_pools:
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return pool_class._do_get(self)
+            finally:
+                elapsed = time.perf_counter() - started
+                POOL_WAIT.observe(elapsed)
+                stats = _current.get()
+                if stats is not None:
+                    stats.pool_wait += elapsed
+
+        _timed_pools[pool_class] = type(f"Timed{pool_class.__name__}", (pool_class,), {"_do_get": _do_get})
+    return _timed_pools[pool_class]
+
+
+def timed_pool_class(url: str):
+    """The pool class SQLAlchemy would pick for `url`, timing each checkout.
+
+    Passed as `poolclass=` when an engine is created (models.engine_kwargs);
+    pools rebuild themselves with their own class, so the timing survives
+    dispose and recreate.
+    """
+    url = make_url(url)
+    return _timed_subclass(url.get_dialect().get_pool_class(url))
+
+
+_engines = {}
+
+
+def _pool_occupancy():
+    values = {}
+    for name, engine in _engines.items():
+        pool = engine.pool
+        if hasattr(pool, "checkedout"):
+            values[(name, "checked_out")] = pool.checkedout()
+        if hasattr(pool, "size"):
+            values[(name, "size")] = pool.size()
+    return values
+
+
+registry.gauge("db_pool_connections", "Pooled connections by engine and state", _pool_occupancy, ("engine", "state"))
+
+
+def instrument_engine(engine, name: str = "sync") -> None:
+    """Publish the pool occupancy of `engine` (sync or async)."""
+    _engines[name] = getattr(engine, "sync_engine", engine)
+
+
+# --- ASGI MIDDLEWARE ---
+class MetricsMiddleware:
+    """Record latency, size, status and DB usage of every HTTP request.
+
+    Streaming responses (SSE) last as long as the client listens, so they are
+    timed in http_stream_duration_seconds instead of the request histograms.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+        size = 0
+        streaming = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, size, streaming
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                streaming = any(
+                    name == b"content-type" and value.startswith(STREAMING_TYPES)
+                    for name, value in message.get("headers", ())
+                )
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            elif message["type"] == "http.response.zerocopysend":
+                size += message.get("count") or 0
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            labels = (scope["method"], stats.route)
+            REQUESTS.inc(scope["method"], stats.route, str(status_code))
+            if streaming:
+                STREAM_DURATION.observe(elapsed, *labels)
+            else:
+                REQUEST_LATENCY.observe(elapsed, *labels)
+                RESPONSE_SIZE.observe(size, *labels)
+                REQUEST_QUERIES.observe(stats.queries, *labels)
+                REQUEST_DB_TIME.observe(stats.db_time, *labels)
+                REQUEST_POOL_WAIT.observe(stats.pool_wait, *labels)
+
+
+def stats_gauge(name: str, help_text: str, stats: Callable[[], dict]) -> Gauge:
+    """Publish the numeric values of a `stats()` dict, one series per key."""
+    def collect():
+        return {
+            (key,): value for key, value in stats().items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)
+        }
+
+    return registry.gauge(name, help_text, collect, ("stat",))
+
+
+def render() -> str:
+    return registry.render()
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0"):
+    """Serve /metrics from a daemon thread, for processes without an app (job workers)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,48 @@
+"""Run the Alembic migrations in backend/migrations against DATABASE_URL."""
+import os
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import inspect
+
+try:
+    from .models import Base, engine
+except ImportError:
+    from models import Base, engine
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Revision matching the schema the app created with create_all() before
+# migrations existed
+BASELINE_REVISION = "0001"
+
+
+def alembic_config(connection=None) -> Config:
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "migrations"))
+    config.set_main_option("sqlalchemy.url", engine.url.render_as_string(hide_password=False).replace("%", "%%"))
+    config.attributes["target_metadata"] = Base.metadata
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+def current_revision(bind=engine):
+    with bind.connect() as conn:
+        return MigrationContext.configure(conn).get_current_revision()
+
+
+def upgrade_database(revision: str = "head", bind=engine) -> None:
+    """Bring the schema up to `revision`.
+
+    Databases created before migrations existed have the tables but no
+    alembic_version row; they are stamped at the baseline first so the
+    upgrade only adds what they are missing.
+    """
+    with bind.connect() as conn:
+        config = alembic_config(conn)
+        if current_revision(bind) is None and inspect(conn).has_table("users"):
+            command.stamp(config, BASELINE_REVISION)
+            conn.commit()
+        command.upgrade(config, revision)
+        conn.commit()
@@ -0,0 +1,80 @@
+import os
+import sys
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import create_engine
+
+config = context.config
+
+# backend/migrate.py hands over the app's metadata and an open connection.
+# Invoked through the alembic CLI, load the models ourselves.
+target_metadata = config.attributes.get("target_metadata")
+if target_metadata is None:
+    if config.config_file_name:
+        fileConfig(config.config_file_name)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from models import Base, DATABASE_URL
+
+    target_metadata = Base.metadata
+    if not config.get_main_option("sqlalchemy.url"):
+        config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
+
+# Postgres-only objects (see versions/0004, 0006 and 0007) and SQLite-only ones
+# (versions/0010) are not on the models
+UNMAPPED = {
+    "search_vector",
+    "search_version",
+    "ix_services_search_version",
+    "ix_services_search_vector",
+    "ix_services_title_trgm",
+    "ix_services_location_trgm",
+    "ix_services_point",
+    "ex_bookings_service_overlap",
+}
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    return not (reflected and compare_to is None and name in UNMAPPED)
+
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=config.get_main_option("sqlalchemy.url"),
+        target_metadata=target_metadata,
+        include_object=include_object,
+        literal_binds=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def _run(connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_object=include_object,
+        # SQLite cannot ALTER most constraints in place
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online() -> None:
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _run(connection)
+        return
+    engine = create_engine(config.get_main_option("sqlalchemy.url"))
+    try:
+        with engine.connect() as connection:
+            _run(connection)
+    finally:
+        engine.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,44 @@
+"""Service thumbnail_url and rating_sum
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def _columns(table):
+    return {c["name"] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade() -> None:
+    # Databases stamped at the baseline may already have these columns
+    existing = _columns("services")
+    with op.batch_alter_table("services") as batch:
+        if "thumbnail_url" not in existing:
+            batch.add_column(sa.Column("thumbnail_url", sa.String(), nullable=True))
+        if "rating_sum" not in existing:
+            batch.add_column(sa.Column("rating_sum", sa.Integer(), server_default="0", nullable=False))
+
+    if "rating_sum" not in existing:
+        # Seed the running totals from existing reviews
+        op.execute(
+            """
+            UPDATE services SET
+                rating_sum = COALESCE((SELECT SUM(r.rating) FROM reviews r WHERE r.service_id = services.id), 0),
+                review_count = (SELECT COUNT(*) FROM reviews r WHERE r.service_id = services.id)
+            """
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("services") as batch:
+        batch.drop_column("rating_sum")
+        batch.drop_column("thumbnail_url")
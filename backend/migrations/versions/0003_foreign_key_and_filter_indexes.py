@@ -0,0 +1,45 @@
+"""Indexes for foreign keys and the listing filters/sorts
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+# Each index leads with the filter/join column and ends with the sort key and
+# id, so keyset pages are read straight off the index.
+INDEXES = [
+    ("ix_services_provider_id", "services", ["provider_id", "id"]),
+    ("ix_services_category_price", "services", ["category", "price", "id"]),
+    ("ix_services_category_rating", "services", ["category", "rating", "id"]),
+    ("ix_services_price", "services", ["price", "id"]),
+    ("ix_services_rating", "services", ["rating", "id"]),
+    ("ix_bookings_user_id", "bookings", ["user_id", "id"]),
+    ("ix_bookings_service_id", "bookings", ["service_id", "id"]),
+    ("ix_reviews_service_created", "reviews", ["service_id", "created_at", "id"]),
+    ("ix_reviews_user_id", "reviews", ["user_id"]),
+]
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        # Build without locking out writes on a live table. CONCURRENTLY
+        # cannot run inside a transaction.
+        with op.get_context().autocommit_block():
+            for name, table, columns in INDEXES:
+                op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True)
+    else:
+        # Databases stamped at the baseline may already have some of these
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,44 @@
+"""Postgres full-text and trigram search
+
+`search_vector` is a generated column, so Postgres keeps it current on every
+INSERT and UPDATE without triggers. Nothing to do on other databases, which
+search through the in-process index in search.py.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+SEARCH_LANGUAGE = "english"
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute(
+        f"""ALTER TABLE services ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('{SEARCH_LANGUAGE}', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('{SEARCH_LANGUAGE}', coalesce(description, '')), 'B')
+        ) STORED"""
+    )
+    op.execute("CREATE INDEX IF NOT EXISTS ix_services_search_vector ON services USING GIN (search_vector)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_services_title_trgm ON services USING GIN (title gin_trgm_ops)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_services_location_trgm ON services USING GIN (location gin_trgm_ops)")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.execute("DROP INDEX IF EXISTS ix_services_location_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_services_title_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_services_search_vector")
+    op.execute("ALTER TABLE services DROP COLUMN IF EXISTS search_vector")
@@ -0,0 +1,46 @@
+"""Booking price snapshot and provider_stats counters
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("bookings") as batch:
+        batch.add_column(sa.Column("price", sa.Float(), nullable=True))
+    # Existing bookings were made at the service's current price
+    op.execute("UPDATE bookings SET price = (SELECT s.price FROM services s WHERE s.id = bookings.service_id)")
+
+    op.create_table(
+        "provider_stats",
+        sa.Column("provider_id", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("booking_count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("revenue", sa.Float(), server_default="0", nullable=False),
+        sa.ForeignKeyConstraint(["provider_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("provider_id", "status"),
+    )
+    op.execute(
+        """
+        INSERT INTO provider_stats (provider_id, status, booking_count, revenue)
+        SELECT s.provider_id, COALESCE(b.status, 'Pending'), COUNT(b.id), COALESCE(SUM(b.price), 0)
+        FROM bookings b JOIN services s ON s.id = b.service_id
+        WHERE s.provider_id IS NOT NULL
+        GROUP BY s.provider_id, COALESCE(b.status, 'Pending')
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("provider_stats")
+    with op.batch_alter_table("bookings") as batch:
+        batch.drop_column("price")
@@ -0,0 +1,70 @@
+"""Service coordinates and proximity indexes
+
+Existing services are geocoded from their `location` text against the
+offline gazetteer (geo.py); unknown places stay NULL and are left out of
+proximity results. Postgres also gets a GiST index on the coordinates as a
+point, which its bounding-box lookups use instead of the geohash ranges.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+try:
+    from geo import service_location
+except ImportError:
+    from backend.geo import service_location
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+GEOHASH_INDEX = ("ix_services_geohash", "services", ["geohash", "latitude", "longitude"])
+POINT_INDEX = "ix_services_point"
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("services") as batch:
+        batch.add_column(sa.Column("latitude", sa.Float(), nullable=True))
+        batch.add_column(sa.Column("longitude", sa.Float(), nullable=True))
+        batch.add_column(sa.Column("geohash", sa.String(length=12), nullable=True))
+
+    # Geocode each distinct place once; index afterwards so the backfill
+    # does not maintain them row by row
+    bind = op.get_bind()
+    locations = [row[0] for row in bind.execute(sa.text("SELECT DISTINCT location FROM services WHERE location IS NOT NULL"))]
+    for location in locations:
+        columns = service_location(location)
+        if columns["latitude"] is not None:
+            bind.execute(
+                sa.text(
+                    "UPDATE services SET latitude = :latitude, longitude = :longitude, geohash = :geohash "
+                    "WHERE location = :location"
+                ),
+                {**columns, "location": location},
+            )
+
+    name, table, columns = GEOHASH_INDEX
+    if bind.dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True)
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {POINT_INDEX} ON services "
+                "USING GIST (point(longitude, latitude))"
+            )
+    else:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(f"DROP INDEX IF EXISTS {POINT_INDEX}")
+    op.drop_index(GEOHASH_INDEX[0], table_name=GEOHASH_INDEX[1])
+    with op.batch_alter_table("services") as batch:
+        batch.drop_column("geohash")
+        batch.drop_column("longitude")
+        batch.drop_column("latitude")
@@ -0,0 +1,107 @@
+"""Booking intervals, opening hours and the no-overlap guarantee
+
+Bookings get a [start_at, end_at) interval and services a weekly calendar
+(service_hours, timezone, slot_minutes). Upcoming legacy bookings, which
+only carry a `YYYY-MM-DD` booking_date, hold their service for that whole
+UTC day; when a day was already double-booked only the oldest booking gets
+the interval. Past bookings keep NULL intervals and never conflict.
+
+Postgres also gets an exclusion constraint (btree_gist) so that two
+concurrent reservations cannot both commit overlapping intervals.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+"""
+from datetime import date, datetime, time, timedelta, timezone
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+INTERVAL_INDEX = ("ix_bookings_service_start", "bookings", ["service_id", "start_at", "end_at"])
+EXCLUSION = "ex_bookings_service_overlap"
+
+bookings = sa.table(
+    "bookings",
+    sa.column("id", sa.Integer()),
+    sa.column("start_at", sa.DateTime(timezone=True)),
+    sa.column("end_at", sa.DateTime(timezone=True)),
+)
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("services") as batch:
+        batch.add_column(sa.Column("timezone", sa.String(length=64), nullable=True))
+        batch.add_column(sa.Column("slot_minutes", sa.Integer(), nullable=True))
+    with op.batch_alter_table("bookings") as batch:
+        batch.add_column(sa.Column("start_at", sa.DateTime(timezone=True), nullable=True))
+        batch.add_column(sa.Column("end_at", sa.DateTime(timezone=True), nullable=True))
+
+    op.create_table(
+        "service_hours",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("service_id", sa.Integer(), nullable=False),
+        sa.Column("weekday", sa.Integer(), nullable=False),
+        sa.Column("opens", sa.Integer(), nullable=False),
+        sa.Column("closes", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["service_id"], ["services.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_service_hours_service", "service_hours", ["service_id", "weekday"])
+
+    bind = op.get_bind()
+    today = datetime.now(timezone.utc).date().isoformat()
+    upcoming = bind.execute(
+        sa.text(
+            "SELECT MIN(id), booking_date FROM bookings WHERE booking_date >= :today "
+            "GROUP BY service_id, booking_date"
+        ),
+        {"today": today},
+    ).all()
+    rows = []
+    for booking_id, booking_date in upcoming:
+        try:
+            day = date.fromisoformat(booking_date)
+        except ValueError:
+            continue
+        start = datetime.combine(day, time(), timezone.utc)
+        rows.append({"b_id": booking_id, "start_at": start, "end_at": start + timedelta(days=1)})
+    if rows:
+        bind.execute(
+            bookings.update()
+            .where(bookings.c.id == sa.bindparam("b_id"))
+            .values(start_at=sa.bindparam("start_at"), end_at=sa.bindparam("end_at")),
+            rows,
+        )
+
+    name, table, columns = INTERVAL_INDEX
+    if bind.dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.create_index(name, table, columns, if_not_exists=True, postgresql_concurrently=True)
+        op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        op.execute(
+            f"ALTER TABLE bookings ADD CONSTRAINT {EXCLUSION} EXCLUDE USING gist "
+            "(service_id WITH =, tstzrange(start_at, end_at) WITH &&) WHERE (start_at IS NOT NULL)"
+        )
+    else:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(f"ALTER TABLE bookings DROP CONSTRAINT IF EXISTS {EXCLUSION}")
+    op.drop_index(INTERVAL_INDEX[0], table_name=INTERVAL_INDEX[1])
+    op.drop_index("ix_service_hours_service", table_name="service_hours")
+    op.drop_table("service_hours")
+    with op.batch_alter_table("bookings") as batch:
+        batch.drop_column("end_at")
+        batch.drop_column("start_at")
+    with op.batch_alter_table("services") as batch:
+        batch.drop_column("slot_minutes")
+        batch.drop_column("timezone")
@@ -0,0 +1,149 @@
+"""booking_views read model, maintained by triggers
+
+Each booking gets one booking_views row carrying its service's title,
+image, price and provider and its customer's name, email and avatar.
+Triggers on bookings, services and users update it in the writing
+transaction, whichever code path (or manual SQL) makes the change.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    "booking_id, user_id, provider_id, service_id, service_title, service_image, price, "
+    "status, booking_date, start_at, end_at, user_name, user_email, user_avatar"
+)
+INDEXES = [
+    ("ix_booking_views_user", ["user_id", "booking_id"]),
+    ("ix_booking_views_provider", ["provider_id", "booking_id"]),
+    ("ix_booking_views_service", ["service_id"]),
+]
+BOOKING_COLUMNS = "service_id, user_id, status, booking_date, start_at, end_at"
+TRIGGERS = [
+    ("tr_booking_views_insert", "bookings"),
+    ("tr_booking_views_update", "bookings"),
+    ("tr_booking_views_delete", "bookings"),
+    ("tr_booking_views_service", "services"),
+    ("tr_booking_views_user", "users"),
+]
+FUNCTIONS = ["booking_views_from_booking", "booking_views_from_service", "booking_views_from_user"]
+
+
+def view_row(booking: str, source: str) -> str:
+    """INSERT of the booking_views row for `booking` (a table alias or NEW), read from `source`."""
+    return (
+        f"INSERT INTO booking_views ({COLUMNS}) "
+        f"SELECT {booking}.id, {booking}.user_id, s.provider_id, {booking}.service_id, s.title, s.image_url, "
+        f"s.price, {booking}.status, {booking}.booking_date, {booking}.start_at, {booking}.end_at, "
+        f"u.name, u.email, u.avatar_url "
+        f"FROM {source} "
+        f"LEFT JOIN services s ON s.id = {booking}.service_id "
+        f"LEFT JOIN users u ON u.id = {booking}.user_id"
+    )
+
+
+SERVICE_UPDATE = (
+    "UPDATE booking_views SET service_title = NEW.title, service_image = NEW.image_url, "
+    "price = NEW.price, provider_id = NEW.provider_id WHERE service_id = NEW.id"
+)
+USER_UPDATE = (
+    "UPDATE booking_views SET user_name = NEW.name, user_email = NEW.email, "
+    "user_avatar = NEW.avatar_url WHERE user_id = NEW.id"
+)
+
+
+def _sqlite_triggers():
+    # Column lists on UPDATE OF keep rating and counter updates from firing them
+    new_row = view_row("NEW", "(SELECT 1) AS one")
+    return [
+        f"CREATE TRIGGER tr_booking_views_insert AFTER INSERT ON bookings BEGIN {new_row}; END",
+        f"CREATE TRIGGER tr_booking_views_update AFTER UPDATE OF {BOOKING_COLUMNS} ON bookings BEGIN "
+        f"DELETE FROM booking_views WHERE booking_id = OLD.id; {new_row}; END",
+        "CREATE TRIGGER tr_booking_views_delete AFTER DELETE ON bookings BEGIN "
+        "DELETE FROM booking_views WHERE booking_id = OLD.id; END",
+        "CREATE TRIGGER tr_booking_views_service AFTER UPDATE OF title, image_url, price, provider_id ON services "
+        "WHEN OLD.title IS NOT NEW.title OR OLD.image_url IS NOT NEW.image_url "
+        "OR OLD.price IS NOT NEW.price OR OLD.provider_id IS NOT NEW.provider_id "
+        f"BEGIN {SERVICE_UPDATE}; END",
+        "CREATE TRIGGER tr_booking_views_user AFTER UPDATE OF name, email, avatar_url ON users "
+        "WHEN OLD.name IS NOT NEW.name OR OLD.email IS NOT NEW.email OR OLD.avatar_url IS NOT NEW.avatar_url "
+        f"BEGIN {USER_UPDATE}; END",
+    ]
+
+
+def _postgres_triggers():
+    new_row = view_row("NEW", "(SELECT 1) AS one")
+    return [
+        "CREATE FUNCTION booking_views_from_booking() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+        "IF TG_OP <> 'INSERT' THEN DELETE FROM booking_views WHERE booking_id = OLD.id; END IF; "
+        f"IF TG_OP <> 'DELETE' THEN {new_row}; END IF; "
+        "RETURN NULL; END $$",
+        f"CREATE FUNCTION booking_views_from_service() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+        f"{SERVICE_UPDATE}; RETURN NULL; END $$",
+        f"CREATE FUNCTION booking_views_from_user() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+        f"{USER_UPDATE}; RETURN NULL; END $$",
+        "CREATE TRIGGER tr_booking_views_insert AFTER INSERT ON bookings "
+        "FOR EACH ROW EXECUTE FUNCTION booking_views_from_booking()",
+        f"CREATE TRIGGER tr_booking_views_update AFTER UPDATE OF {BOOKING_COLUMNS} ON bookings "
+        "FOR EACH ROW EXECUTE FUNCTION booking_views_from_booking()",
+        "CREATE TRIGGER tr_booking_views_delete AFTER DELETE ON bookings "
+        "FOR EACH ROW EXECUTE FUNCTION booking_views_from_booking()",
+        "CREATE TRIGGER tr_booking_views_service AFTER UPDATE OF title, image_url, price, provider_id ON services "
+        "FOR EACH ROW WHEN (OLD.title IS DISTINCT FROM NEW.title OR OLD.image_url IS DISTINCT FROM NEW.image_url "
+        "OR OLD.price IS DISTINCT FROM NEW.price OR OLD.provider_id IS DISTINCT FROM NEW.provider_id) "
+        "EXECUTE FUNCTION booking_views_from_service()",
+        "CREATE TRIGGER tr_booking_views_user AFTER UPDATE OF name, email, avatar_url ON users "
+        "FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.email IS DISTINCT FROM NEW.email "
+        "OR OLD.avatar_url IS DISTINCT FROM NEW.avatar_url) "
+        "EXECUTE FUNCTION booking_views_from_user()",
+    ]
+
+
+def upgrade() -> None:
+    op.create_table(
+        "booking_views",
+        sa.Column("booking_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("provider_id", sa.Integer(), nullable=True),
+        sa.Column("service_id", sa.Integer(), nullable=True),
+        sa.Column("service_title", sa.String(), nullable=True),
+        sa.Column("service_image", sa.String(), nullable=True),
+        sa.Column("price", sa.Float(), nullable=True),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("booking_date", sa.String(), nullable=True),
+        sa.Column("start_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("end_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("user_name", sa.String(), nullable=True),
+        sa.Column("user_email", sa.String(), nullable=True),
+        sa.Column("user_avatar", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("booking_id"),
+    )
+    # Triggers first, then the backfill, in one transaction: no booking
+    # written meanwhile can be missed
+    postgres = op.get_bind().dialect.name == "postgresql"
+    for statement in _postgres_triggers() if postgres else _sqlite_triggers():
+        op.execute(statement)
+    op.execute(view_row("b", "bookings b"))
+    for name, columns in INDEXES:
+        op.create_index(name, "booking_views", columns)
+
+
+def downgrade() -> None:
+    postgres = op.get_bind().dialect.name == "postgresql"
+    for name, table in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}" + (f" ON {table}" if postgres else ""))
+    if postgres:
+        for name in FUNCTIONS:
+            op.execute(f"DROP FUNCTION IF EXISTS {name}()")
+    for name, _ in INDEXES:
+        op.drop_index(name, table_name="booking_views")
+    op.drop_table("booking_views")
@@ -0,0 +1,48 @@
+"""search_version: change counter for the in-process search index
+
+Every worker keeps its own copy of the SQLite search index (search.py). A
+trigger stamps each inserted service, and each title or description
+change, with the next search_version, so a worker re-reads exactly the
+rows changed since its last sync, including rows written by other workers.
+Nothing to do on Postgres, which searches the generated search_vector
+column of migration 0004.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+STAMP = (
+    "UPDATE services SET search_version = "
+    "(SELECT coalesce(max(search_version), 0) + 1 FROM services) WHERE id = NEW.id"
+)
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    op.execute("ALTER TABLE services ADD COLUMN search_version INTEGER")
+    op.execute("UPDATE services SET search_version = id")
+    op.execute("CREATE INDEX ix_services_search_version ON services (search_version)")
+    op.execute(f"CREATE TRIGGER tr_services_search_insert AFTER INSERT ON services BEGIN {STAMP}; END")
+    op.execute(
+        "CREATE TRIGGER tr_services_search_update AFTER UPDATE OF title, description ON services "
+        "WHEN NEW.title IS NOT OLD.title OR NEW.description IS NOT OLD.description "
+        f"BEGIN {STAMP}; END"
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    op.execute("DROP TRIGGER IF EXISTS tr_services_search_update")
+    op.execute("DROP TRIGGER IF EXISTS tr_services_search_insert")
+    op.execute("DROP INDEX IF EXISTS ix_services_search_version")
+    op.execute("ALTER TABLE services DROP COLUMN search_version")
@@ -0,0 +1,28 @@
+"""Backfill NULL service prices and ratings with 0
+
+Keyset pagination orders by the raw price and rating columns, and a NULL
+in a row-value comparison is neither before nor after the cursor, so
+legacy rows with no price or rating were skipped or repeated across pages.
+Every response already showed them as 0.0.
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+
+revision = "0011"
+down_revision = "0010"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("UPDATE services SET price = 0 WHERE price IS NULL")
+    op.execute("UPDATE services SET rating = 0 WHERE rating IS NULL")
+
+
+def downgrade() -> None:
+    # Which rows were NULL is not recorded; 0 reads the same everywhere
+    pass
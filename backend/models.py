@@ -8,24 +8,88 @@ from sqlalchemy import (
     Float,
     ForeignKey,
     DateTime,
+    Index,
+    Numeric,
+    cast,
     create_engine,
+    delete,
+    func,
+    insert,
+    select,
+    update,
 )
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, declarative_base, relationship, sessionmaker
+
+try:
+    from .metrics import timed_pool_class
+except ImportError:
+    from metrics import timed_pool_class
 
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
     "ADD YOUR DATA BASE URL (ALso GIve Us A STAr)",
 )
 
-engine_kwargs = {}
-if DATABASE_URL.startswith("sqlite"):
-    engine_kwargs["connect_args"] = {"check_same_thread": False}
+# Serve requests through AsyncSession (asyncpg / aiosqlite) instead of
+# blocking threadpool workers on a sync Session.
+DB_ASYNC = os.getenv("DB_ASYNC", "0").lower() in ("1", "true", "yes")
+
+# Connection pool tuning (ignored for SQLite, which pools per file/thread)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() in ("1", "true", "yes")
+
+# Apply pending migrations when the app starts. Turn off when deploys run
+# `python -m backend.manage migrate` themselves.
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "1").lower() in ("1", "true", "yes")
+
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def engine_kwargs(url: str, pool_size: int = DB_POOL_SIZE, max_overflow: int = DB_MAX_OVERFLOW) -> dict:
+    # Times every pool checkout for the metrics (see metrics.py)
+    kwargs = {"pool_pre_ping": DB_POOL_PRE_PING, "poolclass": timed_pool_class(url)}
+    if url.startswith("sqlite"):
+        kwargs["connect_args"] = {"check_same_thread": False}
+    else:
+        kwargs.update(
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return kwargs
 
-engine = create_engine(DATABASE_URL, **engine_kwargs)
+
+def async_database_url(url: str) -> str:
+    """Swap the driver in `url` for its asyncio counterpart."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for '{backend}' databases")
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+engine = create_engine(DATABASE_URL, **engine_kwargs(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
+    async_engine = create_async_engine(
+        async_database_url(DATABASE_URL), **engine_kwargs(async_database_url(DATABASE_URL))
+    )
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False)
+
+
+# Schema changes ship as Alembic revisions in backend/migrations/versions;
+# the models only describe the current shape of the tables.
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -46,12 +110,36 @@ class Service(Base):
     location = Column(String)
     price = Column(Float)
     image_url = Column(String)
+    # Smallest generated variant of image_url, used by list views
+    thumbnail_url = Column(String, nullable=True)
     rating = Column(Float, default=0.0)
     review_count = Column(Integer, default=0)
+    # Running total of review ratings, so a new review updates the average in O(1)
+    rating_sum = Column(Integer, default=0, server_default="0", nullable=False)
+    # Geocoded from `location` (see geo.py); NULL when the place is unknown
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geohash = Column(String(12), nullable=True)
+    # Booking calendar (see scheduling.py): IANA zone of the opening hours and
+    # slot length; slot_minutes stays NULL until the provider publishes hours
+    timezone = Column(String(64), nullable=True)
+    slot_minutes = Column(Integer, nullable=True)
 
     provider = relationship("User", backref="services")
     reviews = relationship("Review", back_populates="service")
 
+    # Keyset pagination: one index per sort order, with and without category
+    __table_args__ = (
+        Index("ix_services_category_price", "category", "price", "id"),
+        Index("ix_services_category_rating", "category", "rating", "id"),
+        Index("ix_services_price", "price", "id"),
+        Index("ix_services_rating", "rating", "id"),
+        Index("ix_services_provider_id", "provider_id", "id"),
+        # Proximity search: geohash prefix ranges, with the coordinates in the
+        # index so the bounding-box check needs no table lookups
+        Index("ix_services_geohash", "geohash", "latitude", "longitude"),
+    )
+
 
 class Booking(Base):
     __tablename__ = "bookings"
@@ -60,10 +148,71 @@ class Booking(Base):
     user_id = Column(Integer, ForeignKey("users.id"))
     booking_date = Column(String)
     status = Column(String, default="Pending")
+    # Service price when the booking was made; provider revenue is summed from it
+    price = Column(Float, nullable=True)
+    # Interval the booking holds its service for; bookings of one service never
+    # overlap. NULL only on legacy rows dated before migration 0007.
+    start_at = Column(DateTime(timezone=True), nullable=True)
+    end_at = Column(DateTime(timezone=True), nullable=True)
 
     service = relationship("Service")
     user = relationship("User")
 
+    __table_args__ = (
+        Index("ix_bookings_user_id", "user_id", "id"),
+        Index("ix_bookings_service_id", "service_id", "id"),
+        # Overlap checks and availability: a start_at range scan per service
+        Index("ix_bookings_service_start", "service_id", "start_at", "end_at"),
+    )
+
+
+class BookingView(Base):
+    """Read model of a booking with its service and customer copied in.
+
+    Filled and kept current by triggers on bookings, services and users
+    (migration 0009), in the transaction of each write, so the booking lists
+    read one table in index order instead of joining three.
+    """
+
+    __tablename__ = "booking_views"
+    booking_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    provider_id = Column(Integer)
+    service_id = Column(Integer)
+    service_title = Column(String)
+    service_image = Column(String)
+    # The service's current price, as the booking lists have always shown
+    price = Column(Float)
+    status = Column(String)
+    booking_date = Column(String)
+    start_at = Column(DateTime(timezone=True))
+    end_at = Column(DateTime(timezone=True))
+    user_name = Column(String)
+    user_email = Column(String)
+    user_avatar = Column(String)
+
+    __table_args__ = (
+        Index("ix_booking_views_user", "user_id", "booking_id"),
+        Index("ix_booking_views_provider", "provider_id", "booking_id"),
+        # Fan-out of service edits by the services trigger
+        Index("ix_booking_views_service", "service_id"),
+    )
+
+
+class ServiceHours(Base):
+    """One weekly opening window of a service, in the service's timezone."""
+
+    __tablename__ = "service_hours"
+    id = Column(Integer, primary_key=True)
+    service_id = Column(Integer, ForeignKey("services.id"), nullable=False)
+    # Monday is 0
+    weekday = Column(Integer, nullable=False)
+    # Minutes after local midnight, closes exclusive
+    opens = Column(Integer, nullable=False)
+    closes = Column(Integer, nullable=False)
+
+    __table_args__ = (Index("ix_service_hours_service", "service_id", "weekday"),)
+
 
 class Review(Base):
     __tablename__ = "reviews"
@@ -77,10 +226,157 @@ class Review(Base):
     user = relationship("User")
     service = relationship("Service", back_populates="reviews")
 
+    __table_args__ = (
+        Index("ix_reviews_service_created", "service_id", "created_at", "id"),
+        Index("ix_reviews_user_id", "user_id"),
+    )
+
+
+class ProviderStats(Base):
+    """Booking count and revenue per provider and booking status.
+
+    Maintained by every booking write through bump_provider_stats, so the
+    dashboard reads a handful of rows instead of scanning the bookings.
+    """
+
+    __tablename__ = "provider_stats"
+    provider_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    status = Column(String, primary_key=True)
+    booking_count = Column(Integer, default=0, server_default="0", nullable=False)
+    revenue = Column(Float, default=0.0, server_default="0", nullable=False)
+
+
+class Job(Base):
+    """A unit of deferred work, run by a worker (see jobs.py)."""
+
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(64), nullable=False)
+    # JSON arguments for the handler of `kind`
+    payload = Column(String, nullable=False)
+    # Producers that might enqueue the same work twice name it; the second
+    # copy is dropped while the first is retained
+    idempotency_key = Column(String(200), nullable=True)
+    # queued -> running -> done, or back to queued for a retry, or failed
+    status = Column(String(16), nullable=False, default="queued")
+    attempts = Column(Integer, nullable=False, default=0)
+    run_at = Column(DateTime(timezone=True), nullable=False)
+    # End of the running worker's lease; an expired lease is claimed again
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_at", "status", "run_at"),
+        Index("ux_jobs_idempotency_key", "idempotency_key", unique=True),
+    )
+
+
+def average_rating(total, count):
+    """SQL average of `total` over `count`, rounded half away from zero to one decimal."""
+    return func.round(cast(cast(total, Float) / count, Numeric), 1)
+
+
+def rating_increment(rating: int) -> dict:
+    """Column values that fold one more review into a service's aggregate.
+
+    Evaluated by the database against the current row, so concurrent reviews
+    cannot overwrite each other's increments.
+    """
+    new_sum = func.coalesce(Service.rating_sum, 0) + rating
+    new_count = func.coalesce(Service.review_count, 0) + 1
+    return {
+        "rating_sum": new_sum,
+        "review_count": new_count,
+        "rating": average_rating(new_sum, new_count),
+    }
+
+
+def repair_rating_aggregates(db: Session) -> int:
+    """Recompute every service's rating aggregate from a single GROUP BY pass.
+
+    One UPDATE ... FROM the per-service totals, rounded by the same SQL as
+    rating_increment, plus one that zeroes services without reviews.
+    Returns the number of services that have reviews. The caller commits.
+    """
+    totals = (
+        select(
+            Review.service_id.label("service_id"),
+            func.coalesce(func.sum(Review.rating), 0).label("total"),
+            func.count(Review.id).label("count"),
+        )
+        .group_by(Review.service_id)
+        .subquery()
+    )
+    db.execute(
+        update(Service)
+        .where(~select(Review.id).where(Review.service_id == Service.id).exists())
+        .values(rating_sum=0, review_count=0, rating=0.0),
+        execution_options={"synchronize_session": False},
+    )
+    result = db.execute(
+        update(Service)
+        .where(Service.id == totals.c.service_id)
+        .values(
+            rating_sum=totals.c.total,
+            review_count=totals.c.count,
+            rating=average_rating(totals.c.total, totals.c.count),
+        ),
+        execution_options={"synchronize_session": False},
+    )
+    return result.rowcount
+
+
+def bump_provider_stats(db: Session, provider_id: int, status: str, bookings: int, revenue: float) -> None:
+    """Add `bookings` and `revenue` to one provider/status counter row. The caller commits."""
+    bump_provider_stats_many(db, {(provider_id, status): (bookings, revenue)})
+
+
+def bump_provider_stats_many(db: Session, deltas: dict) -> None:
+    """Apply `{(provider_id, status): (bookings, revenue)}` to the counters.
+
+    One INSERT ... ON CONFLICT DO UPDATE per batch, so the first booking
+    creates a row and concurrent writers add to it atomically.
+    """
+    rows = [
+        {"provider_id": provider_id, "status": status, "booking_count": bookings, "revenue": revenue or 0.0}
+        for (provider_id, status), (bookings, revenue) in deltas.items()
+        if provider_id is not None
+    ]
+    if not rows:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    statement = upsert(ProviderStats)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[ProviderStats.provider_id, ProviderStats.status],
+            set_={
+                "booking_count": ProviderStats.booking_count + statement.excluded.booking_count,
+                "revenue": ProviderStats.revenue + statement.excluded.revenue,
+            },
+        ),
+        rows,
+    )
 
-def init_db() -> None:
-    Base.metadata.create_all(bind=engine)
 
+def repair_provider_stats(db: Session) -> int:
+    """Rebuild provider_stats from the bookings in one GROUP BY pass.
 
-# Create tables immediately when the module is imported
-init_db()
+    Returns the number of counter rows written. The caller commits.
+    """
+    status = func.coalesce(Booking.status, "Pending")
+    db.execute(delete(ProviderStats))
+    result = db.execute(
+        insert(ProviderStats).from_select(
+            ["provider_id", "status", "booking_count", "revenue"],
+            select(Service.provider_id, status, func.count(Booking.id), func.coalesce(func.sum(Booking.price), 0.0))
+            .join(Service, Service.id == Booking.service_id)
+            .where(Service.provider_id.isnot(None))
+            .group_by(Service.provider_id, status),
+        )
+    )
+    return result.rowcount
@@ -0,0 +1,134 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Callable, Optional, Sequence
+
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+# --- CONFIGURATION ---
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Most ids paginate_ranked checks against the filters in one query
+MAX_RANKED_BATCH = 1000
+
+
+class KeysetOrder:
+    """A sort order that can be resumed from the last row of a page.
+
+    `columns` must end with a unique column (the primary key) so the order is
+    total, and all columns share one direction so the cursor condition is a
+    single row-value comparison that a composite index can seek to. They must
+    never be NULL, which compares as neither before nor after anything.
+
+    The cursor holds the values of `columns` themselves, selected alongside
+    each page, so it compares exactly as the ORDER BY sorted.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        columns: Sequence,
+        descending: bool = True,
+        parsers: Optional[Sequence[Callable]] = None,
+    ):
+        self.name = name
+        self.columns = list(columns)
+        self.descending = descending
+        self.parsers = list(parsers) if parsers else [None] * len(self.columns)
+
+    def order_by(self):
+        return [c.desc() if self.descending else c.asc() for c in self.columns]
+
+    def key_columns(self):
+        return [c.label(f"keyset_{i}") for i, c in enumerate(self.columns)]
+
+    def after(self, values):
+        """SQL condition selecting rows strictly after `values` in this order."""
+        row, bound = tuple_(*self.columns), tuple_(*values)
+        return row < bound if self.descending else row > bound
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__} in a cursor")
+
+
+def encode_cursor(name: str, values) -> str:
+    raw = json.dumps({"s": name, "k": list(values)}, separators=(",", ":"), default=_json_default)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(name: str, cursor: str, parsers: Sequence[Optional[Callable]]):
+    """Decode a cursor issued for sort order `name`; HTTP 400 on anything else."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        values = data["k"]
+        if data["s"] != name or len(values) != len(parsers):
+            raise ValueError("cursor does not match sort order")
+        return [parse(v) if parse and v is not None else v for parse, v in zip(parsers, values)]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    if limit is None:
+        return DEFAULT_LIMIT
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def paginate(query, order: KeysetOrder, cursor: Optional[str], limit: Optional[int]):
+    """Fetch one page of `query` in `order`.
+
+    Returns `(rows, next_cursor)`; `next_cursor` is None on the last page. The
+    cursor condition is pushed into SQL, so page N costs the same as page 1.
+    Rows end with the order's columns, which the serializers ignore.
+    """
+    limit = clamp_limit(limit)
+    if cursor:
+        query = query.filter(order.after(decode_cursor(order.name, cursor, order.parsers)))
+    rows = query.add_columns(*order.key_columns()).order_by(*order.order_by()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(order.name, tuple(rows[-1])[-len(order.columns):])
+
+
+def paginate_ranked(
+    matches,
+    cursor: Optional[str],
+    limit: Optional[int],
+    keep: Optional[Callable] = None,
+    name: str = "relevance",
+):
+    """One page of a `search.Matches`, resuming right after the cursor.
+
+    `keep(ids)` returns those of `ids` that pass the other filters. Matches
+    are handed to it in growing batches until the page is full, so a page
+    costs about as much however many documents match.
+    """
+    limit = clamp_limit(limit)
+    start = matches.after(decode_cursor(name, cursor, [float, int])) if cursor else 0
+    page = []
+    size = limit + 1
+    while len(page) <= limit and start < len(matches):
+        batch = matches.ranked[start:start + size]
+        start += size
+        if keep is not None:
+            kept = keep([doc_id for _, doc_id in batch])
+            batch = [row for row in batch if row[1] in kept]
+        page.extend(batch)
+        size = min(size * 2, MAX_RANKED_BATCH)
+    if len(page) <= limit:
+        return page, None
+    page = page[:limit]
+    return page, encode_cursor(name, page[-1])
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]) -> None:
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
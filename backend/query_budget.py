@@ -0,0 +1,144 @@
+"""SQL statement budgets for the listing endpoints.
+
+Run with: python -m backend.query_budget
+
+Seeds a throwaway SQLite database at two sizes, calls every listing endpoint
+and exits non-zero if any of them issues more statements than its budget.
+Because the budget is checked at both sizes, an N+1 regression fails even when
+the small run happens to fit. Every request is measured against an empty
+response cache, and one that runs no statement at all fails too: it was not
+measured.
+"""
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# Statements allowed per request, independent of result size.
+QUERY_BUDGETS = {
+    "/services": 1,
+    # SQLite search: index sync, filter the matches (with other filters only), load one page
+    "/services?q=plumbing": 3,
+    # One page plus one aggregate for every facet
+    "/services?facets=true&category=Plumbing": 2,
+    "/services/{service_id}": 1,
+    "/services/provider/{provider_id}": 1,
+    "/bookings/user/{user_id}": 1,
+    "/bookings/provider/{provider_id}": 1,
+    "/reviews/service/{service_id}": 1,
+    # Service calendar, booked intervals in range
+    "/services/{service_id}/availability": 2,
+    # Status counters, service/rating totals, recent bookings
+    "/providers/{provider_id}/dashboard": 3,
+}
+SIZES = (5, 200)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries(bind):
+    """Record every statement executed on `bind` inside the block."""
+    counter = QueryCounter()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter.statements.append(statement)
+
+    event.listen(bind, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(bind, "before_cursor_execute", before_cursor_execute)
+
+
+def _seed(models, size: int):
+    db = models.SessionLocal()
+    try:
+        provider = models.User(name="Budget Provider", email=f"provider{size}@budget.test",
+                               hashed_password="x", role="PROVIDER")
+        customer = models.User(name="Budget User", email=f"user{size}@budget.test",
+                               hashed_password="x", role="USER")
+        db.add_all([provider, customer])
+        db.flush()
+        services = [
+            models.Service(provider_id=provider.id, title=f"Plumbing job {i}",
+                           description="Pipes and drains", category="Plumbing",
+                           location="Brooklyn, NY", price=100.0, image_url="")
+            for i in range(size)
+        ]
+        db.add_all(services)
+        db.flush()
+        db.add_all(
+            models.Booking(service_id=s.id, user_id=customer.id, booking_date="2026-01-01")
+            for s in services
+        )
+        db.add_all(
+            models.Review(service_id=services[0].id, user_id=customer.id, rating=5, comment="ok")
+            for _ in range(size)
+        )
+        db.commit()
+        return {"service_id": services[0].id, "provider_id": provider.id, "user_id": customer.id}
+    finally:
+        db.close()
+
+
+def run_budget_check() -> int:
+    try:
+        from . import main as app_module
+        from .cache import create_backend
+    except ImportError:
+        import main as app_module
+        from cache import create_backend
+    from fastapi.testclient import TestClient
+
+    failures = []
+    # Entering the client runs startup, which migrates the fresh database
+    with TestClient(app_module.app) as client:
+        # Let the startup prewarm finish, so its queries are not counted
+        while client.get("/health/ready").status_code != 200:
+            time.sleep(0.05)
+        for size in SIZES:
+            ids = _seed(app_module, size)
+            for route, budget in QUERY_BUDGETS.items():
+                url = route.format(**ids)
+                # _seed bumps no cache tags, so drop every page cached so far
+                app_module.response_cache.backend = create_backend("memory")
+                with count_queries(app_module.engine) as counter:
+                    response = client.get(url)
+                if not counter.count:
+                    status = "NO QUERIES"
+                elif counter.count > budget:
+                    status = "OVER BUDGET"
+                else:
+                    status = "ok"
+                print(f"{size:>5} rows  {url:<40} {response.status_code}  "
+                      f"{counter.count}/{budget} queries  {status}")
+                if response.status_code != 200 or status != "ok":
+                    failures.append((size, url, counter.statements))
+
+    for size, url, statements in failures:
+        print(f"\n{url} at {size} rows:")
+        for statement in statements:
+            print(f"  {statement}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    workdir = tempfile.mkdtemp(prefix="query-budget-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'budget.db')}"
+    # Measure cold requests, not pages cached by the startup prewarm
+    os.environ["PREWARM"] = "0"
+    # Nor the job worker's polling, which shares the engine being counted
+    os.environ["JOBS_IN_PROCESS"] = "0"
+    os.chdir(workdir)
+    sys.exit(run_budget_check())
@@ -0,0 +1,199 @@
+"""Read replicas: GET requests read from a replica, everything else from the primary.
+
+DATABASE_REPLICA_URLS lists the replicas, comma separated; without it every
+session uses the primary as before. Replicas have pools of their own
+(DB_REPLICA_POOL_SIZE, DB_REPLICA_MAX_OVERFLOW), so catalog browsing and
+bookings no longer wait on each other's connections.
+
+Read-your-writes: a successful write sets a short-lived cookie, and reads
+that carry it go to the primary until it expires (REPLICA_STICKY_SECONDS).
+The frontend is on another origin, so services/api.ts sends every request
+with credentials and the API allows exactly the CORS_ORIGINS it is served
+from. The cookie is SameSite=Lax, which covers a frontend on the same site
+(localhost:3000 and localhost:8000 are one site; ports do not count).
+
+A background check measures each replica's replay lag. A replica that is
+more than REPLICA_MAX_LAG_SECONDS behind, or that fails to connect, is
+skipped until a later check finds it healthy again; with none left, reads
+fall back to the primary. A listing cached from a replica can trail a
+write by up to that lag, until CACHE_TTL or the next invalidation.
+"""
+import asyncio
+import itertools
+import math
+import os
+import time
+from typing import Optional
+
+import anyio
+from fastapi import Request
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+
+try:
+    from .metrics import instrument_engine, registry, stats_gauge
+    from .models import DB_ASYNC, async_database_url, engine_kwargs
+except ImportError:
+    from metrics import instrument_engine, registry, stats_gauge
+    from models import DB_ASYNC, async_database_url, engine_kwargs
+
+# --- CONFIGURATION ---
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+DB_REPLICA_POOL_SIZE = int(os.getenv("DB_REPLICA_POOL_SIZE", "10"))
+DB_REPLICA_MAX_OVERFLOW = int(os.getenv("DB_REPLICA_MAX_OVERFLOW", "20"))
+# How long a client reads from the primary after it wrote something
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "2"))
+REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", "2"))
+
+STICKY_COOKIE = "read_primary_until"
+READ_METHODS = ("GET", "HEAD")
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Seconds since the last replayed transaction, or 0 when the standby has
+# replayed everything it received (an idle primary is not lag)
+POSTGRES_LAG = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class Replica:
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = make_url(url).render_as_string(hide_password=True)
+        self.engine = create_engine(url, **engine_kwargs(url, DB_REPLICA_POOL_SIZE, DB_REPLICA_MAX_OVERFLOW))
+        self.async_engine = None
+        if DB_ASYNC:
+            from sqlalchemy.ext.asyncio import create_async_engine
+
+            async_url = async_database_url(url)
+            self.async_engine = create_async_engine(
+                async_url, **engine_kwargs(async_url, DB_REPLICA_POOL_SIZE, DB_REPLICA_MAX_OVERFLOW)
+            )
+            instrument_engine(self.async_engine, f"{name}_async")
+        instrument_engine(self.engine, name)
+        self.healthy = True
+        self.lag = 0.0
+        self.error = None
+        for sync_engine in (self.engine, getattr(self.async_engine, "sync_engine", None)):
+            if sync_engine is not None:
+                event.listen(sync_engine, "handle_error", self._on_error)
+
+    def _on_error(self, context) -> None:
+        # Lost or refused connections take the replica out right away rather
+        # than at the next check; query errors say nothing about its health
+        if context.is_disconnect or context.connection is None:
+            self.healthy = False
+            self.error = str(context.original_exception)
+
+    def check(self) -> None:
+        try:
+            with self.engine.connect() as conn:
+                if conn.dialect.name == "postgresql":
+                    self.lag = float(conn.execute(POSTGRES_LAG).scalar() or 0)
+                else:
+                    conn.execute(text("SELECT 1"))
+                    self.lag = 0.0
+            self.healthy = self.lag <= REPLICA_MAX_LAG_SECONDS
+            self.error = None if self.healthy else f"{self.lag:.1f}s behind"
+        except Exception as e:
+            self.healthy = False
+            self.error = str(e)
+
+
+class ReplicaSet:
+    def __init__(self, urls=DATABASE_REPLICA_URLS):
+        self.replicas = [Replica(f"replica{i}", url) for i, url in enumerate(urls)]
+        self._turn = itertools.count()
+        self.replica_reads = 0
+        self.sticky_reads = 0
+        self.fallback_reads = 0
+
+    def choose(self) -> Optional[Replica]:
+        """The next healthy replica, round robin; None when there is none."""
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._turn) % len(healthy)]
+
+    def for_request(self, request: Request) -> Optional[Replica]:
+        """Replica to serve `request` from, or None for the primary.
+
+        The choice is kept in `request.state.read_replica` for the response cache.
+        """
+        if not self.replicas or request.method not in READ_METHODS:
+            return None
+        if is_sticky(request):
+            self.sticky_reads += 1
+            return None
+        replica = self.choose()
+        if replica is None:
+            self.fallback_reads += 1
+        else:
+            self.replica_reads += 1
+            request.state.read_replica = replica.name
+        return replica
+
+    def check(self) -> None:
+        for replica in self.replicas:
+            replica.check()
+
+    async def monitor(self) -> None:
+        """Re-check every replica each REPLICA_CHECK_SECONDS until cancelled."""
+        while True:
+            await anyio.to_thread.run_sync(self.check)
+            await asyncio.sleep(REPLICA_CHECK_SECONDS)
+
+    async def dispose(self, close: bool = True) -> None:
+        for replica in self.replicas:
+            replica.engine.dispose(close=close)
+            if replica.async_engine is not None:
+                await replica.async_engine.dispose(close=close)
+
+    def stats(self) -> dict:
+        return {
+            "replicas": len(self.replicas),
+            "healthy": sum(replica.healthy for replica in self.replicas),
+            "replica_reads": self.replica_reads,
+            "sticky_reads": self.sticky_reads,
+            "fallback_reads": self.fallback_reads,
+        }
+
+    def lag(self) -> dict:
+        return {(replica.name,): replica.lag for replica in self.replicas}
+
+
+replicas = ReplicaSet()
+stats_gauge("db_replicas", "Healthy replicas and where GET requests were read from", replicas.stats)
+registry.gauge("db_replica_lag_seconds", "Replay lag at the last check", replicas.lag, ("replica",))
+
+
+# --- READ-YOUR-WRITES ---
+def is_sticky(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReadYourWritesMiddleware:
+    """Send clients that just wrote to the primary for their next reads."""
+
+    def __init__(self, app):
+        self.app = app
+        self.max_age = math.ceil(REPLICA_STICKY_SECONDS)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not replicas.replicas or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + REPLICA_STICKY_SECONDS
+                cookie = f"{STICKY_COOKIE}={until:.3f}; Max-Age={self.max_age}; Path=/; HttpOnly; SameSite=Lax"
+                message = {**message, "headers": [*message.get("headers", ()), (b"set-cookie", cookie.encode())]}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,198 @@
+"""Opening hours, free slots and conflict-free booking reservations.
+
+A booking holds its service for [start_at, end_at), and two bookings of one
+service may not overlap. The reservation is a single INSERT ... SELECT ...
+WHERE NOT EXISTS, which SQLite runs under its database write lock; on
+Postgres, where two such statements can pass the check concurrently, the
+exclusion constraint from migration 0007 turns the loser away.
+"""
+import os
+from collections import defaultdict, namedtuple
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy import and_, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+try:
+    from .models import Booking, Service, ServiceHours
+except ImportError:
+    from models import Booking, Service, ServiceHours
+
+# --- CONFIGURATION ---
+DEFAULT_SLOT_MINUTES = 60
+# Weekly hours of services that have not published their own, as
+# (weekday, opens, closes): Monday is 0, times are minutes after local midnight
+DEFAULT_HOURS = tuple((weekday, 9 * 60, 17 * 60) for weekday in range(7))
+# Longest reservation. Overlap lookups scan the (service_id, start_at) index
+# from `start - MAX_BOOKING` on instead of from the service's first booking.
+MAX_BOOKING = timedelta(days=1)
+# Widest date range one availability request may cover
+MAX_AVAILABILITY_DAYS = int(os.getenv("MAX_AVAILABILITY_DAYS", "62"))
+
+# Postgres SQLSTATE of an exclusion constraint violation
+EXCLUSION_VIOLATION = "23P01"
+
+Interval = Tuple[datetime, datetime]
+Calendar = namedtuple("Calendar", "service_id provider_id price zone slot_minutes hours")
+
+
+# --- TIME ---
+def utc(value: datetime) -> datetime:
+    """`value` as an aware UTC datetime; naive values (SQLite) are taken as UTC."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def service_zone(name: Optional[str]) -> ZoneInfo:
+    """The IANA zone `name` (UTC when empty); ValueError when it is unknown."""
+    try:
+        return ZoneInfo(name or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone '{name}'")
+
+
+def parse_clock(value: str) -> int:
+    """`"HH:MM"` (00:00-24:00) as minutes after midnight; ValueError otherwise."""
+    hours, _, minutes = value.partition(":")
+    total = int(hours) * 60 + int(minutes or 0)
+    if not (0 <= int(minutes or 0) < 60 and 0 <= total <= 24 * 60):
+        raise ValueError(f"Invalid time '{value}'")
+    return total
+
+
+def format_clock(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+# --- SLOTS ---
+def opening_windows(hours: Iterable[tuple], zone: ZoneInfo, first_day: date, last_day: date) -> List[Interval]:
+    """UTC intervals the service is open on the local days `first_day` up to `last_day` (exclusive)."""
+    by_weekday = defaultdict(list)
+    for weekday, opens, closes in hours:
+        by_weekday[weekday].append((opens, closes))
+    windows = []
+    day = first_day
+    while day < last_day:
+        # Wall-clock arithmetic on the local midnight, so 09:00 stays 09:00
+        # across daylight saving changes
+        midnight = datetime.combine(day, time(), zone)
+        for opens, closes in sorted(by_weekday[day.weekday()]):
+            windows.append((
+                utc(midnight + timedelta(minutes=opens)),
+                utc(midnight + timedelta(minutes=closes)),
+            ))
+        day += timedelta(days=1)
+    return windows
+
+
+def slots(windows: Iterable[Interval], slot_minutes: int) -> List[Interval]:
+    """Back-to-back slots of `slot_minutes` inside each window; a short tail is dropped."""
+    length = timedelta(minutes=slot_minutes)
+    result = []
+    for start, end in windows:
+        while start + length <= end:
+            result.append((start, start + length))
+            start += length
+    return result
+
+
+def free_slots(candidates: List[Interval], busy: List[Interval]) -> List[Interval]:
+    """`candidates` without the ones overlapping a `busy` interval.
+
+    Both lists are sorted by start and the candidates do not overlap each
+    other, so one sweep over both is enough: a slot is taken when the latest
+    end among the busy intervals starting before it ends lies past its start.
+    """
+    free, index, reach = [], 0, None
+    for start, end in candidates:
+        while index < len(busy) and busy[index][0] < end:
+            if reach is None or busy[index][1] > reach:
+                reach = busy[index][1]
+            index += 1
+        if reach is None or reach <= start:
+            free.append((start, end))
+    return free
+
+
+def within_hours(calendar: Calendar, start: datetime, end: datetime) -> bool:
+    """Whether [start, end) lies inside one opening window of the service."""
+    day = start.astimezone(calendar.zone).date()
+    windows = opening_windows(calendar.hours, calendar.zone, day, day + timedelta(days=1))
+    return any(opens <= start and end <= closes for opens, closes in windows)
+
+
+# --- QUERIES ---
+def load_calendars(db: Session, service_ids: Iterable[int]) -> dict:
+    """`{service_id: Calendar}` for the existing services among `service_ids`, in one query."""
+    calendars = {}
+    rows = (
+        db.query(
+            Service.id, Service.provider_id, Service.price, Service.timezone, Service.slot_minutes,
+            ServiceHours.weekday, ServiceHours.opens, ServiceHours.closes,
+        )
+        .outerjoin(ServiceHours, ServiceHours.service_id == Service.id)
+        .filter(Service.id.in_(set(service_ids)))
+    )
+    for service_id, provider_id, price, zone, slot_minutes, weekday, opens, closes in rows:
+        calendar = calendars.get(service_id)
+        if calendar is None:
+            # slot_minutes is set once the provider publishes hours; an empty
+            # week after that means closed rather than the defaults
+            hours = list(DEFAULT_HOURS) if slot_minutes is None else []
+            calendar = calendars[service_id] = Calendar(
+                service_id, provider_id, price, service_zone(zone), slot_minutes or DEFAULT_SLOT_MINUTES, hours,
+            )
+        if weekday is not None:
+            calendar.hours.append((weekday, opens, closes))
+    return calendars
+
+
+def overlapping(service_id: int, start: datetime, end: datetime):
+    """Filter for bookings of `service_id` that overlap [start, end).
+
+    Bounded on both sides of start_at so it is a range scan on
+    ix_bookings_service_start; end_at is read from the same index entries.
+    """
+    return and_(
+        Booking.service_id == service_id,
+        Booking.start_at > start - MAX_BOOKING,
+        Booking.start_at < end,
+        Booking.end_at > start,
+    )
+
+
+def busy_intervals(db: Session, service_id: int, start: datetime, end: datetime) -> List[Interval]:
+    """Booked intervals of `service_id` overlapping [start, end), sorted by start."""
+    rows = db.execute(
+        select(Booking.start_at, Booking.end_at)
+        .where(overlapping(service_id, start, end))
+        .order_by(Booking.start_at)
+    )
+    return [(utc(booked_from), utc(booked_to)) for booked_from, booked_to in rows]
+
+
+def reserve(db: Session, values: dict) -> Optional[int]:
+    """Insert the booking `values` unless its interval is taken; the new id, or None.
+
+    `values` needs service_id, start_at and end_at. The caller commits.
+    """
+    taken = select(Booking.id).where(overlapping(values["service_id"], values["start_at"], values["end_at"]))
+    columns = list(values)
+    row = select(*[literal(values[c], Booking.__table__.c[c].type) for c in columns]).where(~taken.exists())
+    statement = insert(Booking).from_select(columns, row).returning(Booking.id)
+    if db.get_bind().dialect.name != "postgresql":
+        return db.scalar(statement)
+    try:
+        # Savepoint, so losing the race leaves the transaction usable for
+        # the next slot or the next row of a bulk request
+        with db.begin_nested():
+            return db.scalar(statement)
+    except IntegrityError as e:
+        code = getattr(e.orig, "pgcode", None) or getattr(e.orig, "sqlstate", None)
+        if code != EXCLUSION_VIOLATION:
+            raise
+        return None
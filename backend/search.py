@@ -0,0 +1,314 @@
+import json
+import math
+import os
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict
+from typing import Optional
+
+from sqlalchemy import Float, String, and_, bindparam, cast, func, literal_column, or_, select, tuple_
+from sqlalchemy.orm import Session
+
+try:
+    from .geo import EARTH_RADIUS_KM, bounding_box, covering_cells
+    from .models import Service
+except ImportError:
+    from geo import EARTH_RADIUS_KM, bounding_box, covering_cells
+    from models import Service
+
+# --- CONFIGURATION ---
+SEARCH_LANGUAGE = "english"
+# Ranked results the in-process index keeps between writes, one per query
+SEARCH_RESULTS_CACHED = int(os.getenv("SEARCH_RESULTS_CACHED", "64"))
+
+# First radius (km) a proximity lookup tries before widening
+INITIAL_REACH_KM = 0.5
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in is it of on or the to with".split()
+)
+
+
+def tokenize(value: str):
+    return [t for t in TOKEN_RE.findall((value or "").lower()) if t not in STOPWORDS]
+
+
+# --- POSTGRES: tsvector + GIN, pg_trgm ---
+# The generated `search_vector` column and the GIN indexes are created by
+# migration 0004. The column is not mapped on the model because its type only
+# exists on Postgres.
+def _postgres_search(query, q: str):
+    tokens = tokenize(q)
+    search_vector = literal_column("services.search_vector")
+    similarity = func.similarity(Service.title, q)
+    if tokens:
+        ts_query = func.to_tsquery(SEARCH_LANGUAGE, " & ".join(f"{t}:*" for t in tokens))
+        match = search_vector.op("@@")(ts_query) | Service.title.op("%")(q)
+        rank = func.ts_rank_cd(search_vector, ts_query) + similarity
+    else:
+        match = Service.title.op("%")(q)
+        rank = similarity
+    # Both functions return real. A float4 rank printed into a keyset cursor
+    # and read back as double never equals itself, so ties at a page boundary
+    # would be repeated or skipped; rank, key column and bound are all double.
+    return query.filter(match), cast(rank, Float(53))
+
+
+# --- SQLITE FALLBACK: in-process inverted index ---
+class Matches:
+    """Documents matching one search, best first: `ranked` is `[(score, doc_id), ...]`.
+
+    The order is descending on `(score, doc_id)`, the key relevance cursors hold.
+    """
+
+    def __init__(self, ranked):
+        self.ranked = ranked
+        self._keys = [(-score, -doc_id) for score, doc_id in ranked]
+
+    def __len__(self):
+        return len(self.ranked)
+
+    def after(self, bound) -> int:
+        """Position of the first match strictly after the cursor `bound`."""
+        return bisect_right(self._keys, (-bound[0], -bound[1]))
+
+
+class InvertedIndex:
+    """Inverted index over service title + description, ranked with BM25.
+
+    Every query term is matched as a prefix, so "plumb" finds "plumbing" the
+    same way the Postgres `:*` tsquery does. Title terms are counted twice to
+    mirror the 'A' weight on the Postgres side.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = defaultdict(dict)  # term -> {doc_id: term frequency}
+        self._doc_terms = {}  # doc_id -> {term: term frequency}
+        self._doc_lengths = {}
+        self._total_length = 0
+        self._vocabulary = None  # sorted term list, rebuilt lazily after writes
+        self._results = OrderedDict()  # query tokens -> Matches, cleared by writes
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def add(self, doc_id: int, title: str, description: str) -> None:
+        terms = defaultdict(int)
+        for token in tokenize(title):
+            terms[token] += 2
+        for token in tokenize(description):
+            terms[token] += 1
+        with self._lock:
+            self._remove(doc_id)
+            for term, tf in terms.items():
+                self._postings[term][doc_id] = tf
+            self._doc_terms[doc_id] = dict(terms)
+            self._doc_lengths[doc_id] = sum(terms.values())
+            self._total_length += self._doc_lengths[doc_id]
+            self._vocabulary = None
+            self._results.clear()
+
+    def remove(self, doc_id: int) -> None:
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: int) -> None:
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        self._vocabulary = None
+        self._results.clear()
+
+    def _expand(self, prefix: str):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        vocabulary = self._vocabulary
+        i = bisect_left(vocabulary, prefix)
+        while i < len(vocabulary) and vocabulary[i].startswith(prefix):
+            yield vocabulary[i]
+            i += 1
+
+    def search(self, q: str) -> Matches:
+        """Documents matching every term of `q`, best first.
+
+        Results are kept until the next write, so paging through a common
+        term scores and sorts its matches once rather than on every page.
+        """
+        tokens = tuple(sorted(set(tokenize(q))))
+        with self._lock:
+            matches = self._results.get(tokens)
+            if matches is None:
+                matches = Matches(self._score(tokens))
+                self._results[tokens] = matches
+                while len(self._results) > SEARCH_RESULTS_CACHED:
+                    self._results.popitem(last=False)
+            else:
+                self._results.move_to_end(tokens)
+            return matches
+
+    def _score(self, tokens):
+        if not tokens:
+            return []
+        n_docs = len(self._doc_terms)
+        if not n_docs:
+            return []
+        avg_length = self._total_length / n_docs
+        scores = None
+        # Evaluate the rarest term first so the running intersection stays small
+        expansions = sorted(
+            ([(term, self._postings[term]) for term in self._expand(token)] for token in tokens),
+            key=lambda e: sum(len(p) for _, p in e),
+        )
+        for expansion in expansions:
+            term_scores = {}
+            for _, postings in expansion:
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    if scores is not None and doc_id not in scores:
+                        continue
+                    length = self._doc_lengths[doc_id]
+                    norm = tf * (self.K1 + 1) / (
+                        tf + self.K1 * (1 - self.B + self.B * length / avg_length)
+                    )
+                    score = idf * norm
+                    if score > term_scores.get(doc_id, 0.0):
+                        term_scores[doc_id] = score
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {d: s + term_scores[d] for d, s in scores.items() if d in term_scores}
+            if not scores:
+                return []
+        return sorted(((s, d) for d, s in scores.items()), reverse=True)
+
+
+_index = InvertedIndex()
+_indexed_version = 0
+_index_lock = threading.Lock()
+# Bumped by triggers on every insert and title/description change (migration 0010)
+search_version = literal_column("services.search_version")
+
+
+def _sync_index(db: Session) -> InvertedIndex:
+    """Pull rows changed since the last sync, by any worker or outside the API.
+
+    One range scan of ix_services_search_version, so it is cheap when
+    nothing changed.
+    """
+    global _indexed_version
+    # Fetch outside the lock: under AsyncSession.run_sync the DB round trip
+    # yields to other requests running on the same thread.
+    rows = (
+        db.query(Service.id, Service.title, Service.description, search_version)
+        .filter(search_version > _indexed_version)
+        .order_by(search_version)
+        .all()
+    )
+    with _index_lock:
+        for service_id, title, description, version in rows:
+            if version > _indexed_version:
+                _index.add(service_id, title, description)
+                _indexed_version = version
+    return _index
+
+
+def index_service(service: Service) -> None:
+    """Show a committed insert or update to this worker's searches right away."""
+    _index.add(service.id, service.title, service.description)
+
+
+def apply_text_search(db: Session, query, q: str):
+    """Restrict a `Service` query to rows matching `q`.
+
+    Returns `(query, rank)`. On Postgres `rank` is a SQL expression to order
+    by; with the in-process index it is the `Matches`, and relevance pages
+    are cut from it with `pagination.paginate_ranked`. The query filters on
+    every match, sent as one JSON parameter that is only serialized if the
+    query runs, as it must for other sorts and for facets.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        return _postgres_search(query, q)
+
+    matches = _sync_index(db).search(q)
+    ids = bindparam(
+        "search_matches", type_=String, unique=True,
+        callable_=lambda: json.dumps([doc_id for _, doc_id in matches.ranked]),
+    )
+    matched = func.json_each(ids).table_valued("value")
+    return query.filter(Service.id.in_(select(matched.c.value))), matches
+
+
+# --- PROXIMITY ---
+def _within_box(db: Session, query, box):
+    min_lat, max_lat, min_lon, max_lon = box
+    if db.get_bind().dialect.name == "postgresql":
+        # GiST index on point(longitude, latitude), created by migration 0006
+        point = func.point(Service.longitude, Service.latitude)
+        return query.filter(point.op("<@")(func.box(func.point(min_lon, min_lat), func.point(max_lon, max_lat))))
+    # One range scan of the geohash index per covering cell
+    prefixes = or_(*(and_(Service.geohash >= cell, Service.geohash < cell + "~") for cell in covering_cells(box)))
+    return query.filter(
+        prefixes,
+        Service.latitude.between(min_lat, max_lat),
+        Service.longitude.between(min_lon, max_lon),
+    )
+
+
+def _sort_key(lat: float, lon: float):
+    scale = math.cos(math.radians(lat))
+    dx, dy = (Service.longitude - lon) * scale, Service.latitude - lat
+    return dx * dx + dy * dy
+
+
+def within_radius(db: Session, query, lat: float, lon: float, radius_km: float):
+    """Restrict a `Service` query to rows within `radius_km` of the point, as nearest_services measures it."""
+    query = _within_box(db, query, bounding_box(lat, lon, radius_km))
+    return query.filter(_sort_key(lat, lon) <= (radius_km / KM_PER_DEGREE) ** 2)
+
+
+def distance_km(sort_key: float) -> float:
+    """Distance for a `nearest_services` sort key."""
+    return math.sqrt(sort_key) * KM_PER_DEGREE
+
+
+def nearest_services(db: Session, query, lat: float, lon: float, radius_km: float, limit: int, after=None):
+    """Up to `limit` `(sort_key, service_id)` of rows of `query` within `radius_km`, nearest first.
+
+    Distances are measured on an equirectangular projection centred on the
+    point, which needs only arithmetic in SQL and is within 1% of the
+    great-circle distance up to ~100 km. `after` is the last pair of the
+    previous page. The lookup starts with a small box and widens it until
+    `limit` rows are known to be the nearest, so dense areas only read the
+    index entries around the point.
+    """
+    sort_key = _sort_key(lat, lon)
+    reach = min(INITIAL_REACH_KM, radius_km)
+    while True:
+        page = (
+            _within_box(db, query, bounding_box(lat, lon, reach))
+            .with_entities(sort_key.label("sort_key"), Service.id)
+            .filter(sort_key <= (reach / KM_PER_DEGREE) ** 2)
+        )
+        if after is not None:
+            page = page.filter(tuple_(sort_key, Service.id) > tuple_(*after))
+        found = [tuple(row) for row in page.order_by(sort_key, Service.id).limit(limit)]
+        # Nothing outside `reach` can be nearer, so a full page is final
+        if len(found) >= limit or reach >= radius_km:
+            return found
+        # Widen by the area the missing rows should need at the density seen so far
+        growth = min(4.0, max(1.5, 1.2 * math.sqrt(limit / len(found)))) if found else 2.0
+        reach = min(radius_km, reach * growth)
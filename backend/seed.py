@@ -0,0 +1,163 @@
+"""Synthetic data for benchmarks and local load tests.
+
+Rows are generated from a fixed random seed, so two runs at the same scale
+produce the same database and results can be compared across commits.
+"""
+import math
+import random
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+try:
+    from .geo import encode_geohash, geocode
+    from .hashing import get_password_hash
+except ImportError:
+    from geo import encode_geohash, geocode
+    from hashing import get_password_hash
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+CATEGORIES = ("Plumbing", "Electrical", "Cleaning", "Gardening", "Painting", "Moving", "Tutoring", "Pet Care")
+LOCATIONS = ("New York, NY", "Brooklyn, NY", "Jersey City, NJ", "Boston, MA", "Chicago, IL", "Austin, TX")
+STATUSES = ("Pending", "Confirmed", "Completed")
+# Bookings are spread over the two years from here, so availability lookups
+# in that range have something to subtract
+BOOKINGS_FROM = datetime(2027, 1, 1, tzinfo=timezone.utc)
+# Services are spread uniformly over a disc this wide around their city
+METRO_RADIUS_KM = 30.0
+# Every seeded account logs in with this password
+SEED_PASSWORD = "bench-password"
+
+
+def _models():
+    # Imported on first use: models binds DATABASE_URL at import time, and
+    # the benchmark CLI picks the database after parsing its arguments
+    try:
+        from . import models
+    except ImportError:
+        import models
+    return models
+
+
+def parse_scale(value: str) -> int:
+    """`10k`, `100k`, `1m` or a plain number of services."""
+    return SCALES.get(value.lower()) or int(value)
+
+
+def _scatter(rng: random.Random, location: str) -> dict:
+    """Coordinates and geohash of a random point in the metro area of `location`."""
+    lat, lon = geocode(location)
+    distance = METRO_RADIUS_KM * math.sqrt(rng.random())
+    bearing = rng.uniform(0, 2 * math.pi)
+    lat += distance * math.cos(bearing) / 111.32
+    lon += distance * math.sin(bearing) / (111.32 * math.cos(math.radians(lat)))
+    return {"latitude": lat, "longitude": lon, "geohash": encode_geohash(lat, lon)}
+
+
+def seed_catalog(rows: int, description: str = "Benchmark listing") -> None:
+    """Insert `rows` services for one new provider into DATABASE_URL."""
+    models = _models()
+    with models.SessionLocal() as db:
+        provider = models.User(name="Bench Provider", email=f"bench-{datetime.now().timestamp()}@bench.test",
+                               hashed_password="x", role="PROVIDER")
+        db.add(provider)
+        db.flush()
+        db.execute(
+            models.Service.__table__.insert(),
+            [
+                {"provider_id": provider.id, "title": f"Service {i}", "description": description,
+                 "category": CATEGORIES[i % 4], "location": "New York, NY", "price": 50.0 + i % 200,
+                 "image_url": "", "rating": (i % 50) / 10, "review_count": 0, "rating_sum": 0}
+                for i in range(rows)
+            ],
+        )
+        db.commit()
+
+
+def seed_dataset(bind, rows: int, batch: int = 20000, seed: int = 42) -> dict:
+    """Fill an empty schema with `rows` services, `rows` bookings and `rows` reviews.
+
+    There is one user per 20 services and every tenth user is a provider.
+    Only columns that exist at the current revision are written, so older
+    schemas can be seeded too. Rating aggregates and the provider counters are
+    rebuilt from the inserted rows at the end.
+
+    Returns ids of rows that are sure to exist, for use as request parameters.
+    """
+    models = _models()
+    rng = random.Random(seed)
+    users = max(rows // 20, 10)
+    providers = max(users // 10, 1)
+    started = datetime(2024, 1, 1)
+    inspector = inspect(bind)
+    tables = set(inspector.get_table_names())
+    password = get_password_hash(SEED_PASSWORD)
+
+    def insert(table, count, make):
+        columns = {c["name"] for c in inspector.get_columns(table.name)}
+        with bind.begin() as conn:
+            for offset in range(0, count, batch):
+                chunk = [make(i) for i in range(offset, min(offset + batch, count))]
+                if not columns.issuperset(chunk[0]):
+                    chunk = [{k: v for k, v in row.items() if k in columns} for row in chunk]
+                conn.execute(table.insert(), chunk)
+
+    insert(models.User.__table__, users, lambda i: {
+        "id": i + 1, "name": f"User {i}", "email": f"user{i}@bench.test", "hashed_password": password,
+        "role": "PROVIDER" if i % 10 == 0 else "USER",
+    })
+    prices = [round(rng.uniform(20, 500), 2) for _ in range(rows)]
+    insert(models.Service.__table__, rows, lambda i: {
+        "id": i + 1, "provider_id": (i % providers) * 10 + 1, "title": f"Service {i}",
+        "description": f"{CATEGORIES[i % len(CATEGORIES)]} service number {i}. " * 4,
+        "category": CATEGORIES[i % len(CATEGORIES)], "location": LOCATIONS[i % len(LOCATIONS)],
+        "price": prices[i], "image_url": "", "rating": 0.0, "review_count": 0, "rating_sum": 0,
+        **_scatter(rng, LOCATIONS[i % len(LOCATIONS)]),
+    })
+
+    # One-hour slots between 09:00 and 17:00 UTC, never two on one service at once
+    taken = set()
+
+    def booking(i):
+        while True:
+            service_id = rng.randint(1, rows)
+            start = BOOKINGS_FROM + timedelta(days=rng.randint(0, 730), hours=rng.randint(9, 16))
+            if (service_id, start) not in taken:
+                taken.add((service_id, start))
+                break
+        return {
+            "id": i + 1, "service_id": service_id, "user_id": rng.randint(1, users),
+            "booking_date": start.strftime("%Y-%m-%d"), "start_at": start, "end_at": start + timedelta(hours=1),
+            "status": rng.choice(STATUSES), "price": prices[service_id - 1],
+        }
+
+    insert(models.Booking.__table__, rows, booking)
+    insert(models.Review.__table__, rows, lambda i: {
+        "id": i + 1, "service_id": rng.randint(1, rows), "user_id": rng.randint(1, users),
+        "rating": rng.randint(1, 5), "comment": "Fine",
+        "created_at": started + timedelta(minutes=rng.randint(0, 500000)),
+    })
+
+    with Session(bind) as db:
+        if "rating_sum" in {c["name"] for c in inspector.get_columns("services")}:
+            models.repair_rating_aggregates(db)
+        if "provider_stats" in tables:
+            models.repair_provider_stats(db)
+        db.commit()
+    if bind.dialect.name == "postgresql":
+        # Explicit ids leave the sequences behind; new rows must not collide
+        with bind.begin() as conn:
+            for table in ("users", "services", "bookings", "reviews"):
+                conn.exec_driver_sql(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))"
+                )
+    return {
+        "category": CATEGORIES[1],
+        "provider_id": 1,
+        "user_id": 2,
+        "service_id": rows // 2,
+        "booking_id": rows // 2,
+        "users": users,
+        "services": rows,
+    }
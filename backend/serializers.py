@@ -0,0 +1,229 @@
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from sqlalchemy import func, literal
+from sqlalchemy.orm import Session
+from starlette.responses import Response
+
+try:
+    from .models import Booking, BookingView, Review, Service, User
+except ImportError:
+    from models import Booking, BookingView, Review, Service, User
+
+# --- CONFIGURATION ---
+# Characters of the description sent in list views; 0 sends none. The full
+# text is only read for /services/{id}.
+LISTING_DESCRIPTION_CHARS = int(os.getenv("LISTING_DESCRIPTION_CHARS", "200"))
+
+# --- JSON ENCODING ---
+# orjson, then msgspec, then the stdlib. All three emit compact UTF-8 JSON.
+try:
+    import orjson
+
+    JSON_ENCODER = "orjson"
+
+    def dumps(content: Any) -> bytes:
+        return orjson.dumps(content)
+except ImportError:
+    try:
+        import msgspec
+
+        JSON_ENCODER = "msgspec"
+        dumps = msgspec.json.Encoder().encode
+    except ImportError:
+        JSON_ENCODER = "json"
+
+        def dumps(content: Any) -> bytes:
+            return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(Response):
+    """JSONResponse rendered with `dumps`.
+
+    Returning one directly from a handler also skips FastAPI's
+    jsonable_encoder pass, so the payload must already be plain JSON types.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# --- SERVICES ---
+# Shape of a service in every response. NULLs are replaced in SQL, so a row
+# maps onto these keys as-is.
+SERVICE_FIELDS = (
+    "id",
+    "provider_id",
+    "provider_name",
+    "title",
+    "description",
+    "category",
+    "location",
+    "price",
+    "image_url",
+    "rating",
+    "review_count",
+)
+
+
+def service_columns(listing: bool = False):
+    """Columns for SERVICE_FIELDS.
+
+    `listing` selects the list-view shape: the thumbnail instead of the full
+    image and a description snippet instead of the whole text.
+    """
+    if listing:
+        image = func.coalesce(Service.thumbnail_url, Service.image_url, "")
+        if LISTING_DESCRIPTION_CHARS > 0:
+            description = func.coalesce(func.substr(Service.description, 1, LISTING_DESCRIPTION_CHARS), "")
+        else:
+            description = literal("")
+    else:
+        image = func.coalesce(Service.image_url, "")
+        description = func.coalesce(Service.description, "")
+    return [
+        Service.id.label("id"),
+        Service.provider_id.label("provider_id"),
+        func.coalesce(User.name, "Unknown").label("provider_name"),
+        func.coalesce(Service.title, "").label("title"),
+        description.label("description"),
+        func.coalesce(Service.category, "").label("category"),
+        func.coalesce(Service.location, "").label("location"),
+        func.coalesce(Service.price, 0.0).label("price"),
+        image.label("image_url"),
+        func.coalesce(Service.rating, 0.0).label("rating"),
+        func.coalesce(Service.review_count, 0).label("review_count"),
+    ]
+
+
+def service_rows(db: Session, listing: bool = False):
+    """Query of plain service rows with the provider name joined in."""
+    return (
+        db.query(*service_columns(listing))
+        .select_from(Service)
+        .outerjoin(User, User.id == Service.provider_id)
+    )
+
+
+def serialize_service(row) -> dict:
+    # Extra trailing columns (e.g. a search rank) are ignored
+    return dict(zip(SERVICE_FIELDS, row))
+
+
+def serialize_services(rows) -> list:
+    return [dict(zip(SERVICE_FIELDS, row)) for row in rows]
+
+
+# --- BOOKINGS ---
+BOOKING_FIELDS = (
+    "id",
+    "service_id",
+    "user_id",
+    "service_title",
+    "service_image",
+    "status",
+    "booking_date",
+    "start_at",
+    "end_at",
+    "price",
+    "user_name",
+    "user_email",
+    "user_avatar",
+)
+
+
+def booking_rows(db: Session):
+    """Query of plain booking rows with the service and customer joined in."""
+    return (
+        db.query(
+            Booking.id.label("id"),
+            Booking.service_id.label("service_id"),
+            Booking.user_id.label("user_id"),
+            func.coalesce(Service.title, "Unknown Service").label("service_title"),
+            func.coalesce(Service.image_url, "").label("service_image"),
+            func.coalesce(Booking.status, "Pending").label("status"),
+            func.coalesce(Booking.booking_date, "").label("booking_date"),
+            Booking.start_at.label("start_at"),
+            Booking.end_at.label("end_at"),
+            func.coalesce(Service.price, 0.0).label("price"),
+            func.coalesce(User.name, "Unknown User").label("user_name"),
+            func.coalesce(User.email, "").label("user_email"),
+            func.coalesce(User.avatar_url, "").label("user_avatar"),
+        )
+        .select_from(Booking)
+        .outerjoin(Service, Service.id == Booking.service_id)
+        .outerjoin(User, User.id == Booking.user_id)
+    )
+
+
+def booking_view_rows(db: Session):
+    """The columns of booking_rows, read from the booking_views table alone."""
+    return db.query(
+        BookingView.booking_id.label("id"),
+        BookingView.service_id.label("service_id"),
+        BookingView.user_id.label("user_id"),
+        func.coalesce(BookingView.service_title, "Unknown Service").label("service_title"),
+        func.coalesce(BookingView.service_image, "").label("service_image"),
+        func.coalesce(BookingView.status, "Pending").label("status"),
+        func.coalesce(BookingView.booking_date, "").label("booking_date"),
+        BookingView.start_at.label("start_at"),
+        BookingView.end_at.label("end_at"),
+        func.coalesce(BookingView.price, 0.0).label("price"),
+        func.coalesce(BookingView.user_name, "Unknown User").label("user_name"),
+        func.coalesce(BookingView.user_email, "").label("user_email"),
+        func.coalesce(BookingView.user_avatar, "").label("user_avatar"),
+    )
+
+
+def _utc_text(value: Optional[datetime]) -> Optional[str]:
+    # SQLite hands back naive datetimes; every stored interval is UTC
+    if value is None:
+        return None
+    return (value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)).isoformat()
+
+
+def serialize_booking(row) -> dict:
+    booking = dict(zip(BOOKING_FIELDS, row))
+    booking["start_at"] = _utc_text(booking["start_at"])
+    booking["end_at"] = _utc_text(booking["end_at"])
+    return booking
+
+
+def serialize_bookings(rows) -> list:
+    return [serialize_booking(row) for row in rows]
+
+
+# --- REVIEWS ---
+REVIEW_FIELDS = ("id", "service_id", "user_id", "user_name", "rating", "comment", "created_at")
+
+
+def review_rows(db: Session):
+    """Query of plain review rows with the author's name joined in."""
+    return (
+        db.query(
+            Review.id.label("id"),
+            Review.service_id.label("service_id"),
+            Review.user_id.label("user_id"),
+            func.coalesce(User.name, "Anonymous").label("user_name"),
+            func.coalesce(Review.rating, 0).label("rating"),
+            func.coalesce(Review.comment, "").label("comment"),
+            Review.created_at.label("created_at"),
+        )
+        .select_from(Review)
+        .outerjoin(User, User.id == Review.user_id)
+    )
+
+
+def serialize_reviews(rows) -> list:
+    results = []
+    for row in rows:
+        review = dict(zip(REVIEW_FIELDS, row))
+        # Rendered as text here so every JSON encoder produces the same string
+        created_at = review["created_at"] or datetime.now(timezone.utc)
+        review["created_at"] = created_at.isoformat()
+        results.append(review)
+    return results
@@ -0,0 +1,109 @@
+"""Production launcher: migrate once, then serve with one uvicorn worker per core.
+
+Usage: python -m backend.serve [--workers N] [--host HOST] [--port PORT]
+
+The schema is upgraded here, in the parent, so workers never race each
+other on it; they start with DB_AUTO_MIGRATE off. Each worker is a fresh
+process that builds the app and opens its own pools in the lifespan hook,
+answers /health/live straight away and /health/ready once its caches are
+warm. On SIGTERM a worker stops accepting connections, gives in-flight
+requests up to --graceful-timeout seconds, then closes its pools.
+
+More than one worker needs CACHE_URL (and REVOCATION_URL, which defaults to
+it) on a shared Redis server. The in-process backends are per worker: an
+invalidation or a logout in one would never reach the others. Without one
+the launcher defaults to a single worker and refuses --workers above 1.
+
+Each worker has its own bcrypt and Pillow process pools. The launcher
+splits the cores between workers (HASH_WORKERS defaults to cores // workers,
+IMAGE_WORKERS to that but at most 2, both at least 1) instead of letting
+every worker size its pools for the whole machine.
+
+Behind gunicorn the same app runs with:
+    gunicorn -k uvicorn.workers.UvicornWorker -w "$(nproc)" "backend.main:create_app()"
+(with DB_AUTO_MIGRATE=0 once `python -m backend.manage migrate` has run, and
+HASH_WORKERS=1 IMAGE_WORKERS=1 for one worker per core).
+"""
+import argparse
+import os
+import sys
+
+import uvicorn
+
+try:
+    from .auth import REVOCATION_URL
+    from .cache import CACHE_URL, is_shared
+    from .migrate import upgrade_database
+    from .models import engine
+except ImportError:
+    from auth import REVOCATION_URL
+    from cache import CACHE_URL, is_shared
+    from migrate import upgrade_database
+    from models import engine
+
+# --- CONFIGURATION ---
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+# Seconds a stopping worker waits for in-flight requests
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+
+APP = f"{__package__}.main:app" if __package__ else "main:app"
+
+
+def shared_state() -> bool:
+    """Whether the response cache and the revocation list are seen by every worker."""
+    return is_shared(CACHE_URL) and is_shared(REVOCATION_URL)
+
+
+def usable_cores() -> int:
+    try:
+        # Respects CPU affinity and cpusets, unlike os.cpu_count()
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_workers() -> int:
+    """WEB_CONCURRENCY, or the number of cores this process may run on (1 without shared state)."""
+    if not shared_state():
+        return 1
+    if os.getenv("WEB_CONCURRENCY"):
+        return int(os.environ["WEB_CONCURRENCY"])
+    return usable_cores()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--graceful-timeout", type=int, default=GRACEFUL_TIMEOUT)
+    parser.add_argument("--no-migrate", action="store_true", help="Leave the schema as it is")
+    args = parser.parse_args(argv)
+    if args.workers > 1 and not shared_state():
+        parser.error("--workers above 1 needs CACHE_URL and REVOCATION_URL on a shared redis:// server")
+
+    if not args.no_migrate:
+        upgrade_database()
+    # Workers inherit the environment: nothing left for them to migrate, and
+    # the parent's connections are not theirs to use
+    os.environ["DB_AUTO_MIGRATE"] = "0"
+    engine.dispose()
+    # Per-worker process pools share the cores rather than each taking them all
+    share = max(1, usable_cores() // args.workers)
+    os.environ.setdefault("HASH_WORKERS", str(share))
+    os.environ.setdefault("IMAGE_WORKERS", str(min(share, 2)))
+
+    uvicorn.run(
+        APP,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        proxy_headers=True,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
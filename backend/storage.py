@@ -0,0 +1,128 @@
+import mimetypes
+import os
+import shutil
+from abc import ABC, abstractmethod
+from typing import Optional
+
+# --- CONFIGURATION ---
+# "local" keeps media on disk and serves it from /uploads; "s3" pushes it to
+# any S3-compatible store (AWS, MinIO, ...)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+MEDIA_BASE_URL = os.getenv("MEDIA_BASE_URL", "http://localhost:8000/uploads")
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_PREFIX = os.getenv("S3_PREFIX", "uploads/")
+
+# Media names are content hashes, so a name always refers to the same bytes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class StorageBackend(ABC):
+    """Where finished media files live and the URL clients fetch them from."""
+
+    @abstractmethod
+    def exists(self, name: str) -> bool:
+        ...
+
+    @abstractmethod
+    def save(self, name: str, source_path: str) -> None:
+        """Take ownership of the local file at `source_path` as `name`."""
+
+    @abstractmethod
+    def fetch(self, name: str, target_path: str) -> None:
+        """Copy the stored `name` to the local file `target_path`."""
+
+    @abstractmethod
+    def url(self, name: str) -> str:
+        ...
+
+    def local_path(self, name: str) -> Optional[str]:
+        """Filesystem path for serving `name` ourselves; None for remote stores."""
+        return None
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, directory: str = UPLOAD_DIR, base_url: str = MEDIA_BASE_URL):
+        self.directory = directory
+        self.base_url = base_url.rstrip("/")
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.directory, name))
+
+    def save(self, name, source_path):
+        target = os.path.join(self.directory, name)
+        if os.path.exists(target):
+            os.remove(source_path)
+        else:
+            os.replace(source_path, target)
+
+    def fetch(self, name, target_path):
+        shutil.copyfile(os.path.join(self.directory, name), target_path)
+
+    def url(self, name):
+        return f"{self.base_url}/{name}"
+
+    def local_path(self, name):
+        return os.path.join(self.directory, name)
+
+
+class S3Storage(StorageBackend):
+    """S3-compatible object store. Point S3_ENDPOINT_URL at MinIO to run locally."""
+
+    def __init__(
+        self,
+        bucket: str = S3_BUCKET,
+        endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+        prefix: str = S3_PREFIX,
+        base_url: Optional[str] = None,
+    ):
+        try:
+            import boto3
+        except ImportError:
+            raise ImportError("STORAGE_BACKEND=s3 requires the 'boto3' package")
+        self._client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix
+        if base_url is None:
+            base_url = f"{endpoint_url or 'https://s3.amazonaws.com'}/{bucket}/{prefix}"
+        self.base_url = base_url.rstrip("/")
+
+    def exists(self, name):
+        from botocore.exceptions import ClientError
+
+        try:
+            self._client.head_object(Bucket=self.bucket, Key=self.prefix + name)
+            return True
+        except ClientError:
+            return False
+
+    def save(self, name, source_path):
+        try:
+            if not self.exists(name):
+                self._client.upload_file(
+                    source_path,
+                    self.bucket,
+                    self.prefix + name,
+                    ExtraArgs={
+                        "ContentType": mimetypes.guess_type(name)[0] or "application/octet-stream",
+                        "CacheControl": IMMUTABLE_CACHE_CONTROL,
+                    },
+                )
+        finally:
+            os.remove(source_path)
+
+    def fetch(self, name, target_path):
+        self._client.download_file(self.bucket, self.prefix + name, target_path)
+
+    def url(self, name):
+        return f"{self.base_url}/{name}"
+
+
+def create_storage(backend: str = STORAGE_BACKEND) -> StorageBackend:
+    if backend == "s3":
+        return S3Storage(base_url=os.getenv("S3_PUBLIC_BASE_URL"))
+    return LocalStorage()
+
+
+storage = create_storage()
@@ -0,0 +1,214 @@
+import hashlib
+import os
+import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import anyio
+from fastapi import HTTPException, UploadFile
+from starlette.responses import JSONResponse
+
+try:
+    from .storage import UPLOAD_DIR, storage
+except ImportError:
+    from storage import UPLOAD_DIR, storage
+
+# --- CONFIGURATION ---
+# Uploads are assembled here before being handed to the storage backend
+STAGING_DIR = os.path.join(UPLOAD_DIR, ".staging")
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(5 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+# Longest edge of the listing thumbnail
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "480"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+    print("Warning: 'Pillow' package not available. Uploads are stored without thumbnails.")
+
+# Magic numbers for the formats we accept. The client-supplied filename and
+# Content-Type are ignored.
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+]
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+class StoredImage:
+    def __init__(self, file_name: str, thumbnail_name: Optional[str] = None):
+        self.file_name = file_name
+        self.thumbnail_name = thumbnail_name
+
+    @property
+    def url(self) -> str:
+        return storage.url(self.file_name)
+
+    @property
+    def thumbnail_url(self) -> Optional[str]:
+        return storage.url(self.thumbnail_name) if self.thumbnail_name else None
+
+    @property
+    def variants_pending(self) -> bool:
+        return Image is not None and self.thumbnail_name is None
+
+
+def thumbnail_name(file_name: str) -> str:
+    return f"{file_name.rpartition('.')[0]}_thumb.webp"
+
+
+async def save_upload(upload: UploadFile) -> StoredImage:
+    """Stream `upload` to storage under a content-hash name.
+
+    Raises HTTP 413 as soon as the stream passes MAX_UPLOAD_BYTES and 415 if
+    the first bytes are not a supported image. Identical uploads share one
+    file. Variants are left to create_variants, run as a job after the
+    write commits; `variants_pending` says whether one is needed.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    extension = None
+    staging = os.path.join(STAGING_DIR, uuid.uuid4().hex)
+    os.makedirs(staging)
+    try:
+        partial_path = os.path.join(staging, "upload.part")
+        async with await anyio.open_file(partial_path, "wb") as out:
+            while chunk := await upload.read(CHUNK_SIZE):
+                if extension is None:
+                    extension = sniff_image_type(chunk)
+                    if extension is None:
+                        raise HTTPException(status_code=415, detail="Unsupported image type")
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail="Image is too large")
+                digest.update(chunk)
+                await out.write(chunk)
+        if extension is None:
+            raise HTTPException(status_code=400, detail="Empty image upload")
+
+        stem = digest.hexdigest()
+        stored = StoredImage(f"{stem}.{extension}")
+
+        def store():
+            if not storage.exists(stored.file_name):
+                storage.save(stored.file_name, partial_path)
+            # Seen before: the variants may already be there
+            if Image is not None and storage.exists(thumbnail_name(stored.file_name)):
+                stored.thumbnail_name = thumbnail_name(stored.file_name)
+
+        await anyio.to_thread.run_sync(store)
+        return stored
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+# --- VARIANTS ---
+def _make_variants(directory: str, stem: str, extension: str):
+    """Write a WebP copy and a WebP thumbnail next to the source; returns their names."""
+    source = os.path.join(directory, f"{stem}.{extension}")
+    thumbnail = thumbnail_name(f"{stem}.{extension}")
+    webp_name = f"{stem}.webp"
+    created = []
+
+    with Image.open(source) as image:
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        if extension != "webp":
+            image.save(os.path.join(directory, webp_name), "WEBP", quality=85)
+            created.append(webp_name)
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        image.save(os.path.join(directory, thumbnail), "WEBP", quality=80)
+        created.append(thumbnail)
+    return created
+
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None and IMAGE_WORKERS > 0:
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _executor
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def create_variants(file_name: str) -> Optional[str]:
+    """Generate and store the variants of the stored image `file_name`.
+
+    Returns the thumbnail's name, or None when there is nothing to make one
+    from. Blocking; job workers call it from a thread, and the decoding
+    runs in the image process pool.
+    """
+    if Image is None:
+        return None
+    stem, _, extension = file_name.rpartition(".")
+    staging = os.path.join(STAGING_DIR, uuid.uuid4().hex)
+    os.makedirs(staging)
+    try:
+        storage.fetch(file_name, os.path.join(staging, file_name))
+        try:
+            executor = _get_executor()
+            if executor is not None:
+                variants = executor.submit(_make_variants, staging, stem, extension).result()
+            else:
+                variants = _make_variants(staging, stem, extension)
+        except Exception as e:
+            # A corrupt image stays stored, it is just served without
+            # variants; retrying would fail the same way
+            print(f"Thumbnail generation failed for {file_name}: {e}")
+            return None
+        for name in variants:
+            storage.save(name, os.path.join(staging, name))
+        return thumbnail_name(file_name) if thumbnail_name(file_name) in variants else None
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+# --- REQUEST SIZE GUARD ---
+class UploadLimitMiddleware:
+    """Reject multipart bodies whose declared size exceeds the upload cap.
+
+    Form parsing happens before the endpoint runs, so without this an
+    oversized upload would be read to the end before save_upload could object.
+    """
+
+    # Allowance for the text fields and multipart framing around the image
+    FORM_OVERHEAD = 64 * 1024
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            headers = dict(scope["headers"])
+            content_type = headers.get(b"content-type", b"")
+            content_length = headers.get(b"content-length")
+            if (
+                content_type.startswith(b"multipart/form-data")
+                and content_length
+                and content_length.isdigit()
+                and int(content_length) > MAX_UPLOAD_BYTES + self.FORM_OVERHEAD
+            ):
+                response = JSONResponse(status_code=413, content={"detail": "Image is too large"})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -4,6 +4,9 @@ import { Service, User, UserRole, LoginResponse, Booking, Review } from '../type
 const USE_MOCK_API = false; // Always use backend - no mock data
 const API_URL = 'http://localhost:8000';
 const BACKEND_TIMEOUT = 10000; // 10 seconds timeout
+// Send the backend's cookies: after a write it sets one that keeps this
+// browser reading from the primary database until its writes have replicated
+const CREDENTIALS: RequestCredentials = 'include';
 
 // Backend health check
 const checkBackendHealth = async (): Promise<boolean> => {
@@ -13,7 +16,8 @@ const checkBackendHealth = async (): Promise<boolean> => {
     
     const response = await fetch(`${API_URL}/health`, {
       method: 'GET',
-      signal: controller.signal
+      signal: controller.signal,
+      credentials: CREDENTIALS
     });
     
     clearTimeout(timeoutId);
@@ -40,6 +44,41 @@ const handleBackendError = (error: any): never => {
   throw error;
 };
 
+// List endpoints answer one page at a time and put the cursor of the next
+// page in X-Next-Cursor; follow it until the last page
+const PAGE_SIZE = 200;
+
+const fetchAllPages = async (url: string, errorMessage: string): Promise<any[]> => {
+  const items: any[] = [];
+  let cursor: string | null = null;
+  do {
+    const pageUrl = new URL(url);
+    pageUrl.searchParams.set('limit', String(PAGE_SIZE));
+    if (cursor) pageUrl.searchParams.set('cursor', cursor);
+
+    const controller = new AbortController();
+    const timeoutId = setTimeout(() => controller.abort(), BACKEND_TIMEOUT);
+
+    const res = await fetch(pageUrl.toString(), {
+      signal: controller.signal,
+      credentials: CREDENTIALS
+    });
+
+    clearTimeout(timeoutId);
+
+    if (!res.ok) {
+      const errorData = await res.json().catch(() => ({ detail: errorMessage }));
+      const error: any = new Error(errorData.detail || errorMessage);
+      error.status = res.status;
+      throw error;
+    }
+
+    items.push(...(await res.json()));
+    cursor = res.headers.get('X-Next-Cursor');
+  } while (cursor);
+  return items;
+};
+
 // Initial Mock Data
 let mockUsers: User[] = [
   { id: '1', name: 'John Doe', email: 'user@test.com', role: UserRole.USER, avatarUrl: 'https://ui-avatars.com/api/?name=John+Doe' },
@@ -171,21 +210,7 @@ export const api = {
       if (category && category !== 'All') params.append('category', category);
       if (location) params.append('location', location);
 
-      const controller = new AbortController();
-      const timeoutId = setTimeout(() => controller.abort(), BACKEND_TIMEOUT);
-
-      const res = await fetch(`${API_URL}/services?${params.toString()}`, {
-        signal: controller.signal
-      });
-      
-      clearTimeout(timeoutId);
-      
-      if (!res.ok) {
-        const errorData = await res.json().catch(() => ({ detail: 'Failed to fetch services' }));
-        throw new Error(errorData.detail || 'Failed to fetch services');
-      }
-      
-      const data = await res.json();
+      const data = await fetchAllPages(`${API_URL}/services?${params.toString()}`, 'Failed to fetch services');
       return data.map(mapService);
     } catch (error) {
       handleBackendError(error);
@@ -199,7 +224,8 @@ export const api = {
       const timeoutId = setTimeout(() => controller.abort(), BACKEND_TIMEOUT);
 
       const res = await fetch(`${API_URL}/services/${id}`, {
-        signal: controller.signal
+        signal: controller.signal,
+        credentials: CREDENTIALS
       });
       
       clearTimeout(timeoutId);
@@ -220,21 +246,7 @@ export const api = {
 
   getProviderServices: async (providerId: string): Promise<Service[]> => {
     try {
-      const controller = new AbortController();
-      const timeoutId = setTimeout(() => controller.abort(), BACKEND_TIMEOUT);
-
-      const res = await fetch(`${API_URL}/services/provider/${providerId}`, {
-        signal: controller.signal
-      });
-      
-      clearTimeout(timeoutId);
-      
-      if (!res.ok) {
-        const errorData = await res.json().catch(() => ({ detail: 'Failed to fetch provider services' }));
-        throw new Error(errorData.detail || 'Failed to fetch provider services');
-      }
-      
-      const data = await res.json();
+      const data = await fetchAllPages(`${API_URL}/services/provider/${providerId}`, 'Failed to fetch provider services');
       return data.map(mapService);
     } catch (error) {
       handleBackendError(error);
@@ -262,7 +274,8 @@ export const api = {
       const res = await fetch(`${API_URL}/services`, {
         method: 'POST',
         body: formData,
-        signal: controller.signal
+        signal: controller.signal,
+        credentials: CREDENTIALS
       });
 
       clearTimeout(timeoutId);
@@ -299,7 +312,8 @@ export const api = {
       const res = await fetch(`${API_URL}/services/${id}`, {
         method: 'PUT',
         body: formData,
-        signal: controller.signal
+        signal: controller.signal,
+        credentials: CREDENTIALS
       });
 
       clearTimeout(timeoutId);
@@ -327,7 +341,8 @@ export const api = {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ service_id: serviceId, user_id: userId, booking_date: date }),
-        signal: controller.signal
+        signal: controller.signal,
+        credentials: CREDENTIALS
       });
       
       clearTimeout(timeoutId);
@@ -344,21 +359,7 @@ export const api = {
 
   getUserBookings: async (userId: string): Promise<Booking[]> => {
     try {
-      const controller = new AbortController();
-      const timeoutId = setTimeout(() => controller.abort(), BACKEND_TIMEOUT);
-
-      const res = await fetch(`${API_URL}/bookings/user/${userId}`, {
-        signal: controller.signal
-      });
-      
-      clearTimeout(timeoutId);
-      
-      if (!res.ok) {
-        const errorData = await res.json().catch(() => ({ detail: 'Failed to fetch bookings' }));
-        throw new Error(errorData.detail || 'Failed to fetch bookings');
-      }
-      
-      const data = await res.json();
+      const data = await fetchAllPages(`${API_URL}/bookings/user/${userId}`, 'Failed to fetch bookings');
       return data.map(mapBooking);
     } catch (error) {
       handleBackendError(error);
@@ -368,21 +369,7 @@ export const api = {
 
   getProviderBookings: async (providerId: string): Promise<Booking[]> => {
     try {
-      const controller = new AbortController();
-      const timeoutId = setTimeout(() => controller.abort(), BACKEND_TIMEOUT);
-
-      const res = await fetch(`${API_URL}/bookings/provider/${providerId}`, {
-        signal: controller.signal
-      });
-      
-      clearTimeout(timeoutId);
-
-      if (!res.ok) {
-        const errorData = await res.json().catch(() => ({ detail: 'Failed to fetch provider bookings' }));
-        throw new Error(errorData.detail || 'Failed to fetch provider bookings');
-      }
-
-      const data = await res.json();
+      const data = await fetchAllPages(`${API_URL}/bookings/provider/${providerId}`, 'Failed to fetch provider bookings');
       return data.map(mapBooking);
     } catch (error) {
       handleBackendError(error);
@@ -399,7 +386,8 @@ export const api = {
         method: 'PUT',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ status }),
-        signal: controller.signal
+        signal: controller.signal,
+        credentials: CREDENTIALS
       });
 
       clearTimeout(timeoutId);
@@ -427,7 +415,8 @@ export const api = {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ service_id: serviceId, user_id: userId, rating, comment }),
-        signal: controller.signal
+        signal: controller.signal,
+        credentials: CREDENTIALS
       });
       
       clearTimeout(timeoutId);
@@ -444,25 +433,11 @@ export const api = {
 
   getServiceReviews: async (serviceId: string): Promise<Review[]> => {
     try {
-      const controller = new AbortController();
-      const timeoutId = setTimeout(() => controller.abort(), BACKEND_TIMEOUT);
-
-      const res = await fetch(`${API_URL}/reviews/service/${serviceId}`, {
-        signal: controller.signal
-      });
-      
-      clearTimeout(timeoutId);
-      
-      if (!res.ok) {
-        // Return empty array for 404, but throw for other errors
-        if (res.status === 404) return [];
-        const errorData = await res.json().catch(() => ({ detail: 'Failed to fetch reviews' }));
-        throw new Error(errorData.detail || 'Failed to fetch reviews');
-      }
-      
-      const data = await res.json();
+      const data = await fetchAllPages(`${API_URL}/reviews/service/${serviceId}`, 'Failed to fetch reviews');
       return data.map(mapReview);
     } catch (error) {
+      // Return empty array for 404, but throw for other errors
+      if ((error as any).status === 404) return [];
       // Return empty array on connection errors for reviews (non-critical)
       if (error instanceof Error && error.message.includes('Backend server')) {
         console.warn('Backend unavailable, returning empty reviews');
@@ -483,7 +458,8 @@ export const api = {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ email, password, user_type: userType }),
-        signal: controller.signal
+        signal: controller.signal,
+        credentials: CREDENTIALS
       });
 
       clearTimeout(timeoutId);
@@ -515,7 +491,8 @@ export const api = {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ name, email, password, role }),
-        signal: controller.signal
+        signal: controller.signal,
+        credentials: CREDENTIALS
       });
 
       clearTimeout(timeoutId);